@@ -1,14 +1,33 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
+import asyncio
+import contextlib
+import json
+import os
 import uuid
 
 from backend.deps import init_genai
-from backend.research import perform_research
-from backend.qa import get_clarification_questions, analyze_preferences
-from backend.report import generate_report, modify_report
-from backend.indexing import index_documents
+from backend.ratelimit import get_governor
+from backend.routing import router
+from backend.research import order_documents, stream_research
+from backend.qa import get_clarification_questions, analyze_preferences, default_answers
+from backend.report import generate_report, modify_report, prefetch_key, prefetch_report
+from backend.indexing import index_stream, link_session_index
+from backend.singleflight import SingleFlight
+from backend.prewarm import create_prewarmer, normalize_topic, research_key
+from backend.jobs import JobCancelled, JobManager, PRIORITIES
+from backend.export import FORMATS, export_report
+from backend.store import create_stores
+from backend.batch import BatchEntry, results_path, run_batch
+from backend.profiling import ProfilingMiddleware, list_profiles, profile_path
+from backend.webfetch import page_fetcher
+from backend.papers import paper_fetcher
+from backend.speculate import create_prefetcher
+from langchain_chains.qa_chain import QAChain
 
 # Define request/response models
 class SessionRequest(BaseModel):
@@ -29,8 +48,38 @@ class FeedbackRequest(BaseModel):
     session_id: str
     feedback: Dict
 
+class AskRequest(BaseModel):
+    session_id: str
+    questions: List[str]
+    stream: bool = False
+
+class BatchRequest(BaseModel):
+    entries: List[BatchEntry]
+
+try:
+    # orjson serializes large responses several times faster than the stdlib
+    import orjson  # noqa: F401
+    from fastapi.responses import ORJSONResponse as DefaultResponse
+except ImportError:
+    DefaultResponse = JSONResponse
+
+# Characters of document text returned in research previews
+PREVIEW_CHARS = 300
+
+# Most questions accepted in one /ask call
+MAX_QUESTIONS = int(os.getenv("ASK_MAX_QUESTIONS", "10"))
+# Answers kept per session, least recently asked dropped first
+MAX_CACHED_ANSWERS = int(os.getenv("ASK_MAX_CACHED_ANSWERS", "100"))
+
+# Most entries accepted in one /batch call
+MAX_BATCH_ENTRIES = int(os.getenv("BATCH_MAX_ENTRIES", "500"))
+
 # Initialize FastAPI
-app = FastAPI()
+app = FastAPI(default_response_class=DefaultResponse)
+
+# Sampling profiles of requests sent with "X-Profile: 1" (or PROFILE_SAMPLE_RATE of all);
+# added first so it sees uncompressed responses
+app.add_middleware(ProfilingMiddleware)
 
 # CORS for Streamlit frontend
 app.add_middleware(
@@ -39,54 +88,145 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(GZipMiddleware, minimum_size=1000)
 
 # Initialize Gemini client
 genai = init_genai()
 
-# In-memory session storage (for demo purposes)
-# In production, use a database
-sessions = {}
+# Session and job state; in memory by default, or in SQLite shared by all
+# worker processes when SESSION_STORE is set
+sessions, job_store = create_stores()
+
+# Identical requests that arrive while one is already running share its result
+research_flights = SingleFlight(retry_on=(JobCancelled,))
+report_flights = SingleFlight(retry_on=(JobCancelled,))
+
+async def research_and_index(topic: str, objectives: List[str]) -> Dict:
+    """Research a topic and index the results under the corpus content hash"""
+    # Documents are embedded as each source returns them, while the others are still fetching
+    docs, corpus_id, corpus_index_path = await index_stream(stream_research(topic, objectives))
+    return {"documents": order_documents(docs), "corpus_id": corpus_id, "index_path": corpus_index_path}
+
+async def research_topic(topic: str, objectives: List[str]) -> Dict:
+    """Research and index a topic, sharing the work with concurrent requests for it"""
+    return await research_flights.do(
+        research_key(topic, objectives),
+        lambda: research_and_index(topic, objectives)
+    )
+
+async def cached_research(topic: str, objectives: List[str]) -> Dict:
+    """Research and index a topic, using fresh cached results when available"""
+    key = research_key(topic, objectives)
+    corpus = prewarmer.cache.get(key)
+    if corpus is None:
+        corpus = await research_topic(topic, objectives)
+        prewarmer.cache.put(key, corpus)
+    return corpus
+
+# Worker pool for long-running research and report jobs
+jobs = JobManager(workers=int(os.getenv("JOB_WORKERS", "4")), store=job_store)
+
+# Keeps research for popular and seed topics fresh in the background, while
+# no live requests or interactive jobs are in flight
+prewarmer = create_prewarmer(research_topic, active_jobs=lambda: jobs.active)
+
+# Starts on a session's report while the learner answers clarification questions
+prefetcher = create_prefetcher(prefetch_report, prefetch_key)
+
+@app.on_event("startup")
+async def start_background_work():
+    jobs.start()
+    prewarmer.start()
+
+@app.on_event("shutdown")
+async def stop_background_work():
+    await prewarmer.stop()
+    await prefetcher.stop()
+    await jobs.stop()
+    await page_fetcher.close()
+    await paper_fetcher.close()
+    paper_fetcher.shutdown()
+
+@app.middleware("http")
+async def count_live_requests(request: Request, call_next):
+    """Track in-flight live requests so background work can stay out of their way"""
+    if request.method == "GET":
+        return await call_next(request)
+    prewarmer.live_requests += 1
+    try:
+        return await call_next(request)
+    finally:
+        prewarmer.live_requests -= 1
 
 @app.post("/start_session")
 async def start_session(request: SessionRequest = None):
     """Initialize a new learning session"""
     session_id = f"session_{uuid.uuid4().hex[:8]}"
-    sessions[session_id] = {
+    sessions.create(session_id, {
         "id": session_id,
         "topic": request.topic if request else None,
         "documents": [],
         "index_path": None,
         "preferences": {}
-    }
+    })
     return {"session_id": session_id}
 
-@app.post("/research")
-async def research_endpoint(payload: ResearchRequest):
-    """Perform research on the given topic"""
-    if not payload.topic:
-        raise HTTPException(status_code=400, detail="Topic is required")
+def document_preview(index: int, doc: Dict) -> Dict:
+    """Metadata and the first PREVIEW_CHARS characters of a research document"""
+    text = doc.get("text") or ""
+    return {
+        "id": index,
+        "source": doc.get("source"),
+        "type": doc.get("type", "unknown"),
+        "length": len(text),
+        "preview": text[:PREVIEW_CHARS],
+    }
+
+async def run_research(topic: str, objectives: List[str], progress=None, full: bool = False) -> Dict:
+    """Create a session for the topic and attach researched, indexed documents to it"""
+    report_progress = progress or (lambda fraction, message: None)
     
     # Start a new session if topic is provided
     session_id = f"session_{uuid.uuid4().hex[:8]}"
-    sessions[session_id] = {"id": session_id, "topic": payload.topic}
+    sessions.create(session_id, {"id": session_id, "topic": topic})
     
-    # Perform research
-    docs = await perform_research(payload.topic, payload.objectives)
+    # Use fresh cached research when available, otherwise research and index
+    # the topic (sharing the work with concurrent requests for it)
+    report_progress(0.05, "Researching web, arXiv and video sources")
+    prewarmer.record(topic)
+    corpus = await cached_research(topic, objectives)
+    docs = corpus["documents"]
+    report_progress(0.95, "Indexed research documents")
     
     # Store documents in session
-    sessions[session_id]["documents"] = docs
-    sessions[session_id]["objectives"] = payload.objectives
+    sessions.update(
+        session_id,
+        documents=docs,
+        objectives=objectives,
+        corpus_id=corpus["corpus_id"],
+        index_path=link_session_index(session_id, corpus["index_path"])
+    )
     
-    # Index the documents
-    index_path = await index_documents(session_id, docs)
-    sessions[session_id]["index_path"] = index_path
+    # Start on the report while the learner fills in the clarification form,
+    # guessing the form's default answers; /generate_report reconciles with the real ones
+    answers = default_answers(topic)
+    prefetcher.start(session_id, {**answers, **analyze_preferences(answers)})
     
+    # Full text stays on the server; clients page through it on demand
     return {
         "session_id": session_id,
-        "documents": docs,
-        "summary": f"Found {len(docs)} relevant sources on {payload.topic}"
+        "documents": docs if full else [document_preview(i, d) for i, d in enumerate(docs)],
+        "summary": f"Found {len(docs)} relevant sources on {topic}"
     }
 
+@app.post("/research")
+async def research_endpoint(payload: ResearchRequest, full: bool = False):
+    """Perform research on the given topic; documents are previews unless full=true"""
+    if not payload.topic:
+        raise HTTPException(status_code=400, detail="Topic is required")
+    
+    return await run_research(payload.topic, payload.objectives, full=full)
+
 @app.post("/clarify")
 async def clarify_endpoint(payload: ClarifyRequest):
     """Get clarification questions based on answers so far"""
@@ -98,7 +238,7 @@ async def clarify_endpoint(payload: ClarifyRequest):
     # If a session_id is provided, update the session with answers
     session_id = payload.answers.get("session_id")
     if session_id and session_id in sessions:
-        sessions[session_id]["answers"] = payload.answers
+        sessions.update(session_id, answers=payload.answers)
     
     return {"questions": questions}
 
@@ -113,34 +253,48 @@ async def analyze_preferences_endpoint(payload: Dict):
     # Update session if applicable
     session_id = payload.get("session_id")
     if session_id and session_id in sessions:
-        sessions[session_id]["preferences"] = preferences
+        sessions.update(session_id, preferences=preferences)
     
     return {"preferences": preferences}
 
-@app.post("/generate_report")
-async def generate_report_endpoint(payload: ReportRequest):
-    """Generate a comprehensive learning report"""
-    session_id = payload.session_id
-    
-    if session_id not in sessions:
-        raise HTTPException(status_code=404, detail="Session not found")
-    
+async def run_generate_report(session_id: str, preferences: Dict, progress=None) -> Dict:
+    """Generate a report for an existing session and store it there"""
     # Combine provided preferences with session data
-    session = sessions[session_id]
+    session = sessions.get(session_id, "topic", "preferences", "corpus_id")
     all_preferences = {
         "topic": session.get("topic", ""),
         **session.get("preferences", {}),
-        **payload.preferences
+        **preferences
     }
     
-    # Generate the report
-    report_md = await generate_report(session_id, all_preferences)
+    # Drop speculative work that these preferences cannot use
+    prefetcher.reconcile(session_id, all_preferences)
+    
+    # Generate the report; identical corpus and preferences share one generation
+    flight_key = (
+        session.get("corpus_id", session_id),
+        json.dumps(all_preferences, sort_keys=True, default=str)
+    )
+    report_md = await report_flights.do(
+        flight_key,
+        lambda: generate_report(session_id, all_preferences, progress)
+    )
     
     # Store the report in the session
-    sessions[session_id]["report"] = report_md
+    sessions.update(session_id, report=report_md)
     
     return {"report": report_md}
 
+@app.post("/generate_report")
+async def generate_report_endpoint(payload: ReportRequest):
+    """Generate a comprehensive learning report"""
+    session_id = payload.session_id
+    
+    if session_id not in sessions:
+        raise HTTPException(status_code=404, detail="Session not found")
+    
+    return await run_generate_report(session_id, payload.preferences)
+
 @app.patch("/modify_report")
 async def modify_report_endpoint(payload: FeedbackRequest):
     """Modify an existing report based on feedback"""
@@ -153,11 +307,89 @@ async def modify_report_endpoint(payload: FeedbackRequest):
     updated_md = await modify_report(session_id, payload.feedback)
     
     # Update the session
-    sessions[session_id]["report"] = updated_md
-    sessions[session_id]["feedback"] = payload.feedback
+    sessions.update(session_id, report=updated_md, feedback=payload.feedback)
     
     return {"report": updated_md}
 
+def normalize_question(question: str) -> str:
+    return " ".join(question.lower().split())
+
+def cached_answer(cache: Dict, key: str) -> Optional[str]:
+    if key not in cache:
+        return None
+    # Dicts keep insertion order; re-inserting marks the answer as recently asked
+    cache[key] = cache.pop(key)
+    return cache[key]
+
+def remember_answer(cache: Dict, key: str, answer: str):
+    cache[key] = answer
+    while len(cache) > MAX_CACHED_ANSWERS:
+        del cache[next(iter(cache))]
+
+def answer_lines(session_id: str, chain: QAChain, questions: List[str], cache: Dict):
+    """Stream answers as NDJSON: partial deltas, then the full answer for each question"""
+    # Whether each distinct question was already cached before this request
+    was_cached: Dict[str, bool] = {}
+    for index, question in enumerate(questions):
+        key = normalize_question(question)
+        answer = cached_answer(cache, key)
+        if answer is not None:
+            cached = was_cached.setdefault(key, True)
+            yield json.dumps({"index": index, "question": question, "answer": answer, "cached": cached}) + "\n"
+            continue
+        parts = []
+        for delta in chain.stream(question):
+            parts.append(delta)
+            yield json.dumps({"index": index, "delta": delta}) + "\n"
+        answer = "".join(parts).strip()
+        was_cached[key] = False
+        remember_answer(cache, key, answer)
+        sessions.update(session_id, answers_cache=cache)
+        yield json.dumps({"index": index, "question": question, "answer": answer, "cached": False}) + "\n"
+
+@app.post("/ask")
+async def ask_endpoint(payload: AskRequest):
+    """Answer follow-up questions from the session's research index"""
+    session_id = payload.session_id
+    
+    if session_id not in sessions:
+        raise HTTPException(status_code=404, detail="Session not found")
+    questions = [q for q in payload.questions if q.strip()]
+    if not questions or len(questions) > MAX_QUESTIONS:
+        raise HTTPException(status_code=400, detail=f"Provide between 1 and {MAX_QUESTIONS} questions")
+    
+    chain = await asyncio.to_thread(QAChain.from_session, session_id)
+    if chain is None:
+        raise HTTPException(status_code=404, detail="No research index for this session")
+    
+    # Answers are cached per session; the cache is dropped when the session goes away
+    cache = sessions.get(session_id, "answers_cache").get("answers_cache", {})
+    
+    if payload.stream:
+        return StreamingResponse(answer_lines(session_id, chain, questions, cache), media_type="application/x-ndjson")
+    
+    # Questions that differ only in case or spacing are answered once
+    unique = {}
+    for question in questions:
+        unique.setdefault(normalize_question(question), question)
+    
+    async def answer(key: str, question: str) -> Tuple[str, bool]:
+        cached = cached_answer(cache, key)
+        if cached is not None:
+            return cached, True
+        return await asyncio.to_thread(chain.run, question), False
+    
+    results = dict(zip(unique, await asyncio.gather(*(answer(k, q) for k, q in unique.items()))))
+    for key, (text, cached) in results.items():
+        if not cached:
+            remember_answer(cache, key, text)
+    sessions.update(session_id, answers_cache=cache)
+    answers = []
+    for question in questions:
+        text, cached = results[normalize_question(question)]
+        answers.append({"question": question, "answer": text, "cached": cached})
+    return {"session_id": session_id, "answers": answers}
+
 @app.get("/session/{session_id}")
 async def get_session(session_id: str):
     """Get session information"""
@@ -165,12 +397,212 @@ async def get_session(session_id: str):
         raise HTTPException(status_code=404, detail="Session not found")
     
     # Return session without large data (documents, report)
+    session = sessions.get(session_id, "id", "topic", "documents", "report", "preferences")
     session_info = {
-        "id": sessions[session_id]["id"],
-        "topic": sessions[session_id].get("topic"),
-        "has_documents": len(sessions[session_id].get("documents", [])) > 0,
-        "has_report": "report" in sessions[session_id],
-        "preferences": sessions[session_id].get("preferences", {})
+        "id": session["id"],
+        "topic": session.get("topic"),
+        "has_documents": len(session.get("documents", [])) > 0,
+        "has_report": "report" in session,
+        "preferences": session.get("preferences", {})
+    }
+    
+    return session_info
+
+@app.get("/session/{session_id}/documents")
+async def get_session_documents(session_id: str, offset: int = 0, limit: int = 10,
+                                type: Optional[str] = None, full: bool = True):
+    """Page through a session's research documents, with full text by default"""
+    if session_id not in sessions:
+        raise HTTPException(status_code=404, detail="Session not found")
+    if offset < 0 or not 1 <= limit <= 100:
+        raise HTTPException(status_code=400, detail="offset must be >= 0 and limit between 1 and 100")
+    
+    docs = [
+        (i, d) for i, d in enumerate(sessions.get(session_id, "documents").get("documents", []))
+        if type is None or d.get("type") == type
+    ]
+    page = []
+    for i, doc in docs[offset:offset + limit]:
+        item = document_preview(i, doc)
+        if full:
+            item["text"] = doc.get("text") or ""
+        page.append(item)
+    
+    return {
+        "session_id": session_id,
+        "total": len(docs),
+        "offset": offset,
+        "limit": limit,
+        "documents": page
     }
+
+@app.get("/export/{session_id}")
+async def export_endpoint(session_id: str, format: str = "pdf"):
+    """Download the session's report as pdf, html or md"""
+    if session_id not in sessions:
+        raise HTTPException(status_code=404, detail="Session not found")
+    if format not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"Format must be one of {list(FORMATS)}")
+    session = sessions.get(session_id, "report", "topic")
+    report_md = session.get("report")
+    if not report_md:
+        raise HTTPException(status_code=404, detail="No report for this session")
+    
+    topic = session.get("topic") or "report"
+    path, media_type = await export_report(report_md, topic, format)
+    return FileResponse(
+        path,
+        media_type=media_type,
+        filename=f"{topic.replace(' ', '_')}_report.{FORMATS[format][1]}"
+    )
+
+@app.get("/llm_stats")
+async def llm_stats():
+    """Get the state of the shared Gemini rate governor"""
+    return get_governor().stats()
+
+@app.get("/routing")
+async def routing_stats():
+    """Get model routing decisions and latencies by task"""
+    return router.stats()
+
+@app.get("/profiles")
+async def profiles(session_id: Optional[str] = None):
+    """List saved request profiles, optionally for one session"""
+    return {"profiles": list_profiles(session_id)}
+
+@app.get("/profiles/{session_id}/{request_id}")
+async def download_profile(session_id: str, request_id: str):
+    """Download a request profile as folded stacks (for flamegraph.pl, speedscope or inferno)"""
+    try:
+        path = profile_path(session_id, request_id)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="text/plain; charset=utf-8", filename=f"{request_id}.folded")
+
+@app.get("/prewarm")
+async def prewarm_status():
+    """Get the state of the background topic pre-warmer"""
+    return prewarmer.status()
+
+@app.get("/prefetch")
+async def prefetch_status():
+    """Get the state of speculative report prefetching"""
+    return prefetcher.status()
+
+def job_priority(priority: str) -> int:
+    if priority not in PRIORITIES:
+        raise HTTPException(status_code=400, detail=f"Priority must be one of {list(PRIORITIES)}")
+    return PRIORITIES[priority]
+
+@app.post("/jobs/research", status_code=202)
+async def submit_research_job(payload: ResearchRequest, priority: str = "interactive"):
+    """Queue research on a topic and return a job ID to poll"""
+    if not payload.topic:
+        raise HTTPException(status_code=400, detail="Topic is required")
+    
+    job = jobs.submit(
+        "research",
+        lambda job: run_research(payload.topic, payload.objectives, job.update),
+        priority=job_priority(priority),
+        params={"topic": payload.topic}
+    )
+    return job.to_dict()
+
+@app.post("/jobs/generate_report", status_code=202)
+async def submit_report_job(payload: ReportRequest, priority: str = "interactive"):
+    """Queue report generation for a session and return a job ID to poll"""
+    if payload.session_id not in sessions:
+        raise HTTPException(status_code=404, detail="Session not found")
+    
+    job = jobs.submit(
+        "generate_report",
+        lambda job: run_generate_report(payload.session_id, payload.preferences, job.update),
+        priority=job_priority(priority),
+        params={"session_id": payload.session_id}
+    )
+    return job.to_dict()
+
+async def run_batch_job(job, entries: List[BatchEntry]) -> Dict:
+    """Generate a batch's reports, appending each result to its JSON lines file as it finishes"""
+    path = results_path(job.id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    counts = {"succeeded": 0, "failed": 0}
+    with open(path, "w") as out:
+        # Closed explicitly so a cancelled job stops the batch's tasks and threads at once
+        async with contextlib.aclosing(run_batch(entries, research=cached_research)) as results:
+            async for result, corpus in results:
+                if corpus is not None:
+                    # Each report gets a session, so it can be modified, exported or asked about
+                    entry = entries[result["index"]]
+                    session_id = f"session_{uuid.uuid4().hex[:8]}"
+                    sessions.create(session_id, {"id": session_id, "topic": entry.topic})
+                    sessions.update(
+                        session_id,
+                        documents=corpus["documents"],
+                        objectives=entry.objectives,
+                        corpus_id=corpus["corpus_id"],
+                        index_path=link_session_index(session_id, corpus["index_path"]),
+                        preferences=entry.preferences,
+                        report=result["report"]
+                    )
+                    result["session_id"] = session_id
+                out.write(json.dumps(result) + "\n")
+                out.flush()
+                counts[result["status"]] += 1
+                done = sum(counts.values())
+                job.update(done / len(entries), f"{done} of {len(entries)} reports finished")
+    return {"entries": len(entries), **counts, "results": f"/batch/{job.id}/results"}
+
+@app.post("/batch", status_code=202)
+async def submit_batch(payload: BatchRequest, priority: str = "background"):
+    """Queue reports for a list of (topic, objectives, preferences) entries and return a job ID to poll"""
+    if not payload.entries:
+        raise HTTPException(status_code=400, detail="At least one entry is required")
+    if len(payload.entries) > MAX_BATCH_ENTRIES:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_ENTRIES} entries per batch")
     
-    return session_info
\ No newline at end of file
+    job = jobs.submit(
+        "batch",
+        lambda job: run_batch_job(job, payload.entries),
+        priority=job_priority(priority),
+        params={
+            "entries": len(payload.entries),
+            "topics": len({normalize_topic(entry.topic) for entry in payload.entries})
+        }
+    )
+    return job.to_dict()
+
+@app.get("/batch/{job_id}/results")
+async def batch_results(job_id: str):
+    """Get the results of a batch finished so far, one JSON object per line"""
+    try:
+        path = results_path(job_id)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return FileResponse(path, media_type="application/x-ndjson")
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Get job status, progress and (once finished) its result"""
+    info = jobs.info(job_id)
+    if info is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return info
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """Cancel a queued or running job"""
+    info = jobs.cancel(job_id)
+    if info is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return info
+
+@app.get("/jobs")
+async def job_stats():
+    """Get job queue statistics"""
+    return jobs.stats()
\ No newline at end of file
@@ -0,0 +1,198 @@
+"""
+Batch report generation for cohorts: many (topic, objectives, preferences)
+entries in one run.
+
+Entries on the same topic share one research and indexing run, searched with
+the union of their objectives. Each entry's report starts as soon as its topic
+is indexed, so later topics are researched while earlier reports are written.
+Up to BATCH_CONCURRENCY reports are generated at once; their LLM calls are
+paced together by the shared rate governor. Results come out as entries finish.
+
+Command line:
+
+    python -m backend.batch cohort.jsonl -o reports.jsonl
+
+Each input line is a JSON object with "topic" and optionally "id",
+"objectives" and "preferences" (the same preferences /generate_report takes).
+Each output line has the entry's index, id and topic, its status and either
+the report or the error.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from pydantic import BaseModel, Field, ValidationError
+
+from backend.indexing import index_stream
+from backend.prewarm import DEFAULT_OBJECTIVES, normalize_topic
+from backend.report import NO_RESEARCH_ERROR, generate_report
+from backend.research import order_documents, stream_research
+
+# Reports generated at once, and topics researched at once
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+RESEARCH_CONCURRENCY = int(os.getenv("BATCH_RESEARCH_CONCURRENCY", "4"))
+
+# Results of batches submitted through the API, one JSON lines file per job
+BATCH_DIR = os.getenv("BATCH_DIR", os.path.join(os.path.dirname(__file__), "../batches"))
+
+
+class BatchEntry(BaseModel):
+    topic: str
+    objectives: List[str] = Field(default_factory=lambda: list(DEFAULT_OBJECTIVES))
+    preferences: Dict = Field(default_factory=dict)
+    id: Optional[str] = None
+
+
+def results_path(job_id: str) -> str:
+    if not re.fullmatch(r"job_[0-9a-f]+", job_id):
+        raise ValueError(f"Invalid job ID: {job_id}")
+    return os.path.join(BATCH_DIR, f"{job_id}.jsonl")
+
+
+async def research_corpus(topic: str, objectives: List[str]) -> Dict:
+    """Research and index a topic (as /research does, without a session)."""
+    docs, corpus_id, index_path = await index_stream(stream_research(topic, objectives))
+    return {"documents": order_documents(docs), "corpus_id": corpus_id, "index_path": index_path}
+
+
+def group_topics(entries: List[BatchEntry]) -> Dict[str, Tuple[str, List[str]]]:
+    """Entries by normalized topic: (topic as first given, union of their objectives)."""
+    groups: Dict[str, Tuple[str, List[str]]] = {}
+    for entry in entries:
+        _, objectives = groups.setdefault(normalize_topic(entry.topic), (entry.topic.strip(), []))
+        objectives.extend(o for o in entry.objectives if o not in objectives)
+    return groups
+
+
+async def run_batch(
+    entries: List[BatchEntry],
+    research: Callable[[str, List[str]], Awaitable[Dict]] = research_corpus,
+    concurrency: int = BATCH_CONCURRENCY,
+    research_concurrency: int = RESEARCH_CONCURRENCY,
+) -> AsyncIterator[Tuple[Dict, Optional[Dict]]]:
+    """
+    Generate a report for every entry, yielding (result, corpus) as each one
+    finishes. corpus is the research the report was based on, or None if it failed.
+    """
+    research_slots = asyncio.Semaphore(research_concurrency)
+    report_slots = asyncio.Semaphore(concurrency)
+    # Report generation blocks a thread per report while it waits on the LLM
+    pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch")
+
+    async def research_topic(topic: str, objectives: List[str]) -> Dict:
+        async with research_slots:
+            return await research(topic, objectives)
+
+    corpora = {
+        key: asyncio.ensure_future(research_topic(topic, objectives))
+        for key, (topic, objectives) in group_topics(entries).items()
+    }
+
+    async def run_entry(index: int, entry: BatchEntry) -> Tuple[Dict, Optional[Dict]]:
+        start = time.monotonic()
+        result = {"index": index, "id": entry.id or str(index), "topic": entry.topic}
+        corpus = None
+        try:
+            # Shielded: the research is shared with the topic's other entries
+            corpus = await asyncio.shield(corpora[normalize_topic(entry.topic)])
+            async with report_slots:
+                report_md = await generate_report(
+                    corpus["corpus_id"], {"topic": entry.topic, **entry.preferences}, executor=pool
+                )
+            if report_md == NO_RESEARCH_ERROR:
+                raise RuntimeError(report_md)
+            result.update(status="succeeded", corpus_id=corpus["corpus_id"], report=report_md)
+        except Exception as e:
+            print(f"Batch entry {result['id']} ({entry.topic}) failed: {str(e)}")
+            result.update(status="failed", error=str(e))
+        result["seconds"] = round(time.monotonic() - start, 3)
+        return result, corpus if result["status"] == "succeeded" else None
+
+    tasks = [asyncio.ensure_future(run_entry(i, entry)) for i, entry in enumerate(entries)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        # Runs when the batch finishes or its consumer stops early (close the
+        # generator, e.g. with contextlib.aclosing, when not iterating to the end)
+        pending = [task for task in tasks + list(corpora.values()) if not task.done()]
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        for task in tasks + list(corpora.values()):
+            if not task.cancelled():
+                task.exception()  # already reported in the entry's result
+        # Reports already running finish in their threads; queued ones are dropped
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def read_entries(lines) -> List[BatchEntry]:
+    entries = []
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            entries.append(BatchEntry.model_validate(json.loads(line)))
+        except (ValueError, ValidationError) as e:
+            raise ValueError(f"Line {number}: {str(e)}")
+    return entries
+
+
+async def write_results(entries: List[BatchEntry], out, concurrency: int = BATCH_CONCURRENCY) -> Dict:
+    """Run a batch, writing each result as a JSON line as soon as it finishes."""
+    counts = {"succeeded": 0, "failed": 0}
+    start = time.monotonic()
+    async with contextlib.aclosing(run_batch(entries, concurrency=concurrency)) as results:
+        async for result, _ in results:
+            out.write(json.dumps(result) + "\n")
+            out.flush()
+            counts[result["status"]] += 1
+            print(f"[{sum(counts.values())}/{len(entries)}] {result['status']}: {result['topic']} "
+                  f"({result['seconds']}s)", file=sys.stderr)
+    from backend.papers import paper_fetcher
+    from backend.webfetch import page_fetcher
+    await page_fetcher.close()
+    await paper_fetcher.close()
+    paper_fetcher.shutdown()
+    return {"entries": len(entries), **counts, "seconds": round(time.monotonic() - start, 3)}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Generate learning reports for a batch of entries")
+    parser.add_argument("input", help="JSON lines file of entries ('-' for stdin)")
+    parser.add_argument("-o", "--output", help="JSON lines file for results (default: stdout)")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY,
+                        help="Reports generated at once")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.input == "-":
+            entries = read_entries(sys.stdin)
+        else:
+            with open(args.input) as f:
+                entries = read_entries(f)
+    except ValueError as e:
+        print(f"Invalid batch input: {str(e)}", file=sys.stderr)
+        return 2
+
+    out = open(args.output, "w") if args.output else sys.stdout
+    try:
+        # Pipeline logging goes to stderr so stdout carries only results
+        with contextlib.redirect_stdout(sys.stderr):
+            summary = asyncio.run(write_results(entries, out, args.concurrency))
+    finally:
+        if args.output:
+            out.close()
+    print(json.dumps(summary), file=sys.stderr)
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
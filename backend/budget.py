@@ -0,0 +1,63 @@
+"""
+Generation budgets derived from the learner's available time and depth.
+
+A 15-minute learner gets a short report: fewer sections, smaller retrievals,
+no per-document compression calls, fewer visual/code extras and a lower
+output token target. The report generator enforces the budget while it runs.
+"""
+from typing import Dict, Optional
+
+from pydantic import BaseModel
+
+# Budgets by session time in minutes: a session gets the largest tier that fits
+TIERS = {
+    15: {"max_sections": 2, "retrieval_k": 3, "compress": False, "extra_sections": 1,
+         "include_resources": False, "target_tokens": 1500},
+    30: {"max_sections": 3, "retrieval_k": 4, "compress": False, "extra_sections": 3,
+         "include_resources": True, "target_tokens": 3000},
+    60: {"max_sections": 4, "retrieval_k": 5, "compress": True, "extra_sections": 4,
+         "include_resources": True, "target_tokens": 5000},
+    120: {"max_sections": 5, "retrieval_k": 6, "compress": True, "extra_sections": 5,
+          "include_resources": True, "target_tokens": 8000},
+}
+# Used when no session time was given, matching reports generated before budgets
+DEFAULT_SESSION_TIME = 60
+
+# Output tokens scale with the requested depth (1=basic, 3=advanced)
+DEPTH_SCALE = {1: 0.75, 2: 1.0, 3: 1.25}
+MIN_CALL_TOKENS = 256
+
+
+class Budget(BaseModel):
+    """Execution budget for one report."""
+    max_sections: int
+    retrieval_k: int
+    compress: bool
+    # Sections that may get a visual aid or code example
+    extra_sections: int
+    include_resources: bool
+    # Output tokens for the report's core content, and the cap for each LLM call
+    target_tokens: int
+    call_tokens: int
+
+
+def plan_budget(session_time: Optional[int], depth_level: Optional[int]) -> Budget:
+    """Turn session_time (minutes) and depth_level into a report budget."""
+    minutes = session_time or DEFAULT_SESSION_TIME
+    tier = min(TIERS)
+    for limit in sorted(TIERS):
+        if minutes >= limit:
+            tier = limit
+    settings: Dict = dict(TIERS[tier])
+
+    depth = depth_level if depth_level in DEPTH_SCALE else 2
+    settings["target_tokens"] = int(settings["target_tokens"] * DEPTH_SCALE[depth])
+    if depth == 3:
+        settings["retrieval_k"] += 1
+
+    # Split the target over the core calls: overview, key concepts, sections,
+    # assessment and resources. Extras are bounded by extra_sections instead, so
+    # the per-call cap (and every cached fragment) is the same with or without them
+    calls = 3 + settings["max_sections"] + int(settings["include_resources"])
+    settings["call_tokens"] = max(MIN_CALL_TOKENS, settings["target_tokens"] // calls)
+    return Budget(**settings)
@@ -2,6 +2,7 @@ import os
 from dotenv import load_dotenv
 import google.generativeai as genai
 from langchain_google_genai import ChatGoogleGenerativeAI
+from backend.ratelimit import GovernedChatModel, get_governor
 
 load_dotenv()
 
@@ -11,6 +12,8 @@ def init_genai():
     return genai
 
 def get_genai_llm(model_name="gemini-2.0-flash-lite"):
-    """Return a LangChain-compatible Gemini model"""
+    """Return a LangChain-compatible Gemini model paced by the shared rate governor"""
     api_key = os.getenv("GEMINI_API_KEY")
-    return ChatGoogleGenerativeAI(model=model_name, google_api_key=api_key)
\ No newline at end of file
+    # Retries are handled by the governor so quota errors back off globally
+    model = ChatGoogleGenerativeAI(model=model_name, google_api_key=api_key, max_retries=0)
+    return GovernedChatModel(inner=model, governor=get_governor())
\ No newline at end of file
@@ -0,0 +1,167 @@
+"""
+Report export to Markdown, HTML and PDF.
+
+Rendered files are cached on disk by a hash of the report content, topic and
+format, so repeat downloads are served straight from the cache. Rendering runs
+in a worker thread to keep the event loop free. The cache keeps at most
+EXPORT_MAX_FILES files, evicting the least recently served, and drops files
+not served for EXPORT_MAX_AGE seconds.
+"""
+import asyncio
+import hashlib
+import html as html_lib
+import os
+import time
+import uuid
+from typing import Tuple
+
+import markdown
+
+from backend.singleflight import SingleFlight
+
+EXPORT_DIR = os.path.join(os.path.dirname(__file__), "../exports")
+os.makedirs(EXPORT_DIR, exist_ok=True)
+EXPORT_MAX_FILES = int(os.getenv("EXPORT_MAX_FILES", "500"))
+EXPORT_MAX_AGE = float(os.getenv("EXPORT_MAX_AGE", str(7 * 24 * 3600)))
+
+FORMATS = {
+    "md": ("text/markdown; charset=utf-8", "md"),
+    "html": ("text/html; charset=utf-8", "html"),
+    "pdf": ("application/pdf", "pdf"),
+}
+
+HTML_TEMPLATE = """<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<title>Learning Report: {title}</title>
+<style>
+body {{ font-family: -apple-system, "Segoe UI", Helvetica, Arial, sans-serif; max-width: 50rem; margin: 2rem auto; padding: 0 1rem; line-height: 1.6; }}
+pre {{ background: #f5f5f5; padding: 1rem; overflow-x: auto; }}
+code {{ font-family: Menlo, Consolas, monospace; }}
+</style>
+</head>
+<body>
+{body}
+</body>
+</html>
+"""
+
+# Core PDF fonts only cover Latin-1; map common typographic characters first
+PDF_REPLACEMENTS = {
+    '\u2013': '-',  # en dash
+    '\u2014': '--',  # em dash
+    '\u2018': "'",   # left single quote
+    '\u2019': "'",   # right single quote
+    '\u201c': '"',   # left double quote
+    '\u201d': '"',   # right double quote
+    '\u2022': '*',   # bullet
+    '\u2026': '...',  # ellipsis
+    '\u00a0': ' ',   # non-breaking space
+}
+
+_flights = SingleFlight()
+
+
+def report_hash(report: str, topic: str, fmt: str) -> str:
+    digest = hashlib.sha256()
+    for part in (fmt, topic, report):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()[:24]
+
+
+def _latin1(text: str) -> str:
+    for unicode_char, ascii_char in PDF_REPLACEMENTS.items():
+        text = text.replace(unicode_char, ascii_char)
+    return text.encode("latin-1", "replace").decode("latin-1")
+
+
+def render_html(report: str, topic: str) -> bytes:
+    body = markdown.markdown(report, extensions=["fenced_code", "tables"])
+    return HTML_TEMPLATE.format(title=html_lib.escape(topic), body=body).encode("utf-8")
+
+
+def render_pdf(report: str, topic: str) -> bytes:
+    from fpdf import FPDF
+
+    class PDF(FPDF):
+        def header(self):
+            self.set_font("Helvetica", "B", 12)
+            self.cell(0, 10, _latin1(f"Learning Report: {topic}"), align="C", new_x="LMARGIN", new_y="NEXT")
+            self.ln(10)
+
+        def footer(self):
+            self.set_y(-15)
+            self.set_font("Helvetica", "I", 8)
+            self.cell(0, 10, f"Page {self.page_no()}", align="C")
+
+    pdf = PDF()
+    pdf.add_page()
+    pdf.set_font("Helvetica", "", 11)
+    body = markdown.markdown(_latin1(report), extensions=["fenced_code"])
+    try:
+        # Lay out the whole document in one pass, keeping headings, lists and emphasis
+        pdf.write_html(body)
+    except Exception:
+        # Markup the HTML renderer cannot handle falls back to plain paragraphs
+        pdf = PDF()
+        pdf.add_page()
+        pdf.set_font("Helvetica", "", 11)
+        pdf.multi_cell(0, 5, _latin1(report))
+    return bytes(pdf.output())
+
+
+def _render_to_file(report: str, topic: str, fmt: str, path: str) -> str:
+    if fmt == "md":
+        data = report.encode("utf-8")
+    elif fmt == "html":
+        data = render_html(report, topic)
+    else:
+        data = render_pdf(report, topic)
+    # Write then rename so concurrent readers never see a partial file
+    tmp_path = f"{path}.tmp-{uuid.uuid4().hex[:8]}"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    return path
+
+
+def prune_exports(export_dir: str = EXPORT_DIR, max_files: int = EXPORT_MAX_FILES,
+                  max_age: float = EXPORT_MAX_AGE) -> int:
+    """Delete expired files, then the least recently served beyond max_files. Returns the number deleted."""
+    files = []
+    for entry in os.scandir(export_dir):
+        if entry.is_file() and ".tmp-" not in entry.name:
+            try:
+                files.append((entry.stat().st_mtime, entry.path))
+            except FileNotFoundError:
+                continue
+    files.sort(reverse=True)
+    cutoff = time.time() - max_age
+    stale = [path for i, (mtime, path) in enumerate(files) if i >= max_files or mtime < cutoff]
+    for path in stale:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    return len(stale)
+
+
+async def export_report(report: str, topic: str, fmt: str) -> Tuple[str, str]:
+    """
+    Render the report in the given format, reusing a cached file when possible.
+    Returns (file_path, media_type).
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported export format: {fmt}")
+    media_type, extension = FORMATS[fmt]
+    key = report_hash(report, topic, fmt)
+    path = os.path.join(EXPORT_DIR, f"{key}.{extension}")
+    try:
+        # The modification time records when the file was last served
+        os.utime(path)
+    except FileNotFoundError:
+        await _flights.do(key, lambda: asyncio.to_thread(_render_to_file, report, topic, fmt, path))
+        await asyncio.to_thread(prune_exports, EXPORT_DIR)
+    return path, media_type
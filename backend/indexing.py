@@ -1,10 +1,20 @@
+import asyncio
+import hashlib
+import json
 import os
-from typing import List, Dict
+import shutil
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import AsyncIterator, List, Dict, Tuple
 import uuid
+import faiss
 from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_community.docstore.base import Docstore
 from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain_community.vectorstores import FAISS
 from langchain.docstore.document import Document
+from backend.profiling import profiled
 
 # Embeddings instance
 embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
@@ -14,42 +24,259 @@ embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
 INDEX_DIR = os.path.join(os.path.dirname(__file__), "../indexes")
 os.makedirs(INDEX_DIR, exist_ok=True)
 
+# Files making up an index directory: raw FAISS vectors and a SQLite docstore
+VECTORS_FILE = "index.faiss"
+DOCSTORE_FILE = "docstore.sqlite"
+
+# Map the vector file read-only so worker processes share the OS page cache
+MMAP_FLAGS = faiss.IO_FLAG_MMAP | getattr(faiss, "IO_FLAG_MMAP_IFC", 0) | faiss.IO_FLAG_READ_ONLY
+
+# Recently used indexes kept loaded in memory, keyed by (real path, mtime)
+INDEX_CACHE_SIZE = int(os.getenv("INDEX_CACHE_SIZE", "32"))
+_index_cache: "OrderedDict[tuple, FAISS]" = OrderedDict()
+_index_cache_lock = threading.Lock()
+
 def create_session_index_path(session_id: str) -> str:
     """Create a unique path for the session's FAISS index."""
     return os.path.join(INDEX_DIR, session_id)
 
+def index_exists(index_path: str) -> bool:
+    """Whether a complete index in the current format is stored at index_path."""
+    return all(os.path.exists(os.path.join(index_path, name)) for name in (VECTORS_FILE, DOCSTORE_FILE))
+
+class SQLiteDocstore(Docstore):
+    """
+    Docstore that fetches chunks from SQLite on demand instead of unpickling them all.
+
+    Saved indexes are read-only: they are shared between sessions and worker
+    processes by corpus ID, so they are never changed in place. add and delete
+    raise RuntimeError; index the new documents with index_corpus instead.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        self._lock = threading.Lock()
+
+    def ids(self) -> Dict[int, str]:
+        with self._lock:
+            return dict(self._conn.execute("SELECT position, id FROM documents"))
+
+    def search(self, search: str):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT page_content, metadata FROM documents WHERE id = ?", (search,)
+            ).fetchone()
+        if row is None:
+            return f"ID {search} not found."
+        return Document(page_content=row[0], metadata=json.loads(row[1]))
+
+    def add(self, texts: Dict[str, Document]) -> None:
+        raise RuntimeError("Saved indexes are read-only; rebuild with index_corpus")
+
+    def delete(self, ids: List) -> None:
+        raise RuntimeError("Saved indexes are read-only; rebuild with index_corpus")
+
+def save_index(vectorstore: FAISS, path: str):
+    """Write the vectors as a plain FAISS file and the chunks to SQLite (no pickle)."""
+    os.makedirs(path, exist_ok=True)
+    faiss.write_index(vectorstore.index, os.path.join(path, VECTORS_FILE))
+    conn = sqlite3.connect(os.path.join(path, DOCSTORE_FILE))
+    try:
+        conn.execute(
+            "CREATE TABLE documents (position INTEGER PRIMARY KEY, id TEXT UNIQUE, page_content TEXT, metadata TEXT)"
+        )
+        rows = []
+        for position, doc_id in vectorstore.index_to_docstore_id.items():
+            doc = vectorstore.docstore.search(doc_id)
+            rows.append((position, doc_id, doc.page_content, json.dumps(doc.metadata, ensure_ascii=False)))
+        conn.executemany("INSERT INTO documents VALUES (?, ?, ?, ?)", rows)
+        conn.commit()
+    finally:
+        conn.close()
+
+@profiled
+def load_index(path: str) -> FAISS:
+    """Open a saved index, memory-mapping the vectors where FAISS supports it."""
+    vectors_path = os.path.join(path, VECTORS_FILE)
+    try:
+        index = faiss.read_index(vectors_path, MMAP_FLAGS)
+    except RuntimeError:
+        # Index types without mmap support are read into memory
+        index = faiss.read_index(vectors_path)
+    docstore = SQLiteDocstore(os.path.join(path, DOCSTORE_FILE))
+    return FAISS(embeddings, index, docstore, docstore.ids())
+
+def corpus_id(documents: List[Dict]) -> str:
+    """Content hash identifying a set of research documents, whatever their order."""
+    digest = hashlib.sha256()
+    for doc_key in sorted(json.dumps(
+        [doc.get("source"), doc.get("type"), doc.get("text")], ensure_ascii=False
+    ) for doc in documents):
+        digest.update(doc_key.encode("utf-8"))
+    return f"corpus_{digest.hexdigest()[:16]}"
+
 async def index_documents(session_id: str, documents: List[Dict]) -> str:
     """
     Process and index the documents from research.
-    Returns the path to the created FAISS index.
+    Returns the path to the FAISS index; one already stored for session_id is kept.
+    """
+    # Chunking and embedding are CPU bound; keep them off the event loop
+    return await asyncio.to_thread(_index_documents_sync, session_id, documents)
+
+async def index_corpus(documents: List[Dict]) -> Tuple[str, str]:
     """
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000, 
-        chunk_overlap=100
+    Index documents under their content hash so identical corpora share one index.
+    Returns (corpus_id, index_path).
+    """
+    cid = corpus_id(documents)
+    index_path = create_session_index_path(cid)
+    if not index_exists(index_path):
+        index_path = await index_documents(cid, documents)
+    return cid, index_path
+
+def link_session_index(session_id: str, index_path: str) -> str:
+    """Point a session at an existing index without re-embedding."""
+    session_path = create_session_index_path(session_id)
+    if os.path.abspath(session_path) == os.path.abspath(index_path):
+        return session_path
+    try:
+        os.symlink(os.path.abspath(index_path), session_path, target_is_directory=True)
+    except FileExistsError:
+        pass
+    except OSError:
+        # Filesystems without symlink support get a copy
+        shutil.copytree(index_path, session_path, dirs_exist_ok=True)
+    return session_path
+
+text_splitter = RecursiveCharacterTextSplitter(
+    chunk_size=1000, 
+    chunk_overlap=100
+)
+
+def _chunk_document(doc: Dict) -> List[Document]:
+    """Split a research document into LangChain Documents with source and type metadata."""
+    return text_splitter.create_documents(
+        texts=[doc["text"]],
+        metadatas=[{
+            "source": doc["source"], 
+            "type": doc.get("type", "unknown")
+        }]
     )
-    
-    # Convert to LangChain Document format with source and type metadata
+
+@profiled
+def _embed_document(doc: Dict) -> Tuple[List[Document], List[List[float]]]:
+    chunks = _chunk_document(doc)
+    return chunks, embeddings.embed_documents([chunk.page_content for chunk in chunks])
+
+def _discard_stale_index(index_path: str):
+    """Remove an incomplete or old-format index (or a dangling link) at index_path."""
+    try:
+        if os.path.islink(index_path):
+            os.unlink(index_path)
+        elif os.path.exists(index_path):
+            # Moved aside first, so the path is never half deleted
+            stale_path = f"{index_path}.stale-{uuid.uuid4().hex[:8]}"
+            os.rename(index_path, stale_path)
+            shutil.rmtree(stale_path, ignore_errors=True)
+    except FileNotFoundError:
+        pass
+
+def _write_index(index_path: str, vectorstore: FAISS) -> str:
+    # Indexes are written once: workers indexing the same corpus build the same
+    # index, so whichever finishes first wins and the others keep theirs unused
+    if index_exists(index_path):
+        return index_path
+    # Write to a temporary directory and rename it into place so readers never see a partial index
+    tmp_path = f"{index_path}.tmp-{uuid.uuid4().hex[:8]}"
+    try:
+        save_index(vectorstore, tmp_path)
+        if index_exists(index_path):
+            return index_path
+        _discard_stale_index(index_path)
+        try:
+            os.rename(tmp_path, index_path)
+        except OSError:
+            # Another writer renamed its index into place first
+            if not index_exists(index_path):
+                raise
+    finally:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+    return index_path
+
+@profiled
+def _index_documents_sync(session_id: str, documents: List[Dict]) -> str:
     docs = []
     for doc in documents:
-        chunks = text_splitter.create_documents(
-            texts=[doc["text"]],
-            metadatas=[{
-                "source": doc["source"], 
-                "type": doc.get("type", "unknown")
-            }]
-        )
-        docs.extend(chunks)
+        docs.extend(_chunk_document(doc))
     
     # Create vector store
-    index_path = create_session_index_path(session_id)
     vectorstore = FAISS.from_documents(docs, embeddings)
-    vectorstore.save_local(index_path)
+    return _write_index(create_session_index_path(session_id), vectorstore)
+
+@profiled
+def _index_embedded_sync(index_path: str, embedded: List[Tuple[List[Document], List[List[float]]]]) -> str:
+    chunks = [chunk for doc_chunks, _ in embedded for chunk in doc_chunks]
+    vectors = [vector for _, doc_vectors in embedded for vector in doc_vectors]
+    vectorstore = FAISS.from_embeddings(
+        list(zip([chunk.page_content for chunk in chunks], vectors)),
+        embeddings,
+        metadatas=[chunk.metadata for chunk in chunks]
+    )
+    return _write_index(index_path, vectorstore)
+
+async def index_stream(documents: AsyncIterator[Dict]) -> Tuple[List[Dict], str, str]:
+    """
+    Chunk and embed documents as they arrive, overlapping embedding with the
+    research still in progress, then index them under their corpus hash.
+    Returns (documents, corpus_id, index_path).
+    """
+    received, embedding = [], []
+    try:
+        async for doc in documents:
+            received.append(doc)
+            embedding.append(asyncio.ensure_future(asyncio.to_thread(_embed_document, doc)))
+        embedded = await asyncio.gather(*embedding)
+    finally:
+        for task in embedding:
+            if task.done() and not task.cancelled():
+                task.exception()
+            task.cancel()
     
-    return index_path
+    cid = corpus_id(received)
+    index_path = create_session_index_path(cid)
+    if not index_exists(index_path):
+        await asyncio.to_thread(_index_embedded_sync, index_path, embedded)
+    return received, cid, index_path
 
+@profiled
 def get_session_index(session_id: str) -> FAISS:
-    """Retrieve the FAISS index for a session."""
+    """Retrieve the FAISS index for a session, reusing a loaded copy when it is unchanged."""
+    index_path = create_session_index_path(session_id)
+    if not index_exists(index_path):
+        return None
+    
+    # Sessions linked to the same corpus resolve to the same real path and share one copy
+    real_path = os.path.realpath(index_path)
+    key = (real_path, os.path.getmtime(real_path))
+    with _index_cache_lock:
+        vectorstore = _index_cache.get(key)
+        if vectorstore is not None:
+            _index_cache.move_to_end(key)
+            return vectorstore
+    
+    vectorstore = load_index(real_path)
+    with _index_cache_lock:
+        _index_cache[key] = vectorstore
+        while len(_index_cache) > INDEX_CACHE_SIZE:
+            _index_cache.popitem(last=False)
+    return vectorstore
+
+def get_session_corpus_id(session_id: str) -> str:
+    """Identify the corpus behind a session's index, for caching derived results."""
     index_path = create_session_index_path(session_id)
-    if os.path.exists(index_path):
-        return FAISS.load_local(index_path, embeddings, allow_dangerous_deserialization=True)
-    return None
\ No newline at end of file
+    target = os.path.basename(os.path.realpath(index_path))
+    if target.startswith("corpus_"):
+        return target
+    # Indexes built directly for a session are identified by their build time
+    return f"{session_id}@{os.path.getmtime(index_path) if os.path.exists(index_path) else 0}"
\ No newline at end of file
@@ -0,0 +1,226 @@
+"""
+Asynchronous jobs for long-running work such as research and report generation.
+
+Submitting a job returns immediately with its ID. A fixed pool of worker tasks
+takes jobs from a priority queue; clients poll for status and progress and may
+cancel queued or running jobs.
+
+With a shared job store (see backend.store), job snapshots are also written
+there, so any worker process can report on or cancel any job.
+"""
+import asyncio
+import itertools
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from backend.profiling import fork_profile, profile_context
+from backend.ratelimit import BACKGROUND, INTERACTIVE, llm_priority
+
+QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED = "queued", "running", "succeeded", "failed", "cancelled"
+FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+PRIORITIES = {"interactive": INTERACTIVE, "background": BACKGROUND}
+
+
+class JobCancelled(Exception):
+    """Raised inside a job's work when the job has been cancelled."""
+
+
+class Job:
+    def __init__(self, kind: str, priority: int, params: Optional[Dict] = None, store=None):
+        self.id = f"job_{uuid.uuid4().hex[:12]}"
+        self.kind = kind
+        self.priority = priority
+        self.params = params or {}
+        self.status = QUEUED
+        self.progress = 0.0
+        self.message = "Queued"
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.cancel_requested = False
+        self.task: Optional[asyncio.Task] = None
+        self.store = store
+        # Set when the job was submitted by a profiled request
+        self.profile = None
+
+    def update(self, progress: float, message: str = None):
+        """Report progress; safe to call from worker threads. Raises JobCancelled if cancelled."""
+        if self.store is not None and not self.cancel_requested:
+            # Another worker process may have received the cancel request
+            self.cancel_requested = self.store.cancel_requested(self.id)
+        if self.cancel_requested:
+            raise JobCancelled(self.id)
+        self.progress = max(self.progress, min(1.0, progress))
+        if message:
+            self.message = message
+        self.save()
+
+    def save(self):
+        if self.store is not None:
+            self.store.save(self.to_dict())
+
+    def to_dict(self, include_result: bool = True) -> Dict:
+        info = {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "progress": round(self.progress, 3),
+            "message": self.message,
+            "params": self.params,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+        if self.error:
+            info["error"] = self.error
+        if include_result and self.status == SUCCEEDED:
+            info["result"] = self.result
+        return info
+
+
+class JobManager:
+    def __init__(self, workers: int = 4, retention: float = 3600.0, store=None):
+        self.workers = workers
+        self.retention = retention
+        self.store = store
+        self.jobs: Dict[str, Job] = {}
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._counter = itertools.count()
+        self._worker_tasks = []
+
+    def start(self):
+        if self._queue is None:
+            self._queue = asyncio.PriorityQueue()
+            self._worker_tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        # Jobs still queued will never run; don't leave clients polling them
+        for job in self.jobs.values():
+            if job.status == QUEUED:
+                self._finish(job, CANCELLED, message="Server shutting down")
+        self._worker_tasks = []
+        self._queue = None
+
+    def submit(self, kind: str, work: Callable[[Job], Awaitable[Any]], priority: int = INTERACTIVE,
+               params: Optional[Dict] = None) -> Job:
+        self.start()
+        self._prune()
+        job = Job(kind, priority, params, store=self.store)
+        job.profile = fork_profile(job.id, kind)
+        self.jobs[job.id] = job
+        job.save()
+        self._queue.put_nowait((priority, next(self._counter), job.id, work))
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.jobs.get(job_id)
+
+    def info(self, job_id: str, include_result: bool = True) -> Optional[Dict]:
+        """Status of a job run by this process or, with a shared store, by any worker."""
+        job = self.jobs.get(job_id)
+        if job is not None:
+            return job.to_dict(include_result)
+        if self.store is not None:
+            info = self.store.load(job_id)
+            if info is not None and not include_result:
+                info.pop("result", None)
+            return info
+        return None
+
+    def cancel(self, job_id: str) -> Optional[Dict]:
+        """Cancel a queued or running job; returns its status, or None if it is unknown."""
+        job = self.jobs.get(job_id)
+        if job is None:
+            info = self.info(job_id, include_result=False)
+            if info is not None and info["status"] not in FINISHED:
+                # The owning worker stops the job at its next progress update
+                self.store.request_cancel(job_id)
+            return info
+        if job.status not in FINISHED:
+            job.cancel_requested = True
+            if self.store is not None:
+                self.store.request_cancel(job_id)
+            if job.status == QUEUED:
+                self._finish(job, CANCELLED, message="Cancelled before start")
+            elif job.task is not None:
+                job.task.cancel()
+        return job.to_dict(include_result=False)
+
+    @property
+    def active(self) -> int:
+        """Interactive jobs queued or running in this process."""
+        return sum(1 for job in self.jobs.values() if job.status in (QUEUED, RUNNING) and job.priority <= INTERACTIVE)
+
+    def stats(self) -> Dict:
+        counts = {}
+        for job in self.jobs.values():
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return {"workers": self.workers, "queued": self._queue.qsize() if self._queue else 0, **counts}
+
+    def _finish(self, job: Job, status: str, message: str = None, error: str = None):
+        job.status = status
+        job.finished_at = time.time()
+        if message:
+            job.message = message
+        if error:
+            job.error = error
+        job.save()
+
+    def _prune(self):
+        cutoff = time.time() - self.retention
+        for job_id in [j.id for j in self.jobs.values() if j.finished_at and j.finished_at < cutoff]:
+            del self.jobs[job_id]
+        if self.store is not None:
+            self.store.prune(cutoff)
+
+    async def _worker(self):
+        while True:
+            priority, _, job_id, work = await self._queue.get()
+            job = self.jobs.get(job_id)
+            if job is None or job.status != QUEUED:
+                continue
+            if self.store is not None and self.store.cancel_requested(job_id):
+                job.cancel_requested = True
+                self._finish(job, CANCELLED, message="Cancelled before start")
+                continue
+            job.status = RUNNING
+            job.started_at = time.time()
+            job.message = "Running"
+            job.save()
+            if job.profile is not None:
+                job.profile.start()
+            with llm_priority(priority), profile_context(job.profile):
+                job.task = asyncio.create_task(work(job))
+            try:
+                job.result = await job.task
+                job.progress = 1.0
+                self._finish(job, SUCCEEDED, message="Done")
+            except (asyncio.CancelledError, JobCancelled):
+                if not job.cancel_requested:
+                    # The worker itself is being shut down
+                    self._finish(job, CANCELLED, message="Server shutting down")
+                    raise
+                self._finish(job, CANCELLED, message="Cancelled")
+            except Exception as e:
+                self._finish(job, FAILED, message="Failed", error=str(e))
+            finally:
+                job.task = None
+                if job.profile is not None:
+                    self._finish_profile(job)
+
+    def _finish_profile(self, job: Job):
+        # Jobs that create a session (research) return its ID
+        if job.profile.session_id is None and isinstance(job.result, dict):
+            job.profile.session_id = job.result.get("session_id")
+        try:
+            job.profile.finish()
+        except OSError as e:
+            print(f"Saving the profile of {job.id} failed: {str(e)}")
+        job.profile = None
@@ -0,0 +1,258 @@
+"""
+Full text of arXiv papers for research, instead of their abstracts.
+
+PDFs are downloaded a few at a time with a size cap and timeouts, or read from
+ARXIV_PDF_DIR when it is set (e.g. local fixtures, with no network access).
+Text extraction parses the PDF with pypdf in a process pool, so the CPU-heavy
+parsing runs outside the event loop and outside the GIL of the serving
+process. The pool's processes are started by a fork server (or spawned), not
+forked from the server process, whose threads may hold locks a forked child
+would inherit. Extracted text is cached on disk by arXiv ID; IDs include the
+paper version, so a cached text never goes stale. The cache keeps at most
+ARXIV_CACHE_MAX_FILES texts, evicting the least recently used, and drops texts
+not used for ARXIV_CACHE_MAX_AGE seconds.
+
+Disabled unless ARXIV_FULL_TEXT=1; papers then keep their abstracts.
+"""
+import asyncio
+import multiprocessing
+import os
+import re
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional
+
+import httpx
+
+ENABLED = os.getenv("ARXIV_FULL_TEXT", "0") == "1"
+# Directory of <arxiv id>.pdf files used instead of downloading (e.g. test fixtures)
+PDF_DIR = os.getenv("ARXIV_PDF_DIR")
+CACHE_DIR = os.getenv("ARXIV_CACHE_DIR", os.path.join(os.path.dirname(__file__), "../arxiv_cache"))
+CACHE_MAX_FILES = int(os.getenv("ARXIV_CACHE_MAX_FILES", "2000"))
+CACHE_MAX_AGE = float(os.getenv("ARXIV_CACHE_MAX_AGE", str(30 * 24 * 3600)))
+# arXiv asks automated clients to keep request rates low
+CONCURRENCY = int(os.getenv("ARXIV_FETCH_CONCURRENCY", "2"))
+TIMEOUT = float(os.getenv("ARXIV_FETCH_TIMEOUT", "30"))
+MAX_BYTES = int(os.getenv("ARXIV_MAX_PDF_BYTES", str(20 * 1024 * 1024)))
+# Pages parsed and characters of text kept per paper
+MAX_PAGES = int(os.getenv("ARXIV_MAX_PAGES", "30"))
+MAX_CHARS = int(os.getenv("ARXIV_MAX_CHARS", "60000"))
+EXTRACT_WORKERS = int(os.getenv("ARXIV_EXTRACT_WORKERS", str(min(2, os.cpu_count() or 1))))
+# Forking a threaded server process can deadlock the child on a lock some other
+# thread held at fork time (e.g. in torch, FAISS or logging)
+START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+USER_AGENT = "Mozilla/5.0 (compatible; EILA research assistant)"
+
+_ARXIV_ID = re.compile(r"arxiv\.org/(?:abs|pdf)/(.+?)(?:\.pdf)?$")
+
+
+def arxiv_id(entry_id: str) -> Optional[str]:
+    """The ID (with version) in an arXiv URL, e.g. 2401.01234v2 or math/0501001v1."""
+    match = _ARXIV_ID.search(entry_id or "")
+    return match.group(1) if match else None
+
+
+def _file_name(paper_id: str) -> str:
+    # Old-style IDs contain a slash (math/0501001v1)
+    return paper_id.replace("/", "_")
+
+
+def prune_cache(cache_dir: str = CACHE_DIR, max_files: int = CACHE_MAX_FILES,
+                max_age: float = CACHE_MAX_AGE) -> int:
+    """Delete expired texts, then the least recently used beyond max_files. Returns the number deleted."""
+    files = []
+    for entry in os.scandir(cache_dir):
+        if entry.is_file() and entry.name.endswith(".txt"):
+            try:
+                files.append((entry.stat().st_mtime, entry.path))
+            except FileNotFoundError:
+                continue
+    files.sort(reverse=True)
+    cutoff = time.time() - max_age
+    stale = [path for i, (mtime, path) in enumerate(files) if i >= max_files or mtime < cutoff]
+    for path in stale:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    return len(stale)
+
+
+def extract_pdf_text(data: bytes, max_pages: int = MAX_PAGES, max_chars: int = MAX_CHARS) -> str:
+    """Plain text of a PDF's first pages. Runs in a worker process."""
+    import io
+
+    from pypdf import PdfReader
+
+    reader = PdfReader(io.BytesIO(data))
+    pages, size = [], 0
+    for page in reader.pages[:max_pages]:
+        text = page.extract_text() or ""
+        # Rejoin words hyphenated across line breaks and collapse layout whitespace
+        text = re.sub(r"-\n(\w)", r"\1", text)
+        text = re.sub(r"[ \t]+", " ", text)
+        text = re.sub(r"\n{3,}", "\n\n", text).strip()
+        pages.append(text)
+        size += len(text)
+        if size >= max_chars:
+            break
+    return "\n\n".join(pages)[:max_chars]
+
+
+class PaperFetcher:
+    def __init__(self, pdf_dir: Optional[str] = PDF_DIR, cache_dir: str = CACHE_DIR,
+                 concurrency: int = CONCURRENCY, timeout: float = TIMEOUT, max_bytes: int = MAX_BYTES,
+                 workers: int = EXTRACT_WORKERS, cache_max_files: int = CACHE_MAX_FILES,
+                 cache_max_age: float = CACHE_MAX_AGE):
+        self.pdf_dir = pdf_dir
+        self.cache_dir = cache_dir
+        self.cache_max_files = cache_max_files
+        self.cache_max_age = cache_max_age
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.workers = workers
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loop = None
+        self._limit: Optional[asyncio.Semaphore] = None
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+        self.stats = {"extracted": 0, "cached": 0, "missing": 0, "errors": 0}
+
+    def _loop_state(self):
+        # The client and semaphore belong to one event loop (e.g. one per worker process)
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._client = None
+            self._limit = asyncio.Semaphore(self.concurrency)
+            self._loop = loop
+        return self._limit
+
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout, connect=min(self.timeout, 5.0)),
+                follow_redirects=True,
+                headers={"User-Agent": USER_AGENT},
+            )
+        return self._client
+
+    def pool(self) -> ProcessPoolExecutor:
+        # Started on first use, so each forked server worker gets its own
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context(START_METHOD)
+                )
+            return self._pool
+
+    async def close(self):
+        if self._client is not None and self._loop is asyncio.get_running_loop():
+            await self._client.aclose()
+        self._client = None
+
+    def shutdown(self):
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+    def _cache_path(self, paper_id: str) -> str:
+        return os.path.join(self.cache_dir, f"{_file_name(paper_id)}.txt")
+
+    def _read_cached(self, paper_id: str) -> Optional[str]:
+        path = self._cache_path(paper_id)
+        try:
+            with open(path, encoding="utf-8") as f:
+                text = f.read()
+            # The modification time records when the text was last used
+            os.utime(path)
+        except FileNotFoundError:
+            # Not cached yet, or just pruned
+            return None
+        return text
+
+    def _write_cached(self, paper_id: str, text: str):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._cache_path(paper_id)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+        prune_cache(self.cache_dir, self.cache_max_files, self.cache_max_age)
+
+    def _read_fixture(self, paper_id: str) -> Optional[bytes]:
+        for name in (_file_name(paper_id), _file_name(re.sub(r"v\d+$", "", paper_id))):
+            path = os.path.join(self.pdf_dir, f"{name}.pdf")
+            if os.path.exists(path):
+                with open(path, "rb") as f:
+                    return f.read(self.max_bytes)
+        return None
+
+    async def _download(self, paper_id: str) -> Optional[bytes]:
+        url = f"https://arxiv.org/pdf/{paper_id}"
+        async with self.client().stream("GET", url) as response:
+            if response.status_code != 200:
+                print(f"Fetching {url} failed: HTTP {response.status_code}")
+                return None
+            body = bytearray()
+            async for chunk in response.aiter_bytes():
+                body.extend(chunk)
+                if len(body) > self.max_bytes:
+                    print(f"Skipping {url}: larger than {self.max_bytes} bytes")
+                    return None
+            return bytes(body)
+
+    async def fetch(self, entry_id: str) -> Optional[str]:
+        """Full text of a paper, or None if it cannot be fetched or parsed."""
+        paper_id = arxiv_id(entry_id)
+        if not paper_id:
+            return None
+        limit = self._loop_state()
+        cached = await asyncio.to_thread(self._read_cached, paper_id)
+        if cached is not None:
+            self.stats["cached"] += 1
+            return cached
+
+        try:
+            if self.pdf_dir:
+                data = await asyncio.to_thread(self._read_fixture, paper_id)
+            else:
+                async with limit:
+                    data = await self._download(paper_id)
+            if data is None:
+                self.stats["missing"] += 1
+                return None
+            text = await asyncio.get_running_loop().run_in_executor(self.pool(), extract_pdf_text, data)
+        except (httpx.HTTPError, OSError, BrokenProcessPool) as e:
+            self.stats["errors"] += 1
+            print(f"Getting full text of {paper_id} failed: {str(e)}")
+            if isinstance(e, BrokenProcessPool):
+                self.shutdown()
+            return None
+        except Exception as e:
+            # Malformed PDFs raise a variety of pypdf errors
+            self.stats["errors"] += 1
+            print(f"Extracting text of {paper_id} failed: {str(e)}")
+            return None
+
+        self.stats["extracted"] += 1
+        if text:
+            await asyncio.to_thread(self._write_cached, paper_id, text)
+        return text
+
+    async def enrich(self, documents: List[Dict]) -> List[Dict]:
+        """Replace arXiv abstracts with the papers' full text where it can be extracted."""
+        texts = await asyncio.gather(*(self.fetch(doc.get("source")) for doc in documents))
+        enriched = []
+        for doc, text in zip(documents, texts):
+            if text and len(text) > len(doc.get("text") or ""):
+                doc = {**doc, "text": text, "abstract": doc.get("text")}
+            enriched.append(doc)
+        return enriched
+
+
+paper_fetcher = PaperFetcher()
@@ -0,0 +1,210 @@
+"""
+Background pre-warming of research results and indexes for popular topics.
+
+Topics come from recent /research traffic plus a seed list. The pre-warmer
+only runs while no live requests or interactive jobs are in flight, spends at most a fraction of
+wall time on its own work, and is capped at a number of research runs per
+hour so it never eats into the SerpAPI quota needed by live users.
+"""
+import asyncio
+import os
+import time
+from collections import Counter, OrderedDict, deque
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from backend.ratelimit import BACKGROUND, llm_priority
+
+# Same examples as the Streamlit start page
+DEFAULT_SEED_TOPICS = [
+    "Machine Learning Algorithms",
+    "Renewable Energy Technologies",
+    "Blockchain and Cryptocurrencies",
+    "Modern Art Movements",
+    "Quantum Computing",
+    "Climate Change Mitigation",
+    "Ancient Civilizations",
+]
+
+DEFAULT_OBJECTIVES = ["Understand basic concepts", "Learn practical applications"]
+
+
+def normalize_topic(topic: str) -> str:
+    return " ".join(topic.lower().split())
+
+
+def research_key(topic: str, objectives: List[str]) -> str:
+    """Cache key for researching a topic towards the given objectives."""
+    return "\0".join([normalize_topic(topic)] + [normalize_topic(o) for o in objectives if o.strip()])
+
+
+class ResearchCache:
+    """Research results (or index locations) keyed by normalized topic or query, with a TTL."""
+
+    def __init__(self, ttl: float, max_entries: int = 256):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[Dict]:
+        entry = self._entries.get(key)
+        if entry is None or time.time() - entry["fetched_at"] > self.ttl:
+            return None
+        self._entries.move_to_end(key)
+        return entry["value"]
+
+    def put(self, key: str, value: Dict):
+        self._entries[key] = {"value": value, "fetched_at": time.time()}
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def age(self, key: str) -> Optional[float]:
+        entry = self._entries.get(key)
+        return time.time() - entry["fetched_at"] if entry else None
+
+
+class PreWarmer:
+    def __init__(
+        self,
+        research: Callable[[str, List[str]], Awaitable[Dict]],
+        cache: ResearchCache,
+        seed_topics: List[str],
+        enabled: bool = False,
+        interval: float = 30.0,
+        window: float = 3600.0,
+        top_n: int = 10,
+        max_per_hour: int = 20,
+        cpu_fraction: float = 0.25,
+        refresh_at: float = 0.8,
+        active_jobs: Optional[Callable[[], int]] = None,
+    ):
+        self.research = research
+        self.cache = cache
+        self.seed_topics = seed_topics
+        self.enabled = enabled
+        self.interval = interval
+        self.window = window
+        self.top_n = top_n
+        self.max_per_hour = max_per_hour
+        self.cpu_fraction = min(max(cpu_fraction, 0.01), 1.0)
+        self.refresh_at = refresh_at
+        # Live work that runs outside a request, e.g. queued and running interactive jobs
+        self.active_jobs = active_jobs or (lambda: 0)
+
+        self.live_requests = 0
+        self._recent = deque()  # (timestamp, normalized topic)
+        self._display = {}  # normalized topic -> topic as typed
+        self._runs = deque()  # timestamps of pre-warm runs
+        self._task = None
+        self.stats = {"warmed": 0, "skipped_busy": 0, "skipped_budget": 0, "errors": 0}
+
+    def record(self, topic: str):
+        """Note a topic requested by live traffic."""
+        key = normalize_topic(topic)
+        self._recent.append((time.time(), key))
+        self._display.setdefault(key, topic.strip())
+
+    def popular_topics(self) -> List[str]:
+        cutoff = time.time() - self.window
+        while self._recent and self._recent[0][0] < cutoff:
+            self._recent.popleft()
+        counts = Counter(key for _, key in self._recent)
+        return [self._display[key] for key, _ in counts.most_common(self.top_n)]
+
+    def candidates(self) -> List[str]:
+        """Topics whose cached research is missing or close to expiring, most popular first."""
+        topics = []
+        seen = set()
+        for topic in self.popular_topics() + self.seed_topics:
+            key = normalize_topic(topic)
+            if key in seen:
+                continue
+            seen.add(key)
+            age = self.cache.age(research_key(topic, DEFAULT_OBJECTIVES))
+            if age is None or age > self.cache.ttl * self.refresh_at:
+                topics.append(topic)
+        return topics
+
+    def busy(self) -> bool:
+        return self.live_requests + self.active_jobs() > 0
+
+    def _within_budget(self) -> bool:
+        cutoff = time.time() - 3600
+        while self._runs and self._runs[0] < cutoff:
+            self._runs.popleft()
+        return len(self._runs) < self.max_per_hour
+
+    async def warm(self, topic: str):
+        start = time.monotonic()
+        self._runs.append(time.time())
+        try:
+            with llm_priority(BACKGROUND):
+                value = await self.research(topic, DEFAULT_OBJECTIVES)
+            self.cache.put(research_key(topic, DEFAULT_OBJECTIVES), value)
+            self.stats["warmed"] += 1
+        except Exception as e:
+            self.stats["errors"] += 1
+            print(f"Pre-warming '{topic}' failed: {str(e)}")
+        # Duty cycle: rest long enough that pre-warming uses at most cpu_fraction of the time
+        elapsed = time.monotonic() - start
+        await asyncio.sleep(elapsed * (1 / self.cpu_fraction - 1))
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            topics = self.candidates()
+            if not topics:
+                continue
+            if self.busy():
+                self.stats["skipped_busy"] += 1
+                continue
+            if not self._within_budget():
+                self.stats["skipped_budget"] += 1
+                continue
+            await self.warm(topics[0])
+
+    def start(self):
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def status(self) -> Dict:
+        return {
+            "enabled": self.enabled,
+            "live_requests": self.live_requests,
+            "active_jobs": self.active_jobs(),
+            "popular_topics": self.popular_topics(),
+            "pending": self.candidates(),
+            "runs_last_hour": len(self._runs),
+            **self.stats,
+        }
+
+
+def create_prewarmer(research: Callable[[str, List[str]], Awaitable[Dict]],
+                     active_jobs: Optional[Callable[[], int]] = None) -> PreWarmer:
+    """Build a PreWarmer configured from the environment."""
+    seeds = os.getenv("PREWARM_TOPICS")
+    seed_topics = [t.strip() for t in seeds.split(",") if t.strip()] if seeds is not None else DEFAULT_SEED_TOPICS
+    cache = ResearchCache(ttl=float(os.getenv("RESEARCH_CACHE_TTL", str(6 * 3600))))
+    return PreWarmer(
+        research,
+        cache,
+        seed_topics,
+        enabled=os.getenv("PREWARM_ENABLED", "0") == "1",
+        interval=float(os.getenv("PREWARM_INTERVAL", "30")),
+        top_n=int(os.getenv("PREWARM_TOP_N", "10")),
+        max_per_hour=int(os.getenv("PREWARM_MAX_PER_HOUR", "20")),
+        cpu_fraction=float(os.getenv("PREWARM_CPU_FRACTION", "0.25")),
+        active_jobs=active_jobs,
+    )
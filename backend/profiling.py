@@ -0,0 +1,346 @@
+"""
+On-demand sampling profiles of individual requests.
+
+A request is profiled when it carries an "X-Profile: 1" header, or at random
+with probability PROFILE_SAMPLE_RATE. While it runs, a sampler thread records
+the Python stacks of the threads doing its work every PROFILE_INTERVAL seconds:
+
+- worker threads, while they are inside a function marked @profiled (report
+  generation, embedding, index loading) on behalf of the request
+- the event loop thread, whenever it is busy; with concurrent requests its
+  samples may include their work too
+
+Profiles are written in the folded-stack format read by flamegraph.pl,
+speedscope and inferno, to PROFILE_DIR/<session>/<request>.folded, and are
+served by GET /profiles. The response of a profiled request carries its
+X-Profile-Id. At most PROFILE_MAX_FILES profiles are kept, and none older
+than PROFILE_MAX_AGE seconds.
+
+Endpoints that queue a job (/jobs/*, /batch) respond before the job runs, so
+their own profile only covers the submission. The job gets a profile of its
+own, <job id>.folded in the same session, sampled while the job runs.
+
+When a request is not profiled the middleware passes it straight through, and
+@profiled functions only check a context variable.
+"""
+import contextlib
+import contextvars
+import functools
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from typing import Callable, Dict, List, Optional
+from urllib.parse import parse_qs
+
+SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.005"))
+# Sampling stops after this long, e.g. for a stuck streaming response
+MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "600"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(os.path.dirname(__file__), "../profiles"))
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "200"))
+PROFILE_MAX_AGE = float(os.getenv("PROFILE_MAX_AGE", str(7 * 24 * 3600)))
+
+PROFILE_HEADER = b"x-profile"
+REQUEST_ID_HEADER = b"x-request-id"
+NO_SESSION = "no-session"
+# Bytes of a JSON response kept to find its session ID
+MAX_RESPONSE_PEEK = 1 << 20
+
+_SAFE_ID = re.compile(r"[\w-]{1,64}")
+_SESSION_PATH = re.compile(r"/(?:session|export)/([\w-]+)")
+# Innermost Python frames of an idle event loop thread: waiting in the selector
+# for I/O, or (with uvloop, whose loop is native code) in the loop runner itself
+_IDLE_LEAVES = {"select", "poll", "run", "run_forever", "run_until_complete"}
+
+_current: contextvars.ContextVar = contextvars.ContextVar("request_profile", default=None)
+
+
+def _frame_label(code) -> str:
+    path = code.co_filename
+    marker = path.rfind("site-packages" + os.sep)
+    if marker != -1:
+        path = path[marker + len("site-packages") + 1:]
+    else:
+        path = os.path.relpath(path, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        if path.startswith(".."):
+            path = os.path.basename(code.co_filename)
+    return f"{code.co_name} ({path}:{code.co_firstlineno})"
+
+
+def fold_stack(frame, root: str) -> str:
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame.f_code))
+        frame = frame.f_back
+    labels.append(root)
+    # Folded stacks list frames root first, separated by semicolons
+    return ";".join(reversed(labels)).replace("\n", " ")
+
+
+class RequestProfile:
+    def __init__(self, request_id: str, method: str, path: str, interval: float = INTERVAL,
+                 profile_dir: str = PROFILE_DIR):
+        self.request_id = request_id
+        self.method = method
+        self.path = path
+        self.session_id: Optional[str] = None
+        self.interval = interval
+        self.profile_dir = profile_dir
+        self.samples: Counter = Counter()
+        self.loop_thread = threading.get_ident()
+        self._threads: Counter = Counter()  # thread ident -> active @profiled calls
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+        self.started_at = time.monotonic()
+        self.seconds = 0.0
+
+    def enter(self):
+        with self._lock:
+            self._threads[threading.get_ident()] += 1
+
+    def exit(self):
+        ident = threading.get_ident()
+        with self._lock:
+            self._threads[ident] -= 1
+            if self._threads[ident] <= 0:
+                del self._threads[ident]
+
+    def start(self):
+        self._sampler = threading.Thread(target=self._run, name=f"profiler-{self.request_id}", daemon=True)
+        self._sampler.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+        self.seconds = time.monotonic() - self.started_at
+
+    def _run(self):
+        deadline = time.monotonic() + MAX_SECONDS
+        while not self._stop.wait(self.interval) and time.monotonic() < deadline:
+            self.sample()
+
+    def sample(self):
+        frames = sys._current_frames()
+        with self._lock:
+            workers = list(self._threads)
+        loop_frame = frames.get(self.loop_thread)
+        if loop_frame is not None and loop_frame.f_code.co_name not in _IDLE_LEAVES:
+            self.samples[fold_stack(loop_frame, "event-loop")] += 1
+        for ident in workers:
+            frame = frames.get(ident)
+            if frame is not None and ident != self.loop_thread:
+                self.samples[fold_stack(frame, "worker")] += 1
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+    def save(self, profile_dir: Optional[str] = None) -> str:
+        path = profile_path(self.session_id or NO_SESSION, self.request_id, profile_dir or self.profile_dir)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(self.folded())
+        return path
+
+    def finish(self) -> str:
+        """Stop sampling, save the profile and prune old ones. Returns the saved path."""
+        self.stop()
+        if self.session_id is not None and not _SAFE_ID.fullmatch(self.session_id):
+            self.session_id = None
+        path = self.save()
+        prune_profiles(self.profile_dir)
+        print(f"Profiled {self.method} {self.path} in {self.seconds:.2f}s: "
+              f"{sum(self.samples.values())} samples in {path}")
+        return path
+
+
+def profiled(fn: Callable) -> Callable:
+    """Include the calling thread in the current request's profile, if there is one."""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        profile = _current.get()
+        if profile is None:
+            return fn(*args, **kwargs)
+        profile.enter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            profile.exit()
+    return wrapper
+
+
+def fork_profile(request_id: str, path: str) -> Optional[RequestProfile]:
+    """
+    A new profile for work that the current profiled request hands off to run
+    after it responds (e.g. a job), or None if the request is not profiled.
+    Start it when the work starts and run the work inside profile_context.
+    """
+    parent = _current.get()
+    if parent is None:
+        return None
+    profile = RequestProfile(request_id, "JOB", path, parent.interval, parent.profile_dir)
+    profile.session_id = parent.session_id
+    return profile
+
+
+@contextlib.contextmanager
+def profile_context(profile: Optional[RequestProfile]):
+    """Record @profiled calls of the tasks and threads started inside into profile."""
+    if profile is None:
+        yield
+        return
+    token = _current.set(profile)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def profile_path(session_id: str, request_id: str, profile_dir: str = PROFILE_DIR) -> str:
+    if not _SAFE_ID.fullmatch(session_id) or not _SAFE_ID.fullmatch(request_id):
+        raise ValueError("Invalid profile ID")
+    return os.path.join(profile_dir, session_id, f"{request_id}.folded")
+
+
+def list_profiles(session_id: Optional[str] = None, profile_dir: str = PROFILE_DIR) -> List[Dict]:
+    """Saved profiles, newest first."""
+    if session_id is not None and not _SAFE_ID.fullmatch(session_id):
+        return []
+    profiles = []
+    sessions = [session_id] if session_id else (os.listdir(profile_dir) if os.path.isdir(profile_dir) else [])
+    for session in sessions:
+        directory = os.path.join(profile_dir, session)
+        try:
+            names = os.listdir(directory)
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+        for name in names:
+            if not name.endswith(".folded"):
+                continue
+            path = os.path.join(directory, name)
+            request_id = name[:-len(".folded")]
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                # Pruned by another worker
+                continue
+            profiles.append({
+                "session_id": session,
+                "request_id": request_id,
+                "bytes": stat.st_size,
+                "created_at": stat.st_mtime,
+                "url": f"/profiles/{session}/{request_id}",
+            })
+    return sorted(profiles, key=lambda p: p["created_at"], reverse=True)
+
+
+def prune_profiles(profile_dir: str = PROFILE_DIR, max_files: int = PROFILE_MAX_FILES,
+                   max_age: float = PROFILE_MAX_AGE) -> int:
+    """Delete expired profiles, then the oldest beyond max_files. Returns the number deleted."""
+    profiles = list_profiles(profile_dir=profile_dir)
+    cutoff = time.time() - max_age
+    stale = [p for i, p in enumerate(profiles) if i >= max_files or p["created_at"] < cutoff]
+    for profile in stale:
+        try:
+            os.remove(profile_path(profile["session_id"], profile["request_id"], profile_dir))
+        except (FileNotFoundError, ValueError):
+            pass
+    for session in {p["session_id"] for p in stale}:
+        try:
+            os.rmdir(os.path.join(profile_dir, session))
+        except OSError:
+            # Still holds newer profiles
+            pass
+    return len(stale)
+
+
+def _json_session(body: bytes) -> Optional[str]:
+    try:
+        data = json.loads(body)
+    except ValueError:
+        return None
+    session_id = data.get("session_id") if isinstance(data, dict) else None
+    return session_id if isinstance(session_id, str) else None
+
+
+def _request_session(scope: Dict, body: bytes) -> Optional[str]:
+    match = _SESSION_PATH.search(scope.get("path", ""))
+    if match:
+        return match.group(1)
+    query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+    if query.get("session_id"):
+        return query["session_id"][0]
+    return _json_session(body) if body else None
+
+
+class ProfilingMiddleware:
+    """ASGI middleware that samples requests asking for it (or chosen by PROFILE_SAMPLE_RATE)."""
+
+    def __init__(self, app, sample_rate: float = SAMPLE_RATE, profile_dir: str = PROFILE_DIR):
+        self.app = app
+        self.sample_rate = sample_rate
+        self.profile_dir = profile_dir
+
+    def _wanted(self, headers: List) -> bool:
+        for name, value in headers:
+            if name == PROFILE_HEADER:
+                return value.lower() in (b"1", b"true", b"yes")
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._wanted(scope["headers"]):
+            return await self.app(scope, receive, send)
+
+        request_id = dict(scope["headers"]).get(REQUEST_ID_HEADER, b"").decode("latin-1")
+        if not _SAFE_ID.fullmatch(request_id):
+            request_id = uuid.uuid4().hex[:12]
+        profile = RequestProfile(request_id, scope["method"], scope["path"], profile_dir=self.profile_dir)
+
+        # Read the body up front to find the session; the app gets it replayed
+        messages, body = [], b""
+        while True:
+            message = await receive()
+            messages.append(message)
+            if message["type"] != "http.request":
+                break
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+        profile.session_id = _request_session(scope, body)
+
+        async def replay():
+            return messages.pop(0) if messages else await receive()
+
+        # Endpoints that create a session (e.g. /research) return its ID
+        response = {"json": False, "body": b""}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                response["json"] = any(
+                    name == b"content-type" and value.startswith(b"application/json")
+                    for name, value in headers
+                )
+                headers.append((b"x-profile-id", request_id.encode()))
+                message = {**message, "headers": headers}
+            elif (message["type"] == "http.response.body" and response["json"]
+                  and profile.session_id is None and len(response["body"]) < MAX_RESPONSE_PEEK):
+                response["body"] += message.get("body", b"")
+            await send(message)
+
+        token = _current.set(profile)
+        profile.start()
+        try:
+            await self.app(scope, replay, send_wrapper)
+        finally:
+            _current.reset(token)
+            if profile.session_id is None and response["body"]:
+                profile.session_id = _json_session(response["body"])
+            profile.finish()
@@ -26,6 +26,14 @@ def get_clarification_questions(answers: dict) -> list[dict]:
     
     return questions
 
+def default_answers(topic: str) -> Dict:
+    """The answers the clarification form submits if the learner changes nothing."""
+    answers = {"topic": topic}
+    for question in get_clarification_questions(answers):
+        # Select boxes start on their first option; text inputs start empty
+        answers[question["id"]] = question["options"][0] if "options" in question else ""
+    return answers
+
 def analyze_preferences(answers: Dict) -> Dict:
     """
     Analyze user preferences to determine customization parameters
@@ -0,0 +1,300 @@
+"""
+Client-side governor shared by every Gemini call.
+
+The governor paces calls with token buckets for requests-per-minute and
+tokens-per-minute, adapts the number of concurrent calls (additive increase on
+fast successes, multiplicative decrease on 429s and slow responses), retries
+rate-limit and transient errors with jittered exponential backoff, and lets
+interactive calls go ahead of background ones.
+"""
+import contextlib
+import contextvars
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from tenacity import Retrying, retry_if_exception, stop_after_attempt, wait_random_exponential
+
+# Call priorities; lower values are served first
+INTERACTIVE = 0
+BACKGROUND = 1
+
+_priority = contextvars.ContextVar("llm_priority", default=INTERACTIVE)
+
+
+@contextlib.contextmanager
+def llm_priority(priority: int):
+    """Run the enclosed LLM calls at the given priority."""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    name = type(error).__name__
+    text = str(error).lower()
+    return (
+        name in ("ResourceExhausted", "TooManyRequests")
+        or "429" in text
+        or "quota" in text
+        or "rate limit" in text
+    )
+
+
+def is_retryable_error(error: BaseException) -> bool:
+    name = type(error).__name__
+    return is_rate_limit_error(error) or name in (
+        "ServiceUnavailable", "InternalServerError", "DeadlineExceeded", "TimeoutError",
+    )
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token)."""
+    return max(1, len(text) // 4)
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at per_minute / 60 tokens per second."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    @property
+    def enabled(self) -> bool:
+        return self.capacity > 0
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until amount tokens are available (0 if available now)."""
+        if not self.enabled:
+            return 0.0
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float):
+        if self.enabled:
+            self.tokens -= min(amount, self.capacity)
+
+    def adjust(self, amount: float):
+        """Return (positive) or charge (negative) tokens after the fact."""
+        if self.enabled:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+    def drain(self):
+        if self.enabled:
+            self._refill()
+            self.tokens = min(self.tokens, 0.0)
+
+
+class LLMGovernor:
+    def __init__(
+        self,
+        requests_per_minute: float = 30,
+        tokens_per_minute: float = 1_000_000,
+        max_concurrency: int = 8,
+        min_concurrency: int = 1,
+        target_latency: float = 20.0,
+        max_attempts: int = 6,
+        max_backoff: float = 60.0,
+    ):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.target_latency = target_latency
+        self.max_attempts = max_attempts
+        self.max_backoff = max_backoff
+
+        self.limit = float(max_concurrency)
+        self.in_flight = 0
+        self.waiting = {INTERACTIVE: 0, BACKGROUND: 0}
+        self._cond = threading.Condition()
+        self._stats = {"calls": 0, "retries": 0, "rate_limited": 0, "failures": 0, "wait_seconds": 0.0}
+
+    def share(self, parts: int):
+        """Keep 1/parts of the configured quota, for one of parts worker processes."""
+        with self._cond:
+            self.requests = TokenBucket(self.requests.capacity / parts)
+            self.tokens = TokenBucket(self.tokens.capacity / parts)
+            self.max_concurrency = max(self.min_concurrency, self.max_concurrency // parts)
+            self.limit = min(self.limit, float(self.max_concurrency))
+
+    def _blocked_by_priority(self, priority: int) -> bool:
+        return any(count > 0 for p, count in self.waiting.items() if p < priority)
+
+    def acquire(self, tokens: int, priority: int = INTERACTIVE):
+        """Block until a call with the given token estimate may start."""
+        started = time.monotonic()
+        with self._cond:
+            self.waiting[priority] = self.waiting.get(priority, 0) + 1
+            try:
+                while True:
+                    if self._blocked_by_priority(priority) or self.in_flight >= int(self.limit):
+                        self._cond.wait(timeout=1.0)
+                        continue
+                    delay = max(self.requests.wait_time(1), self.tokens.wait_time(tokens))
+                    if delay > 0:
+                        self._cond.wait(timeout=delay)
+                        continue
+                    self.requests.consume(1)
+                    self.tokens.consume(tokens)
+                    self.in_flight += 1
+                    break
+            finally:
+                self.waiting[priority] -= 1
+                self._stats["wait_seconds"] += time.monotonic() - started
+                self._cond.notify_all()
+
+    def release(self, latency: float, error: Optional[BaseException] = None,
+                estimated_tokens: int = 0, actual_tokens: Optional[int] = None):
+        with self._cond:
+            self.in_flight -= 1
+            if error is not None and is_rate_limit_error(error):
+                self._stats["rate_limited"] += 1
+                self.limit = max(self.min_concurrency, self.limit / 2)
+                # The server says we are over quota; stop issuing until the buckets refill
+                self.requests.drain()
+            elif error is None:
+                if latency > self.target_latency:
+                    self.limit = max(self.min_concurrency, self.limit * 0.9)
+                else:
+                    self.limit = min(self.max_concurrency, self.limit + 1.0 / max(self.limit, 1.0))
+                if actual_tokens is not None:
+                    self.tokens.adjust(estimated_tokens - actual_tokens)
+            self._cond.notify_all()
+
+    def record(self, stat: str, amount: float = 1):
+        """Add to one of the counters reported by stats()."""
+        with self._cond:
+            self._stats[stat] += amount
+
+    def call(self, fn: Callable[[], Any], tokens: int, priority: Optional[int] = None,
+             usage: Callable[[Any], Optional[int]] = None) -> Any:
+        """Run fn under the governor, retrying rate-limit and transient errors."""
+        priority = _priority.get() if priority is None else priority
+        retrying = Retrying(
+            retry=retry_if_exception(is_retryable_error),
+            wait=wait_random_exponential(multiplier=1, max=self.max_backoff),
+            stop=stop_after_attempt(self.max_attempts),
+            reraise=True,
+        )
+        for attempt in retrying:
+            with attempt:
+                if attempt.retry_state.attempt_number > 1:
+                    self.record("retries")
+                self.acquire(tokens, priority)
+                start = time.monotonic()
+                try:
+                    result = fn()
+                except BaseException as e:
+                    self.release(time.monotonic() - start, error=e)
+                    self.record("failures")
+                    raise
+                self.record("calls")
+                self.release(time.monotonic() - start, estimated_tokens=tokens,
+                             actual_tokens=usage(result) if usage else None)
+                return result
+
+    def stats(self) -> Dict:
+        with self._cond:
+            return {
+                **self._stats,
+                "wait_seconds": round(self._stats["wait_seconds"], 3),
+                "concurrency_limit": round(self.limit, 2),
+                "in_flight": self.in_flight,
+                "waiting": dict(self.waiting),
+            }
+
+
+_governor = None
+_governor_lock = threading.Lock()
+
+
+def get_governor() -> LLMGovernor:
+    """Return the process-wide governor configured from the environment."""
+    global _governor
+    with _governor_lock:
+        if _governor is None:
+            _governor = LLMGovernor(
+                requests_per_minute=float(os.getenv("GEMINI_RPM", "30")),
+                tokens_per_minute=float(os.getenv("GEMINI_TPM", "1000000")),
+                max_concurrency=int(os.getenv("GEMINI_MAX_CONCURRENCY", "8")),
+                target_latency=float(os.getenv("GEMINI_TARGET_LATENCY", "20")),
+            )
+        return _governor
+
+
+def _usage_tokens(message: Any) -> Optional[int]:
+    usage = getattr(message, "usage_metadata", None)
+    if usage:
+        return usage.get("total_tokens")
+    return None
+
+
+class GovernedChatModel(BaseChatModel):
+    """Chat model wrapper that routes every call through an LLMGovernor."""
+
+    inner: Any
+    governor: Any = None
+    output_tokens: int = 512
+
+    @property
+    def _llm_type(self) -> str:
+        return "governed"
+
+    def _output_tokens(self, kwargs: Dict) -> int:
+        # A per-call output cap (see backend.budget) bounds the estimate
+        generation_config = kwargs.get("generation_config") or {}
+        return generation_config.get("max_output_tokens") or self.output_tokens
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager=None, **kwargs: Any) -> ChatResult:
+        governor = self.governor or get_governor()
+        tokens = sum(estimate_tokens(str(m.content)) for m in messages) + self._output_tokens(kwargs)
+        result = governor.call(
+            lambda: self.inner.invoke(messages, stop=stop, **kwargs),
+            tokens,
+            usage=_usage_tokens,
+        )
+        message = result if isinstance(result, AIMessage) else AIMessage(content=str(result))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager=None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        # Streamed calls hold one governor slot until the last chunk; they are
+        # not retried because part of the answer may already have been sent
+        governor = self.governor or get_governor()
+        tokens = sum(estimate_tokens(str(m.content)) for m in messages) + self._output_tokens(kwargs)
+        governor.acquire(tokens, _priority.get())
+        start = time.monotonic()
+        try:
+            for chunk in self.inner.stream(messages, stop=stop, **kwargs):
+                content = chunk.content if isinstance(chunk, BaseMessage) else str(chunk)
+                generation = ChatGenerationChunk(message=AIMessageChunk(content=content))
+                if run_manager:
+                    run_manager.on_llm_new_token(content, chunk=generation)
+                yield generation
+        except BaseException as e:
+            governor.release(time.monotonic() - start, error=e)
+            if isinstance(e, Exception):
+                governor.record("failures")
+            raise
+        governor.record("calls")
+        governor.release(time.monotonic() - start, estimated_tokens=tokens)
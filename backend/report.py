@@ -1,15 +1,27 @@
+import asyncio
+import contextvars
+import functools
+import json
 import os
-from typing import Dict, List, Optional
+from concurrent.futures import Executor
+from typing import Callable, Dict, List, Optional
 from langchain import PromptTemplate, LLMChain
+from pydantic import BaseModel, ValidationError, field_validator
 from langchain.retrievers import ContextualCompressionRetriever
 from langchain.retrievers.document_compressors import LLMChainExtractor
-from backend.deps import init_genai, get_genai_llm
-from backend.indexing import get_session_index
+from backend.budget import plan_budget
+from backend.deps import init_genai
+from backend.indexing import get_session_corpus_id, get_session_index
+from backend.memo import FragmentCache, freeze
+from backend.profiling import profiled
+from backend.ratelimit import estimate_tokens
+from backend.routing import HEAVY, LIGHT, TRIVIAL, guess_language, router
 
 # Initialize the generative AI module for direct API calls
 genai = init_genai()
-# Get a LangChain-compatible LLM for integration with LangChain components
-llm = get_genai_llm()
+
+# Generated report fragments, keyed by corpus and the preference fields each one uses
+fragment_cache = FragmentCache(max_entries=int(os.getenv("REPORT_FRAGMENT_CACHE_SIZE", "2048")))
 
 # Templates for different report sections
 OVERVIEW_TEMPLATE = """
@@ -101,12 +113,144 @@ Provide answers or solution hints after each question.
 Format everything with clear markdown.
 """
 
-async def generate_report(session_id: str, preferences: dict) -> str:
-    """Generate a comprehensive learning report based on research and user preferences."""
+PLAN_TEMPLATE = """
+You are planning a learning report on {topic} for a learner at a {knowledge_level} level, focusing on {focus_area}.
+
+Return only a JSON object with exactly these keys:
+- "objectives": a list of 3-5 clear learning objectives (strings)
+- "sections": a list of 3-5 important subtopics or section titles for the report (strings)
+- "language": the most appropriate programming language to demonstrate concepts in {topic}, as just the language name (e.g. "Python", "JavaScript")
+
+JSON:
+"""
+
+OBJECTIVES_PROMPT = "Create 3-5 clear learning objectives for {topic} at a {knowledge_level} level, focusing on {focus_area}."
+SECTIONS_PROMPT = "List 3-5 important subtopics or sections for learning about {topic}, focusing on {focus_area}. Return only the section titles separated by commas."
+LANGUAGE_PROMPT = "What would be the most appropriate programming language to demonstrate concepts in {topic}? Answer with just the language name (e.g., 'Python', 'JavaScript')."
+
+# Returned in place of a report when the session has no research index
+NO_RESEARCH_ERROR = "Error: No research data found for this session."
+
+class ReportPlan(BaseModel):
+    """Schema for the structured planning response."""
+    objectives: List[str]
+    sections: List[str]
+    language: str
+
+    @field_validator("objectives", "sections")
+    @classmethod
+    def non_empty_items(cls, items: List[str]) -> List[str]:
+        items = [item.strip() for item in items if item and item.strip()]
+        if not items:
+            raise ValueError("must contain at least one item")
+        return items[:6]
+
+    @field_validator("language")
+    @classmethod
+    def single_language(cls, language: str) -> str:
+        language = language.strip().strip("'\"`.")
+        if not language or len(language.split()) > 3:
+            raise ValueError("must be a language name")
+        return language
+
+def parse_plan(text: str) -> ReportPlan:
+    """Extract and validate the JSON object in an LLM planning response."""
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end <= start:
+        raise ValueError("No JSON object in planning response")
+    return ReportPlan.model_validate(json.loads(text[start:end + 1]))
+
+def _plan_report(topic: str, knowledge_level: str, focus_area: str) -> Dict:
+    """
+    Plan objectives, sections and code language with one structured call.
+    Falls back to separate calls when the response is not valid.
+    """
+    try:
+        plan = parse_plan(_run_chain(
+            PLAN_TEMPLATE, task="plan", task_class=LIGHT, topic=topic, knowledge_level=knowledge_level, focus_area=focus_area
+        ))
+        return {
+            "objectives_text": "\n".join(f"- {objective}" for objective in plan.objectives),
+            "sections": plan.sections,
+            "language": plan.language,
+        }
+    except (ValueError, ValidationError) as e:
+        print(f"Structured report plan failed, using separate calls: {str(e)}")
+    
+    objectives_text = _run_chain(
+        OBJECTIVES_PROMPT, task="objectives", task_class=LIGHT, topic=topic, knowledge_level=knowledge_level, focus_area=focus_area
+    )
+    sections_text = _run_chain(SECTIONS_PROMPT, task="sections", task_class=LIGHT,
+                               topic=topic, focus_area=focus_area)
+    return {
+        "objectives_text": objectives_text,
+        "sections": [s.strip() for s in sections_text.split(",") if s.strip()],
+        # Only asked for when a code example actually needs it
+        "language": None,
+    }
+
+async def generate_report(session_id: str, preferences: dict,
+                          progress: Optional[Callable[[float, str], None]] = None,
+                          executor: Optional[Executor] = None) -> str:
+    """
+    Generate a comprehensive learning report based on research and user preferences.
+    progress, if given, is called with (fraction_done, message) as stages complete.
+    executor, if given, runs the generation instead of the default thread pool.
+    """
+    # LLM chains are blocking; run them off the event loop
+    if executor is None:
+        return await asyncio.to_thread(_generate_report_sync, session_id, preferences, progress)
+    # Carry the caller's context (e.g. LLM priority) into the executor's thread
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(
+        executor, functools.partial(context.run, _generate_report_sync, session_id, preferences, progress)
+    )
+
+async def prefetch_report(session_id: str, preferences: dict,
+                          progress: Optional[Callable[[float, str], None]] = None):
+    """
+    Compute the parts of a report that do not depend on format preferences
+    (retrieval, overview, plan and key concepts) into the fragment cache, so a
+    later generate_report with compatible preferences reuses them.
+    progress may raise to abandon the prefetch between stages.
+    """
+    await asyncio.to_thread(_generate_report_sync, session_id, preferences, progress, True)
+
+def prefetch_key(preferences: dict) -> tuple:
+    """The preference values that prefetched fragments depend on."""
+    budget = plan_budget(preferences.get("session_time"), preferences.get("depth_level", 2))
+    return (
+        preferences.get("topic", "the requested topic"),
+        preferences.get("familiarity", "Beginner"),
+        preferences.get("focus_area", "general understanding"),
+        budget.call_tokens,
+        budget.retrieval_k,
+        budget.compress,
+    )
+
+def _run_chain(template: str, max_tokens: Optional[int] = None, task: str = "report",
+               task_class: str = HEAVY, **inputs) -> str:
+    """
+    Run a single prompt through the model routed for its task class,
+    optionally capping its output tokens.
+    """
+    chain = LLMChain(
+        llm=router.model(task, task_class),
+        prompt=PromptTemplate(input_variables=list(inputs), template=template),
+        llm_kwargs={"generation_config": {"max_output_tokens": max_tokens}} if max_tokens else {}
+    )
+    return chain.run(**inputs)
+
+@profiled
+def _generate_report_sync(session_id: str, preferences: dict,
+                          progress: Optional[Callable[[float, str], None]] = None,
+                          prefetch_only: bool = False) -> Optional[str]:
+    report_progress = progress or (lambda fraction, message: None)
     # Get user preferences and research data
     vectorstore = get_session_index(session_id)
     if not vectorstore:
-        return "Error: No research data found for this session."
+        return NO_RESEARCH_ERROR
+    corpus = get_session_corpus_id(session_id)
     
     # Extract preferences
     topic = preferences.get("topic", "the requested topic")
@@ -117,63 +261,83 @@ async def generate_report(session_id: str, preferences: dict) -> str:
     include_code = preferences.get("include_code", False)
     include_videos = preferences.get("include_videos", False)
     
-    # Create a retriever with contextual compression
-    compressor = LLMChainExtractor.from_llm(llm)
-    retriever = ContextualCompressionRetriever(
-        base_compressor=compressor,
-        base_retriever=vectorstore.as_retriever(search_kwargs={"k": 5})
-    )
+    # Sections, retrieval and output length are bounded by the learner's time
+    budget = plan_budget(preferences.get("session_time"), depth_level)
+    max_tokens = budget.call_tokens
+    used_tokens = 0
     
-    # Generate the overview section
-    overview_context = retriever.get_relevant_documents(f"overview of {topic}")
-    overview_chain = LLMChain(
-        llm=llm,
-        prompt=PromptTemplate(
-            input_variables=["topic", "context"],
-            template=f"Create a comprehensive overview of {{topic}} based on this research: {{context}}"
+    # Compression costs one LLM call per retrieved chunk, so short budgets skip it
+    retriever = vectorstore.as_retriever(search_kwargs={"k": budget.retrieval_k})
+    if budget.compress:
+        retriever = ContextualCompressionRetriever(
+            base_compressor=LLMChainExtractor.from_llm(router.model("compress", LIGHT)),
+            base_retriever=retriever
         )
-    )
-    overview_text = overview_chain.run(topic=topic, context=overview_context)
     
-    # Generate learning objectives
-    objectives_chain = LLMChain(
-        llm=llm,
-        prompt=PromptTemplate(
-            input_variables=["topic", "knowledge_level", "focus_area"],
-            template=f"Create 3-5 clear learning objectives for {{topic}} at a {{knowledge_level}} level, focusing on {{focus_area}}."
-        )
-    )
-    objectives_text = objectives_chain.run(
-        topic=topic, 
-        knowledge_level=knowledge_level,
-        focus_area=focus_area
-    )
+    # Every fragment is memoized on the corpus plus exactly the inputs it uses,
+    # so changing one preference only regenerates the fragments that depend on it
+    def fragment(name: str, inputs: Dict, compute: Callable[[], object]):
+        return fragment_cache.get_or_compute((corpus, name, freeze(inputs)), compute)
     
-    # Generate key concepts
-    concepts_context = retriever.get_relevant_documents(f"key concepts in {topic}")
-    concepts_chain = LLMChain(
-        llm=llm,
-        prompt=PromptTemplate(
-            input_variables=["topic", "context", "knowledge_level"],
-            template=f"List and briefly explain 5-7 key concepts in {{topic}} suitable for a {{knowledge_level}} level, based on: {{context}}"
-        )
-    )
-    key_concepts = concepts_chain.run(
+    def context(query: str):
+        return fragment("context", {"query": query, "k": budget.retrieval_k, "compress": budget.compress},
+                        lambda: retriever.get_relevant_documents(query))
+    
+    def generated(name: str, inputs: Dict, compute: Callable[[], str], core: bool = True) -> str:
+        """A generated fragment; core content counts against the report's token target"""
+        nonlocal used_tokens
+        # Every generated fragment is written from context(), so it also depends on the retrieval settings
+        text = fragment(name, {**inputs, "max_tokens": max_tokens, "retrieval_k": budget.retrieval_k,
+                               "compress": budget.compress}, compute)
+        if core:
+            used_tokens += estimate_tokens(text)
+        return text
+    
+    def over_budget() -> bool:
+        return used_tokens >= budget.target_tokens
+    
+    # Generate the overview section
+    report_progress(0.05, "Writing overview")
+    overview_text = generated("overview", {"topic": topic}, lambda: _run_chain(
+        "Create a comprehensive overview of {topic} based on this research: {context}",
+        max_tokens=max_tokens,
+        task="overview",
         topic=topic,
-        context=concepts_context,
-        knowledge_level=knowledge_level
+        context=context(f"overview of {topic}")
+    ))
+    
+    # Plan objectives, sections and code language in one structured call
+    report_progress(0.15, "Planning the report")
+    plan = fragment(
+        "plan",
+        {"topic": topic, "knowledge_level": knowledge_level, "focus_area": focus_area},
+        lambda: _plan_report(topic, knowledge_level, focus_area)
     )
+    objectives_text = plan["objectives_text"]
     
-    # Determine main content sections
-    sections_chain = LLMChain(
-        llm=llm,
-        prompt=PromptTemplate(
-            input_variables=["topic", "focus_area"],
-            template=f"List 3-5 important subtopics or sections for learning about {{topic}}, focusing on {{focus_area}}. Return only the section titles separated by commas."
+    # Generate key concepts
+    report_progress(0.2, "Explaining key concepts")
+    key_concepts = generated(
+        "key_concepts",
+        {"topic": topic, "knowledge_level": knowledge_level},
+        lambda: _run_chain(
+            "List and briefly explain 5-7 key concepts in {topic} suitable for a {knowledge_level} level, based on: {context}",
+            max_tokens=max_tokens,
+            task="key_concepts",
+            topic=topic,
+            context=context(f"key concepts in {topic}"),
+            knowledge_level=knowledge_level
         )
     )
-    sections_text = sections_chain.run(topic=topic, focus_area=focus_area)
-    sections = [s.strip() for s in sections_text.split(",")]
+    
+    sections = plan["sections"][:budget.max_sections]
+    
+    if prefetch_only:
+        # Warm section retrieval too; everything after this depends on format preferences
+        for i, section_title in enumerate(sections):
+            report_progress(0.3 + 0.5 * i / len(sections), f"Retrieving context for {section_title}")
+            context(f"{section_title} in {topic}")
+        return None
     
     # Build report with all sections
     markdown = f"# Learning Report: {topic}\n\n"
@@ -187,107 +351,118 @@ async def generate_report(session_id: str, preferences: dict) -> str:
     )
     
     # Generate content for each section
-    for section_title in sections:
-        section_context = retriever.get_relevant_documents(f"{section_title} in {topic}")
-        section_chain = LLMChain(
-            llm=llm,
-            prompt=PromptTemplate(
-                input_variables=["topic", "section_title", "context", "knowledge_level", "depth", "focus_area"],
-                template=SECTION_TEMPLATE
+    for i, section_title in enumerate(sections):
+        if i > 0 and over_budget():
+            print(f"Report token target reached after {i} of {len(sections)} sections")
+            break
+        report_progress(0.3 + 0.5 * i / len(sections), f"Writing section {i + 1} of {len(sections)}: {section_title}")
+        section_query = f"{section_title} in {topic}"
+        section_content = generated(
+            "section",
+            {"topic": topic, "section_title": section_title, "knowledge_level": knowledge_level,
+             "depth": depth_level, "focus_area": focus_area},
+            lambda: _run_chain(
+                SECTION_TEMPLATE,
+                max_tokens=max_tokens,
+                task="section",
+                topic=topic,
+                section_title=section_title,
+                context=context(section_query),
+                knowledge_level=knowledge_level,
+                depth=depth_level,
+                focus_area=focus_area
             )
         )
-        section_content = section_chain.run(
-            topic=topic,
-            section_title=section_title,
-            context=section_context,
-            knowledge_level=knowledge_level,
-            depth=depth_level,
-            focus_area=focus_area
-        )
         markdown += f"\n\n## {section_title}\n\n{section_content}"
         
+        # Visual aids and code examples are extras, limited to the budget's first sections
+        with_extras = i < budget.extra_sections
+        
         # Add visual aid if requested
-        if include_visuals:
-            visual_chain = LLMChain(
-                llm=llm,
-                prompt=PromptTemplate(
-                    input_variables=["topic", "visual_concept", "context", "knowledge_level"],
-                    template=VISUAL_TEMPLATE
-                )
-            )
-            visual_content = visual_chain.run(
-                topic=topic,
-                visual_concept=section_title,
-                context=section_context,
-                knowledge_level=knowledge_level
+        if include_visuals and with_extras:
+            visual_content = generated(
+                "visual",
+                {"topic": topic, "section_title": section_title, "knowledge_level": knowledge_level},
+                lambda: _run_chain(
+                    VISUAL_TEMPLATE,
+                    max_tokens=max_tokens,
+                    task="visual",
+                    topic=topic,
+                    visual_concept=section_title,
+                    context=context(section_query),
+                    knowledge_level=knowledge_level
+                ),
+                core=False
             )
             markdown += f"\n\n### Visual Aid: {section_title}\n\n{visual_content}"
         
         # Add code example if requested
-        if include_code:
-            # Determine appropriate programming language for the topic
-            lang_chain = LLMChain(
-                llm=llm,
-                prompt=PromptTemplate(
-                    input_variables=["topic"],
-                    template="What would be the most appropriate programming language to demonstrate concepts in {topic}? Answer with just the language name (e.g., 'Python', 'JavaScript')."
-                )
-            )
-            language = lang_chain.run(topic=topic).strip()
+        if include_code and with_extras:
+            # Determine appropriate programming language for the topic, locally if the topic says
+            language = plan["language"] or fragment("language", {"topic": topic}, lambda: (
+                router.local("language", lambda: guess_language(topic))
+                or _run_chain(LANGUAGE_PROMPT, task="language", task_class=TRIVIAL, topic=topic).strip()
+            ))
             
-            code_chain = LLMChain(
-                llm=llm,
-                prompt=PromptTemplate(
-                    input_variables=["topic", "concept", "context", "knowledge_level", "language"],
-                    template=CODE_EXAMPLE_TEMPLATE
-                )
-            )
-            code_content = code_chain.run(
-                topic=topic,
-                concept=section_title,
-                context=section_context,
-                knowledge_level=knowledge_level,
-                language=language
+            code_content = generated(
+                "code",
+                {"topic": topic, "section_title": section_title, "knowledge_level": knowledge_level,
+                 "language": language},
+                lambda: _run_chain(
+                    CODE_EXAMPLE_TEMPLATE,
+                    max_tokens=max_tokens,
+                    task="code",
+                    topic=topic,
+                    concept=section_title,
+                    context=context(section_query),
+                    knowledge_level=knowledge_level,
+                    language=language
+                ),
+                core=False
             )
             markdown += f"\n\n### Code Example: {section_title}\n\n{code_content}"
     
     # Add assessment questions
-    assessment_context = retriever.get_relevant_documents(f"assessment questions for {topic}")
-    assessment_chain = LLMChain(
-        llm=llm,
-        prompt=PromptTemplate(
-            input_variables=["topic", "context", "knowledge_level"],
-            template=ASSESSMENT_TEMPLATE
+    report_progress(0.8, "Writing assessment questions")
+    assessment_content = generated(
+        "assessment",
+        {"topic": topic, "knowledge_level": knowledge_level},
+        lambda: _run_chain(
+            ASSESSMENT_TEMPLATE,
+            max_tokens=max_tokens,
+            task="assessment",
+            topic=topic,
+            context=context(f"assessment questions for {topic}"),
+            knowledge_level=knowledge_level
         )
     )
-    assessment_content = assessment_chain.run(
-        topic=topic,
-        context=assessment_context,
-        knowledge_level=knowledge_level
-    )
     markdown += f"\n\n## Check Your Understanding\n\n{assessment_content}"
     
-    # Add additional resources
-    resources_context = retriever.get_relevant_documents(f"learning resources for {topic}")
-    resources_chain = LLMChain(
-        llm=llm,
-        prompt=PromptTemplate(
-            input_variables=["topic", "context", "knowledge_level"],
-            template=ADDITIONAL_RESOURCES_TEMPLATE
+    # Add additional resources when the budget allows
+    if budget.include_resources and not over_budget():
+        report_progress(0.9, "Collecting additional resources")
+        resources_content = generated(
+            "resources",
+            {"topic": topic, "knowledge_level": knowledge_level},
+            lambda: _run_chain(
+                ADDITIONAL_RESOURCES_TEMPLATE,
+                max_tokens=max_tokens,
+                task="resources",
+                topic=topic,
+                context=context(f"learning resources for {topic}"),
+                knowledge_level=knowledge_level
+            )
         )
-    )
-    resources_content = resources_chain.run(
-        topic=topic,
-        context=resources_context,
-        knowledge_level=knowledge_level
-    )
-    markdown += f"\n\n## Additional Resources\n\n{resources_content}"
+        markdown += f"\n\n## Additional Resources\n\n{resources_content}"
     
     # Add references section
     markdown += "\n\n## References\n\n"
+    references = fragment("references", {"topic": topic}, lambda: [
+        doc.metadata.get("source", "Unknown source")
+        for doc in vectorstore.as_retriever().get_relevant_documents(topic)
+    ])
     references_set = set()
-    for doc in vectorstore.as_retriever().get_relevant_documents(topic):
-        source = doc.metadata.get("source", "Unknown source")
+    for source in references:
         if source not in references_set:
             references_set.add(source)
             markdown += f"- {source}\n"
@@ -296,27 +471,21 @@ async def generate_report(session_id: str, preferences: dict) -> str:
 
 async def modify_report(session_id: str, feedback: dict) -> str:
     """Modify the report based on user feedback."""
+    return await asyncio.to_thread(_modify_report_sync, session_id, feedback)
+
+@profiled
+def _modify_report_sync(session_id: str, feedback: dict) -> str:
     vectorstore = get_session_index(session_id)
     if not vectorstore:
-        return "Error: No research data found for this session."
+        return NO_RESEARCH_ERROR
     
     feedback_text = feedback.get("text", "")
     
-    # Analyze what aspects need modification
-    analysis_chain = LLMChain(
-        llm=llm,
-        prompt=PromptTemplate(
-            input_variables=["feedback"],
-            template="Analyze this feedback for a learning report: {feedback}\n\nIdentify specific aspects that need modification and what changes are requested. Format your response as a JSON object with keys 'aspects' (array of sections to modify) and 'requests' (array of requested changes)."
-        )
-    )
-    analysis_result = analysis_chain.run(feedback=feedback_text)
-    
-    # Generate modified report based on feedback analysis
+    # Generate modified report based on the feedback
     context_docs = vectorstore.as_retriever(search_kwargs={"k": 10}).get_relevant_documents(feedback_text)
     
     modification_chain = LLMChain(
-        llm=llm,
+        llm=router.model("modify", HEAVY),
         prompt=PromptTemplate(
             input_variables=["feedback", "context", "session_id"],
             template="""
@@ -1,12 +1,152 @@
+import asyncio
+import hashlib
 import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Callable, Dict, List, Set
 from arxiv import Search
 from serpapi import GoogleSearch  # ensure "google-search-results" package is installed
 from youtube_transcript_api import YouTubeTranscriptApi
+from backend import papers, webfetch
 from backend.deps import init_genai
+from backend.prewarm import ResearchCache, normalize_topic
 
 genai = init_genai()
 
+# Objectives expanded into their own queries (the topic itself is always queried)
+MAX_OBJECTIVE_QUERIES = int(os.getenv("RESEARCH_MAX_OBJECTIVE_QUERIES", "3"))
+# Searches in flight at once for one research run, across all sources
+QUERY_CONCURRENCY = int(os.getenv("RESEARCH_QUERY_CONCURRENCY", "8"))
+# The search clients block on I/O; the default executor is sized for CPU work
+# (five threads on one core), so searches get their own pool
+search_pool = ThreadPoolExecutor(max_workers=int(os.getenv("RESEARCH_THREADS", "32")),
+                                 thread_name_prefix="research")
+# Results kept per query: (topic query, objective query)
+WEB_RESULTS = (5, 3)
+ARXIV_RESULTS = (3, 2)
+
+# Search results per (source, query), shared by every topic and objective that expands to the query
+query_cache = ResearchCache(
+    ttl=float(os.getenv("RESEARCH_CACHE_TTL", str(6 * 3600))),
+    max_entries=int(os.getenv("RESEARCH_QUERY_CACHE_SIZE", "1024"))
+)
+
+# Lead-in words that say what the learner wants to do rather than what to search for
+OBJECTIVE_LEAD_INS = re.compile(
+    r"^(?:(?:to|be able to|understand|understanding|learn|learning|learn about|know|explore|"
+    r"master|study|grasp|discover|get|gain|build|apply|use|using|about|the|a|an|how)(?:\s+|$))+",
+    re.IGNORECASE
+)
+
 async def perform_research(topic: str, objectives: list[str]) -> list[dict]:
+    return order_documents([doc async for doc in stream_research(topic, objectives)])
+
+def expand_queries(topic: str, objectives: List[str]) -> List[str]:
+    """
+    The topic plus one query per learning objective, e.g. "Understand basic
+    concepts" on "Machine Learning" becomes "Machine Learning basic concepts".
+    """
+    queries = [topic.strip()]
+    seen = {normalize_topic(topic)}
+    names_topic = re.compile(rf"(?<!\w){re.escape(normalize_topic(topic))}(?!\w)")
+    for objective in objectives:
+        if len(queries) > MAX_OBJECTIVE_QUERIES:
+            break
+        terms = OBJECTIVE_LEAD_INS.sub("", objective.strip().rstrip(".")).strip()
+        if not terms:
+            continue
+        # Objectives that already name the topic are searched as written
+        query = terms if names_topic.search(normalize_topic(terms)) else f"{topic.strip()} {terms}"
+        if normalize_topic(query) not in seen:
+            seen.add(normalize_topic(query))
+            queries.append(query)
+    return queries
+
+def content_hash(text: str) -> str:
+    return hashlib.sha1(" ".join(text.lower().split()).encode()).hexdigest()
+
+def unique_documents(documents: List[Dict], seen_urls: Set[str], seen_hashes: Set[str]) -> List[Dict]:
+    """Drop documents whose URL or text was already seen, recording the rest."""
+    unique = []
+    for doc in documents:
+        url = doc.get("source")
+        digest = content_hash(doc["text"]) if doc.get("text") else None
+        if (url and url in seen_urls) or (digest and digest in seen_hashes):
+            continue
+        if url:
+            seen_urls.add(url)
+        if digest:
+            seen_hashes.add(digest)
+        unique.append(doc)
+    return unique
+
+class QueryRunner:
+    """Runs one research run's searches concurrently under a shared cap, with cached results."""
+
+    def __init__(self, limit: int = QUERY_CONCURRENCY):
+        self.semaphore = asyncio.Semaphore(limit)
+
+    async def search(self, search: Callable[[str, int], list], queries: List[str],
+                     results: tuple) -> List[Dict]:
+        """
+        Run search(query, max_results) for every query, returning the results in
+        query order. The topic query's failure is the source's failure; objective
+        queries only add coverage, so their failures are logged and skipped.
+        """
+        batches = await asyncio.gather(*(
+            self._search(search, query, results[0] if i == 0 else results[1], required=i == 0)
+            for i, query in enumerate(queries)
+        ))
+        return [doc for batch in batches for doc in batch]
+
+    async def _search(self, search: Callable[[str, int], list], query: str, max_results: int,
+                      required: bool) -> List[Dict]:
+        key = f"{search.__name__}\0{max_results}\0{normalize_topic(query)}"
+        cached = query_cache.get(key)
+        if cached is not None:
+            return list(cached)
+        try:
+            async with self.semaphore:
+                docs = await asyncio.get_running_loop().run_in_executor(search_pool, search, query, max_results)
+        except Exception as e:
+            if required:
+                raise
+            print(f"Research query '{query}' failed: {str(e)}")
+            return []
+        # Empty results may be a transient failure the source swallowed; retry those next time
+        if docs:
+            query_cache.put(key, docs)
+        return list(docs)
+
+async def stream_research(topic: str, objectives: list[str]) -> AsyncIterator[dict]:
+    """
+    Yield research documents as each source returns them, so indexing can start
+    while slower sources are still downloading. Every source searches the topic
+    and its objective queries concurrently; documents already yielded under the
+    same URL or text are dropped. Order depends on source timing; use
+    order_documents for a stable order.
+    """
+    queries = expand_queries(topic, objectives)
+    runner = QueryRunner()
+    tasks = [asyncio.ensure_future(source(queries, runner)) for source in SOURCES]
+    seen_urls: Set[str] = set()
+    seen_hashes: Set[str] = set()
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            for doc in unique_documents(await next_done, seen_urls, seen_hashes):
+                yield doc
+    finally:
+        for task in tasks:
+            if task.done() and not task.cancelled():
+                task.exception()  # already reported, or superseded by the first failure
+            task.cancel()
+
+def order_documents(documents: list[dict]) -> list[dict]:
+    """Sort documents into source order (web, arXiv, video), keeping each source's own order."""
+    rank = {doc_type: i for i, doc_type in enumerate(SOURCE_TYPES)}
+    return sorted(documents, key=lambda doc: rank.get(doc.get("type"), len(rank)))
+
+def _web_documents(topic: str, max_results: int = 5) -> list[dict]:
     results = []
 
     # 1. Web search via SerpAPI (GoogleSearch from google-search-results)
@@ -15,14 +155,37 @@ async def perform_research(topic: str, objectives: list[str]) -> list[dict]:
         "api_key": os.getenv("SERPAPI_API_KEY"),
         "engine": "google"
     })
-    serp_results = google_search.get_dict().get("organic_results", [])[:5]
+    serp_results = google_search.get_dict().get("organic_results", [])[:max_results]
     for r in serp_results:
         results.append({"source": r.get("link"), "text": r.get("snippet"), "type": "web"})
+    return results
+
+async def _web_source(queries: List[str], runner: QueryRunner) -> list[dict]:
+    # Drop repeats across queries first so no page is fetched twice
+    docs = unique_documents(await runner.search(_web_documents, queries, WEB_RESULTS), set(), set())
+    if webfetch.ENABLED:
+        # Fetch the result pages concurrently for their full text
+        docs = await webfetch.page_fetcher.enrich(docs)
+    return docs
+
+def _arxiv_documents(topic: str, max_results: int = 3) -> list[dict]:
+    results = []
 
     # 2. arXiv abstracts
-    search_results = Search(query=topic, max_results=3)
+    search_results = Search(query=topic, max_results=max_results)
     for p in search_results.results():
         results.append({"source": p.entry_id, "text": p.summary, "type": "arxiv"})
+    return results
+
+async def _arxiv_source(queries: List[str], runner: QueryRunner) -> list[dict]:
+    docs = await runner.search(_arxiv_documents, queries, ARXIV_RESULTS)
+    if papers.ENABLED:
+        # Download and extract the papers for their full text
+        docs = await papers.paper_fetcher.enrich(docs)
+    return docs
+
+def _video_documents(topic: str, max_results: int = 1) -> list[dict]:
+    results = []
 
     # 3. YouTube transcript via SerpAPI video search
     try:
@@ -72,11 +235,21 @@ async def perform_research(topic: str, objectives: list[str]) -> list[dict]:
                         joined = " ".join(seg['text'] for seg in transcript)
                         results.append({"source": video_url, "text": joined, "type": "video"})
                         print(f"Successfully added transcript for video: {video_url}")
-                        break  # Stop after finding one valid transcript
+                        if len(results) >= max_results:
+                            break  # Stop after finding enough valid transcripts
             except Exception as e:
                 print(f"Error processing individual video {video_url}: {str(e)}")
                 continue  # Try the next video
     except Exception as e:
         print(f"Error in YouTube search or transcript retrieval: {str(e)}")
 
-    return results
\ No newline at end of file
+    return results
+
+async def _video_source(queries: List[str], runner: QueryRunner) -> list[dict]:
+    # One lecture transcript per topic; objective queries would mostly find the same lectures
+    return await runner.search(_video_documents, queries[:1], (1, 1))
+
+# Research sources, in the order their documents are presented.
+# Each takes the expanded queries and the run's QueryRunner
+SOURCES = [_web_source, _arxiv_source, _video_source]
+SOURCE_TYPES = ["web", "arxiv", "video"]
@@ -0,0 +1,220 @@
+"""
+Routing of LLM work by task class.
+
+Every chain names its task and declares how much model it needs:
+
+- trivial: answerable by a local heuristic (e.g. the code language of a topic);
+  falls back to the light model when the heuristic has no answer
+- light: short, structured or extractive output (planning, compression,
+  transcript window summaries), served by GEMINI_LIGHT_MODEL with a small
+  output cap
+- heavy: long-form writing, served by the main model (GEMINI_MODEL)
+
+Every decision is recorded with its latency; see ModelRouter.stats().
+"""
+import os
+import re
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+
+from backend.deps import get_genai_llm
+
+TRIVIAL = "trivial"
+LIGHT = "light"
+HEAVY = "heavy"
+TASK_CLASSES = (TRIVIAL, LIGHT, HEAVY)
+
+MAIN_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.0-flash-lite")
+# Defaults to the main model; set a smaller one to make light calls cheaper and faster
+LIGHT_MODEL = os.getenv("GEMINI_LIGHT_MODEL", MAIN_MODEL)
+# Output cap for light calls that do not set their own
+LIGHT_MAX_TOKENS = int(os.getenv("LIGHT_MAX_TOKENS", "512"))
+# Latencies kept per task for percentiles
+LATENCY_WINDOW = 200
+
+# Code language by topic keyword, most specific first. Matched as whole words
+LANGUAGE_KEYWORDS = [
+    ("TypeScript", ["typescript", "angular", "deno"]),
+    ("JavaScript", ["javascript", "js", "node.js", "nodejs", "react", "react.js", "reactjs", "vue",
+                    "svelte", "next.js", "frontend", "front-end", "web development"]),
+    ("Python", ["python", "pandas", "numpy", "django", "flask", "fastapi", "pytorch", "tensorflow",
+                "scikit-learn", "keras", "machine learning", "deep learning", "data science",
+                "neural network", "neural networks", "nlp", "natural language processing"]),
+    ("Java", ["java", "spring boot", "jvm"]),
+    ("Kotlin", ["kotlin", "android"]),
+    ("Swift", ["swift", "swiftui", "ios"]),
+    ("Go", ["golang"]),
+    ("Rust", ["rust"]),
+    ("C++", ["c++", "unreal engine"]),
+    ("C#", ["c#", ".net", "unity"]),
+    ("C", ["c programming", "embedded systems"]),
+    ("SQL", ["sql", "postgresql", "postgres", "mysql", "sqlite", "relational database", "databases"]),
+    ("Ruby", ["ruby", "rails"]),
+    ("PHP", ["php", "laravel", "wordpress"]),
+    ("Solidity", ["solidity", "smart contract", "smart contracts", "ethereum"]),
+    ("R", ["r programming", "ggplot2", "tidyverse"]),
+    ("Julia", ["julia"]),
+    ("Haskell", ["haskell"]),
+    ("Scala", ["scala"]),
+    ("MATLAB", ["matlab"]),
+    ("Bash", ["bash", "shell scripting"]),
+]
+# Keywords that are also everyday words or names ("rust prevention", "Java island",
+# "unity in diversity"). They only count in a topic that is clearly about programming:
+# one with a programming context word or an unambiguous keyword
+AMBIGUOUS_KEYWORDS = {
+    "angular", "react", "vue", "svelte", "frontend", "front-end", "python", "pandas", "django",
+    "flask", "java", "android", "swift", "ios", "rust", "c#", "unity", "databases", "ruby", "rails",
+    "wordpress", "solidity", "ethereum", "julia", "scala", "bash",
+}
+PROGRAMMING_CONTEXT = [
+    "programming", "programmer", "programmers", "program", "programs", "code", "coding", "coder",
+    "developer", "developers", "development", "software", "language", "languages", "framework",
+    "frameworks", "library", "libraries", "api", "apis", "sdk", "compiler", "syntax", "script",
+    "scripts", "scripting", "app", "apps", "backend", "back-end", "web", "game engine",
+]
+
+
+def _keyword_pattern(keywords: List[str]) -> Optional["re.Pattern"]:
+    if not keywords:
+        return None
+    return re.compile("|".join(rf"(?<![\w]){re.escape(k)}(?![\w])" for k in keywords))
+
+
+# (language, unambiguous keyword pattern, ambiguous keyword pattern)
+_LANGUAGE_PATTERNS = [
+    (
+        language,
+        _keyword_pattern([k for k in keywords if k not in AMBIGUOUS_KEYWORDS]),
+        _keyword_pattern([k for k in keywords if k in AMBIGUOUS_KEYWORDS]),
+    )
+    for language, keywords in LANGUAGE_KEYWORDS
+]
+_CONTEXT_PATTERN = _keyword_pattern(PROGRAMMING_CONTEXT)
+
+
+def guess_language(topic: str) -> Optional[str]:
+    """
+    Programming language for a topic's code examples, or None if the topic gives
+    no clear hint (including topics that may not be about programming at all).
+    """
+    text = topic.lower()
+    programming = bool(_CONTEXT_PATTERN.search(text)) or any(
+        specific and specific.search(text) for _, specific, _ in _LANGUAGE_PATTERNS
+    )
+    for language, specific, ambiguous in _LANGUAGE_PATTERNS:
+        if specific and specific.search(text):
+            return language
+        if programming and ambiguous and ambiguous.search(text):
+            return language
+    return None
+
+
+class ModelRouter:
+    def __init__(self, models: Dict[str, Any]):
+        """models maps LIGHT and HEAVY to chat models; trivial calls use the light one."""
+        self.models = models
+        self._lock = threading.Lock()
+        self._tasks: Dict[str, Dict] = {}
+
+    def route(self, task_class: str) -> str:
+        if task_class not in TASK_CLASSES:
+            raise ValueError(f"Unknown task class: {task_class}")
+        return HEAVY if task_class == HEAVY else LIGHT
+
+    def model(self, task: str, task_class: str) -> "RoutedChatModel":
+        """A chat model for one named task, usable anywhere a LangChain model is."""
+        self.route(task_class)
+        return RoutedChatModel(router=self, task=task, task_class=task_class)
+
+    def local(self, task: str, heuristic: Callable[[], Optional[str]]) -> Optional[str]:
+        """Answer a trivial task locally; None means the caller should ask a model."""
+        start = time.monotonic()
+        answer = heuristic()
+        if answer is not None:
+            self.record(task, TRIVIAL, "heuristic", time.monotonic() - start)
+        return answer
+
+    def record(self, task: str, task_class: str, route: str, seconds: float, error: bool = False):
+        with self._lock:
+            entry = self._tasks.setdefault(task, {
+                "task_class": task_class, "calls": 0, "errors": 0, "routes": {},
+                "seconds": 0.0, "latencies": deque(maxlen=LATENCY_WINDOW),
+            })
+            entry["calls"] += 1
+            entry["errors"] += int(error)
+            entry["routes"][route] = entry["routes"].get(route, 0) + 1
+            entry["seconds"] += seconds
+            entry["latencies"].append(seconds)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            tasks = {}
+            for task, entry in self._tasks.items():
+                latencies: Deque[float] = entry["latencies"]
+                ordered = sorted(latencies)
+                tasks[task] = {
+                    "task_class": entry["task_class"],
+                    "calls": entry["calls"],
+                    "errors": entry["errors"],
+                    "routes": dict(entry["routes"]),
+                    "mean_seconds": round(entry["seconds"] / entry["calls"], 4),
+                    "p95_seconds": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 4),
+                }
+        return {"models": {LIGHT: LIGHT_MODEL, HEAVY: MAIN_MODEL}, "tasks": tasks}
+
+
+class RoutedChatModel(BaseChatModel):
+    """Chat model that sends a task's calls to the model for its class and records them."""
+
+    router: Any
+    task: str
+    task_class: str = HEAVY
+
+    @property
+    def _llm_type(self) -> str:
+        return "routed"
+
+    def _target(self, kwargs: Dict):
+        route = self.router.route(self.task_class)
+        if route == LIGHT and not (kwargs.get("generation_config") or {}).get("max_output_tokens"):
+            kwargs = {**kwargs, "generation_config": {**(kwargs.get("generation_config") or {}),
+                                                      "max_output_tokens": LIGHT_MAX_TOKENS}}
+        return route, self.router.models[route], kwargs
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager=None, **kwargs: Any) -> ChatResult:
+        route, model, kwargs = self._target(kwargs)
+        start = time.monotonic()
+        try:
+            result = model._generate(messages, stop=stop, **kwargs)
+        except Exception:
+            self.router.record(self.task, self.task_class, route, time.monotonic() - start, error=True)
+            raise
+        self.router.record(self.task, self.task_class, route, time.monotonic() - start)
+        return result
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager=None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        route, model, kwargs = self._target(kwargs)
+        start = time.monotonic()
+        error = False
+        try:
+            for chunk in model._stream(messages, stop=stop, **kwargs):
+                if run_manager:
+                    run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+                yield chunk
+        except Exception:
+            error = True
+            raise
+        finally:
+            self.router.record(self.task, self.task_class, route, time.monotonic() - start, error=error)
+
+
+router = ModelRouter({LIGHT: get_genai_llm(LIGHT_MODEL), HEAVY: get_genai_llm(MAIN_MODEL)})
@@ -0,0 +1,47 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple, Type
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls that share a key.
+    The first caller runs the work; callers arriving while it is in flight
+    wait for the same result instead of repeating it. Nothing is cached once
+    the call completes.
+
+    If the shared work fails with one of the retry_on exceptions (e.g. the
+    leader's job was cancelled), followers start the work again themselves.
+    """
+
+    def __init__(self, retry_on: Tuple[Type[BaseException], ...] = ()):
+        self.retry_on = retry_on
+        self._in_flight: Dict[Hashable, asyncio.Task] = {}
+        self.stats = {"leaders": 0, "followers": 0}
+
+    def _done(self, key: Hashable, task: asyncio.Task):
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        # Mark the exception as retrieved; callers that are still waiting see it
+        if not task.cancelled():
+            task.exception()
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._in_flight.get(key)
+        leader = task is None
+        if leader:
+            self.stats["leaders"] += 1
+            task = asyncio.ensure_future(fn())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda t: self._done(key, t))
+        else:
+            self.stats["followers"] += 1
+        try:
+            # Shield so a disconnecting caller does not cancel the shared work
+            return await asyncio.shield(task)
+        except self.retry_on:
+            if leader:
+                raise
+            return await self.do(key, fn)
+
+    def in_flight(self) -> int:
+        return len(self._in_flight)
@@ -0,0 +1,108 @@
+"""
+Speculative report prefetching while the learner fills in the clarification form.
+
+When research for a session completes, the parts of its report that do not
+depend on format choices (retrieval, overview, plan and key concepts) are
+generated in the background, guessing that the learner submits the form's
+default answers. If the preferences the report is generated with need the same
+inputs, generate_report finds them in the fragment cache (or waits for the
+ones still in progress). If not, the prefetch is abandoned at its next stage
+boundary and its cached fragments simply age out.
+
+On unless REPORT_PREFETCH=0. A prefetch is a few background-priority LLM calls,
+which live calls always go ahead of, and the form takes the learner long enough
+for it to finish. The fragment cache is per process, so with several workers a
+prefetch only helps when the report request reaches the worker that ran the
+research.
+"""
+import asyncio
+import os
+from typing import Callable, Dict, Optional
+
+from backend.ratelimit import BACKGROUND, llm_priority
+
+
+class PrefetchCancelled(Exception):
+    """Raised inside a prefetch when its session no longer needs it."""
+
+
+class Prefetch:
+    def __init__(self, session_id: str, key: tuple):
+        self.session_id = session_id
+        self.key = key
+        self.cancelled = False
+        self.task: Optional[asyncio.Task] = None
+
+    def check(self, progress: float, message: str = None):
+        if self.cancelled:
+            raise PrefetchCancelled(self.session_id)
+
+
+class ReportPrefetcher:
+    def __init__(self, prefetch: Callable, key: Callable[[Dict], tuple], enabled: bool = True):
+        """
+        prefetch(session_id, preferences, progress) warms the report fragments;
+        key(preferences) gives the preference values those fragments depend on.
+        """
+        self.prefetch = prefetch
+        self.key = key
+        self.enabled = enabled
+        self.running: Dict[str, Prefetch] = {}
+        # joined: final preferences matched a prefetch that was still running
+        self.stats = {"started": 0, "completed": 0, "cancelled": 0, "errors": 0, "joined": 0}
+
+    def start(self, session_id: str, preferences: Dict):
+        """Begin prefetching a session's report with the preferences it is expected to use."""
+        if not self.enabled:
+            return
+        key = self.key(preferences)
+        running = self.running.get(session_id)
+        if running is not None:
+            if running.key == key:
+                return
+            # The expected preferences changed; the old prefetch is no use
+            running.cancelled = True
+        entry = Prefetch(session_id, key)
+        self.running[session_id] = entry
+        self.stats["started"] += 1
+        with llm_priority(BACKGROUND):
+            entry.task = asyncio.create_task(self._run(entry, preferences))
+
+    async def _run(self, entry: Prefetch, preferences: Dict):
+        try:
+            await self.prefetch(entry.session_id, preferences, entry.check)
+            self.stats["completed"] += 1
+        except PrefetchCancelled:
+            self.stats["cancelled"] += 1
+        except Exception as e:
+            self.stats["errors"] += 1
+            print(f"Report prefetch for {entry.session_id} failed: {str(e)}")
+        finally:
+            if self.running.get(entry.session_id) is entry:
+                del self.running[entry.session_id]
+
+    def reconcile(self, session_id: str, preferences: Dict):
+        """
+        Called with the final preferences before generating the report.
+        A compatible prefetch keeps running and is shared; an incompatible one is dropped.
+        """
+        entry = self.running.get(session_id)
+        if entry is None:
+            return
+        if entry.key == self.key(preferences):
+            self.stats["joined"] += 1
+        else:
+            entry.cancelled = True
+
+    async def stop(self):
+        for entry in list(self.running.values()):
+            entry.cancelled = True
+        await asyncio.gather(*(e.task for e in self.running.values() if e.task), return_exceptions=True)
+
+    def status(self) -> Dict:
+        return {"enabled": self.enabled, "running": len(self.running), **self.stats}
+
+
+def create_prefetcher(prefetch: Callable, key: Callable[[Dict], tuple]) -> ReportPrefetcher:
+    """Build the prefetcher configured from the environment."""
+    return ReportPrefetcher(prefetch, key, enabled=os.getenv("REPORT_PREFETCH", "1") == "1")
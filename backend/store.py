@@ -0,0 +1,157 @@
+"""
+Session and job state, optionally shared between backend worker processes.
+
+By default state lives in this process's memory. Set SESSION_STORE to a SQLite
+file path when running several workers (see gunicorn.conf.py) so that every
+worker sees the same sessions and jobs, whichever one a request lands on.
+Session fields are stored as separate rows, so updating one field never
+rewrites (or races with) the others.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+
+class MemorySessionStore:
+    def __init__(self):
+        self._sessions: Dict[str, Dict] = {}
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._sessions
+
+    def create(self, session_id: str, data: Dict):
+        self._sessions[session_id] = dict(data)
+
+    def get(self, session_id: str, *keys: str) -> Optional[Dict]:
+        """Return the session's fields (only the given keys, if any), or None if it does not exist."""
+        session = self._sessions.get(session_id)
+        if session is None:
+            return None
+        if not keys:
+            return dict(session)
+        return {k: session[k] for k in keys if k in session}
+
+    def update(self, session_id: str, **fields: Any):
+        self._sessions[session_id].update(fields)
+
+
+class SQLiteState:
+    """One SQLite connection per thread to a database shared by all workers."""
+
+    SCHEMA = ""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        # Connections are opened lazily per thread; this one must not survive a fork
+        conn = sqlite3.connect(path, timeout=30)
+        try:
+            conn.executescript(self.SCHEMA)
+        finally:
+            conn.close()
+
+    def connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+
+class SQLiteSessionStore(SQLiteState):
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS session_fields (
+        session_id TEXT NOT NULL,
+        key TEXT NOT NULL,
+        value TEXT NOT NULL,
+        PRIMARY KEY (session_id, key)
+    );
+    """
+
+    def __contains__(self, session_id: str) -> bool:
+        row = self.connect().execute(
+            "SELECT 1 FROM session_fields WHERE session_id = ? AND key = 'id'", (session_id,)
+        ).fetchone()
+        return row is not None
+
+    def create(self, session_id: str, data: Dict):
+        with self.connect() as conn:
+            conn.execute("DELETE FROM session_fields WHERE session_id = ?", (session_id,))
+            self._write(conn, session_id, {"id": session_id, **data})
+
+    def get(self, session_id: str, *keys: str) -> Optional[Dict]:
+        """Return the session's fields (only the given keys, if any), or None if it does not exist."""
+        if session_id not in self:
+            return None
+        query = "SELECT key, value FROM session_fields WHERE session_id = ?"
+        params = [session_id]
+        if keys:
+            query += f" AND key IN ({', '.join('?' for _ in keys)})"
+            params.extend(keys)
+        return {key: json.loads(value) for key, value in self.connect().execute(query, params)}
+
+    def update(self, session_id: str, **fields: Any):
+        with self.connect() as conn:
+            self._write(conn, session_id, fields)
+
+    def _write(self, conn: sqlite3.Connection, session_id: str, fields: Dict):
+        conn.executemany(
+            "INSERT OR REPLACE INTO session_fields (session_id, key, value) VALUES (?, ?, ?)",
+            [(session_id, key, json.dumps(value, default=str)) for key, value in fields.items()]
+        )
+
+
+class SQLiteJobStore(SQLiteState):
+    """Job snapshots written by the worker running each job, readable by every worker."""
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS jobs (
+        job_id TEXT PRIMARY KEY,
+        info TEXT NOT NULL,
+        cancel_requested INTEGER NOT NULL DEFAULT 0,
+        updated_at REAL NOT NULL
+    );
+    """
+
+    def save(self, info: Dict):
+        with self.connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (job_id, info, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(job_id) DO UPDATE SET info = excluded.info, updated_at = excluded.updated_at",
+                (info["job_id"], json.dumps(info, default=str), time.time())
+            )
+
+    def load(self, job_id: str) -> Optional[Dict]:
+        row = self.connect().execute("SELECT info FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def request_cancel(self, job_id: str):
+        with self.connect() as conn:
+            conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE job_id = ?", (job_id,))
+
+    def cancel_requested(self, job_id: str) -> bool:
+        row = self.connect().execute(
+            "SELECT cancel_requested FROM jobs WHERE job_id = ?", (job_id,)
+        ).fetchone()
+        return bool(row and row[0])
+
+    def prune(self, cutoff: float):
+        with self.connect() as conn:
+            conn.execute("DELETE FROM jobs WHERE updated_at < ?", (cutoff,))
+
+
+def create_stores():
+    """
+    Build the (session store, job store) pair from SESSION_STORE.
+    The job store is None in memory mode, where each JobManager keeps its own jobs.
+    """
+    path = os.getenv("SESSION_STORE", "memory")
+    if path == "memory":
+        return MemorySessionStore(), None
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    return SQLiteSessionStore(path), SQLiteJobStore(path)
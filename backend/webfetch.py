@@ -0,0 +1,239 @@
+"""
+Full-page fetching for web search results.
+
+Pages are downloaded with one pooled async HTTP client, at most a few at a time
+per host, with connect/read timeouts and a size cap. Responses are revalidated
+with ETag / Last-Modified, so unchanged pages cost a 304 and no re-extraction.
+Main-text extraction uses the standard library HTML parser in a worker thread.
+
+Disabled unless WEB_FETCH_ENABLED=1; results then keep their search snippets.
+"""
+import asyncio
+import os
+import re
+import threading
+from collections import OrderedDict
+from html.parser import HTMLParser
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+
+import httpx
+
+ENABLED = os.getenv("WEB_FETCH_ENABLED", "0") == "1"
+# Seconds to connect, and to wait for the whole response
+CONNECT_TIMEOUT = float(os.getenv("WEB_FETCH_CONNECT_TIMEOUT", "3"))
+TIMEOUT = float(os.getenv("WEB_FETCH_TIMEOUT", "8"))
+PER_HOST = int(os.getenv("WEB_FETCH_PER_HOST", "2"))
+MAX_CONNECTIONS = int(os.getenv("WEB_FETCH_MAX_CONNECTIONS", "20"))
+# Bytes downloaded and characters of text kept per page
+MAX_BYTES = int(os.getenv("WEB_FETCH_MAX_BYTES", str(2 * 1024 * 1024)))
+MAX_CHARS = int(os.getenv("WEB_FETCH_MAX_CHARS", "20000"))
+CACHE_SIZE = int(os.getenv("WEB_FETCH_CACHE_SIZE", "512"))
+
+USER_AGENT = "Mozilla/5.0 (compatible; EILA research assistant)"
+
+# Elements whose text is never main content
+SKIP_TAGS = {"script", "style", "noscript", "nav", "header", "footer", "aside", "form", "svg", "iframe", "template"}
+# Elements that start a new block of text
+BLOCK_TAGS = {"p", "li", "pre", "blockquote", "td", "th", "dd", "dt", "div", "section", "article", "main",
+              "h1", "h2", "h3", "h4", "h5", "h6", "br", "tr", "figcaption"}
+# Containers that usually hold the main content; used when present
+MAIN_TAGS = {"article", "main"}
+VOID_TAGS = {"br", "img", "hr", "meta", "link", "input", "source", "wbr", "area", "base", "col", "embed", "track"}
+# Blocks shorter than this outside a main container are likely menus or buttons
+MIN_BLOCK_CHARS = 40
+
+
+class _TextExtractor(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.skip_depth = 0
+        self.main_depth = 0
+        self.blocks: List[List[str]] = [[]]
+        self.in_main: List[bool] = [False]
+        self.seen_main = False
+
+    def _new_block(self):
+        if self.blocks[-1]:
+            self.blocks.append([])
+            self.in_main.append(self.main_depth > 0)
+        else:
+            self.in_main[-1] = self.main_depth > 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in VOID_TAGS:
+            if tag == "br":
+                self._new_block()
+            return
+        if tag in SKIP_TAGS:
+            self.skip_depth += 1
+        if tag in MAIN_TAGS:
+            self.main_depth += 1
+            self.seen_main = True
+        if tag in BLOCK_TAGS:
+            self._new_block()
+
+    def handle_endtag(self, tag):
+        if tag in VOID_TAGS:
+            return
+        if tag in SKIP_TAGS and self.skip_depth:
+            self.skip_depth -= 1
+        if tag in MAIN_TAGS and self.main_depth:
+            self.main_depth -= 1
+        if tag in BLOCK_TAGS:
+            self._new_block()
+
+    def handle_data(self, data):
+        if not self.skip_depth and data.strip():
+            self.blocks[-1].append(data)
+
+    def text(self) -> str:
+        paragraphs = []
+        for words, in_main in zip(self.blocks, self.in_main):
+            block = re.sub(r"\s+", " ", "".join(words)).strip()
+            if not block:
+                continue
+            if self.seen_main and not in_main:
+                continue
+            if not self.seen_main and len(block) < MIN_BLOCK_CHARS:
+                continue
+            paragraphs.append(block)
+        return "\n\n".join(paragraphs)
+
+
+def extract_text(html: str, max_chars: int = MAX_CHARS) -> str:
+    """Main readable text of an HTML page."""
+    parser = _TextExtractor()
+    try:
+        parser.feed(html)
+        parser.close()
+    except Exception as e:
+        print(f"HTML extraction stopped early: {str(e)}")
+    return parser.text()[:max_chars]
+
+
+class PageCache:
+    """LRU of extracted page text with the validators needed to revalidate it."""
+
+    def __init__(self, max_entries: int = CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, url: str) -> Optional[Dict]:
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is not None:
+                self._entries.move_to_end(url)
+            return entry
+
+    def put(self, url: str, entry: Dict):
+        with self._lock:
+            self._entries[url] = entry
+            self._entries.move_to_end(url)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class PageFetcher:
+    def __init__(self, per_host: int = PER_HOST, connect_timeout: float = CONNECT_TIMEOUT,
+                 timeout: float = TIMEOUT, max_bytes: int = MAX_BYTES, cache: Optional[PageCache] = None):
+        self.per_host = per_host
+        self.connect_timeout = connect_timeout
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.cache = cache or PageCache()
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loop = None
+        self._host_limits: Dict[str, asyncio.Semaphore] = {}
+        self.stats = {"fetched": 0, "not_modified": 0, "errors": 0, "skipped": 0}
+
+    def client(self) -> httpx.AsyncClient:
+        # Clients and semaphores belong to one event loop (e.g. one per worker process)
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout, connect=self.connect_timeout),
+                limits=httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_CONNECTIONS),
+                follow_redirects=True,
+                headers={"User-Agent": USER_AGENT, "Accept": "text/html,text/plain;q=0.9"},
+            )
+            self._loop = loop
+            self._host_limits = {}
+        return self._client
+
+    async def close(self):
+        if self._client is not None and self._loop is asyncio.get_running_loop():
+            await self._client.aclose()
+        self._client = None
+
+    async def fetch(self, url: str) -> Optional[str]:
+        """Extracted text of the page, or None if it cannot be fetched."""
+        try:
+            return await self._fetch(url)
+        except Exception as e:
+            # One bad result (a malformed link, an unknown charset, a parser error)
+            # must not fail the others; its document keeps the search snippet
+            self.stats["errors"] += 1
+            print(f"Fetching {url} failed: {type(e).__name__}: {str(e)}")
+            return None
+
+    async def _fetch(self, url: str) -> Optional[str]:
+        host = urlparse(url).hostname
+        if not host:
+            return None
+        client = self.client()
+        limit = self._host_limits.setdefault(host, asyncio.Semaphore(self.per_host))
+
+        cached = self.cache.get(url)
+        headers = {}
+        if cached:
+            if cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached.get("last_modified"):
+                headers["If-Modified-Since"] = cached["last_modified"]
+
+        async with limit:
+            async with client.stream("GET", url, headers=headers) as response:
+                if response.status_code == 304 and cached:
+                    self.stats["not_modified"] += 1
+                    return cached["text"]
+                content_type = response.headers.get("content-type", "")
+                if response.status_code != 200 or not content_type.startswith(("text/html", "text/plain")):
+                    self.stats["skipped"] += 1
+                    return None
+                body = bytearray()
+                async for chunk in response.aiter_bytes():
+                    body.extend(chunk)
+                    if len(body) >= self.max_bytes:
+                        break
+                encoding = response.encoding or "utf-8"
+                validators = {
+                    "etag": response.headers.get("etag"),
+                    "last_modified": response.headers.get("last-modified"),
+                }
+
+        html = bytes(body).decode(encoding, errors="replace")
+        if content_type.startswith("text/plain"):
+            text = html[:MAX_CHARS]
+        else:
+            text = await asyncio.to_thread(extract_text, html)
+        self.stats["fetched"] += 1
+        if validators["etag"] or validators["last_modified"]:
+            self.cache.put(url, {**validators, "text": text})
+        return text
+
+    async def enrich(self, documents: List[Dict]) -> List[Dict]:
+        """Replace web snippets with full page text where the page can be fetched."""
+        texts = await asyncio.gather(*(self.fetch(doc["source"]) for doc in documents if doc.get("source")))
+        enriched, fetched = [], iter(texts)
+        for doc in documents:
+            text = next(fetched) if doc.get("source") else None
+            # Keep the snippet when the page has less to say than the search result did
+            if text and len(text) > len(doc.get("text") or ""):
+                doc = {**doc, "text": text, "snippet": doc.get("text")}
+            enriched.append(doc)
+        return enriched
+
+
+page_fetcher = PageFetcher()
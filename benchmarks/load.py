@@ -0,0 +1,316 @@
+"""
+Concurrent-session load test for the FastAPI app.
+
+Each simulated learner runs the full flow:
+    /research -> /analyze_preferences -> /generate_report -> /modify_report
+
+By default the app runs in-process with the stubbed external services from
+benchmarks/stubs.py, so event-loop lag and RSS are measured on the serving
+process itself:
+
+    python -m benchmarks.load --sessions 40 --concurrency 8 --llm-latency 0.3 --output run.json
+
+To drive a separately started server (e.g. `python -m benchmarks.load --serve`
+in another shell, or a real deployment), pass --url and optionally --server-pid
+for RSS sampling. Event-loop lag is only available in-process.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+os.environ.setdefault("GEMINI_API_KEY", "offline-benchmark")
+os.environ.setdefault("GEMINI_RPM", "0")
+os.environ.setdefault("GEMINI_TPM", "0")
+
+import httpx  # noqa: E402
+
+from benchmarks import stubs  # noqa: E402
+from benchmarks.pipeline import git_revision  # noqa: E402
+
+ENDPOINTS = ["/research", "/analyze_preferences", "/generate_report", "/modify_report"]
+
+TOPICS = [
+    "Machine Learning Algorithms",
+    "Renewable Energy Technologies",
+    "Blockchain and Cryptocurrencies",
+    "Modern Art Movements",
+    "Quantum Computing",
+    "Climate Change Mitigation",
+    "Ancient Civilizations",
+]
+
+ANSWER_VARIANTS = [
+    {"familiarity": "Beginner", "format": "Text", "depth": "Overview", "time": "15 minutes"},
+    {"familiarity": "Intermediate", "format": "Code examples", "depth": "Moderate depth", "time": "30 minutes"},
+    {"familiarity": "Advanced", "format": "Diagrams", "depth": "In-depth", "time": "1 hour"},
+]
+
+
+def percentile(ordered: List[float], q: float) -> Optional[float]:
+    if not ordered:
+        return None
+    index = min(len(ordered) - 1, max(0, int(round(q * (len(ordered) - 1)))))
+    return round(ordered[index], 6)
+
+
+def latency_stats(samples: List[float]) -> Dict:
+    ordered = sorted(samples)
+    return {
+        "count": len(ordered),
+        "p50": percentile(ordered, 0.50),
+        "p95": percentile(ordered, 0.95),
+        "p99": percentile(ordered, 0.99),
+        "max": round(ordered[-1], 6) if ordered else None,
+    }
+
+
+def read_rss_mb(pid: int) -> Optional[float]:
+    """Resident set size of pid in MB, read from /proc (Linux only)."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+class Recorder:
+    """Collects per-endpoint latencies, errors, loop lag and RSS samples."""
+
+    def __init__(self):
+        self.latencies = {endpoint: [] for endpoint in ENDPOINTS}
+        self.errors = {endpoint: 0 for endpoint in ENDPOINTS}
+        self.loop_lag = []
+        self.rss = []
+        self.completed_sessions = 0
+        self.failed_sessions = 0
+
+    async def call(self, client: httpx.AsyncClient, method: str, endpoint: str, payload: Dict) -> Dict:
+        start = time.perf_counter()
+        try:
+            resp = await client.request(method, endpoint, json=payload)
+            resp.raise_for_status()
+            return resp.json()
+        except Exception:
+            self.errors[endpoint] += 1
+            raise
+        finally:
+            self.latencies[endpoint].append(time.perf_counter() - start)
+
+
+async def run_session(client: httpx.AsyncClient, recorder: Recorder, index: int, think_time: float):
+    rng = random.Random(index)
+    topic = TOPICS[index % len(TOPICS)]
+    answers = {"topic": topic, "focus": "practical applications", **rng.choice(ANSWER_VARIANTS)}
+
+    research = await recorder.call(client, "POST", "/research", {
+        "topic": topic, "objectives": ["Understand basic concepts", "Learn practical applications"],
+    })
+    session_id = research["session_id"]
+    await asyncio.sleep(think_time)
+
+    prefs = await recorder.call(client, "POST", "/analyze_preferences", {
+        "answers": answers, "session_id": session_id,
+    })
+    await recorder.call(client, "POST", "/generate_report", {
+        "session_id": session_id, "preferences": {**answers, **prefs["preferences"]},
+    })
+    await asyncio.sleep(think_time)
+
+    await recorder.call(client, "PATCH", "/modify_report", {
+        "session_id": session_id, "feedback": {"text": "Add more examples."},
+    })
+
+
+async def monitor_loop_lag(recorder: Recorder, interval: float, stop: asyncio.Event):
+    """Measure how late the event loop wakes up from a fixed sleep."""
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        start = loop.time()
+        await asyncio.sleep(interval)
+        recorder.loop_lag.append(max(0.0, loop.time() - start - interval))
+
+
+async def monitor_rss(recorder: Recorder, pid: int, interval: float, started: float, stop: asyncio.Event):
+    while not stop.is_set():
+        rss = read_rss_mb(pid)
+        if rss is not None:
+            recorder.rss.append([round(time.perf_counter() - started, 3), round(rss, 1)])
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=interval)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def run_load(args, recorder: Recorder) -> float:
+    if args.url:
+        transport = None
+        base_url = args.url
+        app = None
+    else:
+        from backend.app import app
+        transport = httpx.ASGITransport(app=app)
+        base_url = "http://loadtest"
+
+    timeout = httpx.Timeout(args.timeout)
+    semaphore = asyncio.Semaphore(args.concurrency)
+    stop = asyncio.Event()
+    started = time.perf_counter()
+
+    async def guarded(client, i):
+        async with semaphore:
+            try:
+                await run_session(client, recorder, i, args.think_time)
+                recorder.completed_sessions += 1
+            except Exception as e:
+                recorder.failed_sessions += 1
+                print(f"Session {i} failed: {e!r}", file=sys.stderr)
+
+    monitors = [asyncio.create_task(monitor_rss(
+        recorder, args.server_pid or os.getpid(), args.sample_interval, started, stop))]
+    if not args.url:
+        monitors.append(asyncio.create_task(monitor_loop_lag(recorder, args.lag_interval, stop)))
+
+    async def drive():
+        async with httpx.AsyncClient(transport=transport, base_url=base_url, timeout=timeout) as client:
+            await asyncio.gather(*(guarded(client, i) for i in range(args.sessions)))
+
+    try:
+        if app is not None:
+            async with app.router.lifespan_context(app):
+                await drive()
+        else:
+            await drive()
+    finally:
+        stop.set()
+        await asyncio.gather(*monitors)
+    return time.perf_counter() - started
+
+
+def build_cassette(args) -> stubs.Cassette:
+    return stubs.Cassette(args.cassette, mode="replay", latency={
+        "google": args.search_latency,
+        "arxiv": args.arxiv_latency,
+        "youtube": args.youtube_latency,
+        "llm": args.llm_latency,
+    })
+
+
+def serve(args):
+    """Run the app with stubbed services so --url runs can target it."""
+    import uvicorn
+    stubs.install(build_cassette(args), args.transcript_segments, args.response_words,
+                  args.llm_429_every)
+    from backend import indexing
+    from backend.app import app
+    # Indexes built under load are throwaway; keep them out of the repository's indexes/
+    with tempfile.TemporaryDirectory(prefix="eila-load-") as index_dir:
+        indexing.INDEX_DIR = index_dir
+        uvicorn.run(app, host="127.0.0.1", port=args.port)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Concurrent-session load test")
+    parser.add_argument("--label", default="default", help="Name of the configuration under test")
+    parser.add_argument("--sessions", type=int, default=20, help="Total learner sessions to run")
+    parser.add_argument("--concurrency", type=int, default=5, help="Sessions in flight at once")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Pause between user steps (s)")
+    parser.add_argument("--timeout", type=float, default=600.0, help="Per-request timeout (s)")
+    parser.add_argument("--url", help="Target a running server instead of the in-process app")
+    parser.add_argument("--server-pid", type=int, help="PID to sample RSS from when using --url")
+    parser.add_argument("--serve", action="store_true", help="Start a stubbed server and exit when stopped")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--cassette", default=stubs.DEFAULT_CASSETTE)
+    parser.add_argument("--search-latency", type=float, default=0.2)
+    parser.add_argument("--arxiv-latency", type=float, default=0.3)
+    parser.add_argument("--youtube-latency", type=float, default=0.3)
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--transcript-segments", type=int, default=600)
+    parser.add_argument("--response-words", type=int, default=200)
+    parser.add_argument("--llm-429-every", type=int, default=0,
+                        help="Inject a quota error on every Nth LLM call")
+    parser.add_argument("--lag-interval", type=float, default=0.05)
+    parser.add_argument("--sample-interval", type=float, default=1.0)
+    parser.add_argument("--output", help="Write JSON results to this file (default: stdout)")
+    args = parser.parse_args(argv)
+
+    if args.serve:
+        serve(args)
+        return 0
+
+    cassette = None
+    originals = {}
+    if not args.url:
+        cassette = build_cassette(args)
+        originals = stubs.install(cassette, args.transcript_segments, args.response_words,
+                                  args.llm_429_every)
+
+    recorder = Recorder()
+    try:
+        with tempfile.TemporaryDirectory(prefix="eila-load-") as index_dir:
+            if not args.url:
+                from backend import indexing
+                indexing.INDEX_DIR = index_dir
+            # Keep stdout clean for the JSON results
+            with contextlib.redirect_stdout(sys.stderr):
+                elapsed = asyncio.run(run_load(args, recorder))
+    finally:
+        stubs.uninstall(originals)
+
+    requests_done = sum(len(v) for v in recorder.latencies.values())
+    rss_values = [mb for _, mb in recorder.rss]
+    results = {
+        "meta": {
+            "label": args.label,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "target": args.url or "in-process",
+            "sessions": args.sessions,
+            "concurrency": args.concurrency,
+            "think_time": args.think_time,
+            "latency": cassette.latency if cassette else None,
+        },
+        "elapsed_s": round(elapsed, 3),
+        "throughput": {
+            "sessions_per_s": round(recorder.completed_sessions / elapsed, 4),
+            "requests_per_s": round(requests_done / elapsed, 4),
+            "completed_sessions": recorder.completed_sessions,
+            "failed_sessions": recorder.failed_sessions,
+        },
+        "endpoints": {
+            endpoint: {**latency_stats(samples), "errors": recorder.errors[endpoint]}
+            for endpoint, samples in recorder.latencies.items()
+        },
+        "event_loop_lag": latency_stats(recorder.loop_lag) if recorder.loop_lag else None,
+        "rss_mb": {
+            "peak": max(rss_values) if rss_values else None,
+            "samples": recorder.rss,
+        },
+        "external_calls": dict(cassette.calls) if cassette else None,
+    }
+    if not args.url:
+        from backend.ratelimit import get_governor
+        results["llm_governor"] = get_governor().stats()
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+    return 0 if recorder.failed_sessions == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
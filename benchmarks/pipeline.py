@@ -0,0 +1,242 @@
+"""
+Offline benchmark of the research -> index -> report pipeline.
+
+Usage:
+    python -m benchmarks.pipeline --repeat 3 --output bench.json
+    python -m benchmarks.pipeline --llm-latency 0.5 --compare bench.json
+
+External services are replaced by the record/replay stand-ins in
+benchmarks/stubs.py. Use --mode record (with real API keys) to refresh the
+cassette.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+# The Gemini client is constructed at import time; it is never called in replay mode
+os.environ.setdefault("GEMINI_API_KEY", "offline-benchmark")
+# Measure the pipeline itself rather than quota pacing unless asked to
+os.environ.setdefault("GEMINI_RPM", "0")
+os.environ.setdefault("GEMINI_TPM", "0")
+
+from benchmarks import stubs  # noqa: E402
+from backend.routing import router  # noqa: E402
+
+STAGES = ["perform_research", "index_documents", "research_and_index", "get_session_index",
+          "generate_report", "modify_report"]
+
+DEFAULT_TOPIC = "Machine Learning Algorithms"
+DEFAULT_OBJECTIVES = ["Understand basic concepts", "Learn practical applications"]
+DEFAULT_PREFERENCES = {
+    "familiarity": "Intermediate",
+    "depth_level": 2,
+    "focus_area": "practical applications",
+    "include_visuals": False,
+    "include_code": True,
+    "include_videos": False,
+    "session_time": 30,
+}
+DEFAULT_FEEDBACK = {"text": "Add more real-world examples to the sections on applications."}
+
+
+def summarize(samples: List[float]) -> Dict:
+    ordered = sorted(samples)
+    p95_index = min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))
+    return {
+        "runs": [round(s, 6) for s in samples],
+        "min": round(ordered[0], 6),
+        "median": round(statistics.median(ordered), 6),
+        "mean": round(statistics.fmean(ordered), 6),
+        "p95": round(ordered[p95_index], 6),
+        "max": round(ordered[-1], 6),
+    }
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return "unknown"
+
+
+async def run_once(index_dir: str, run: int, cassette: stubs.Cassette, topic: str,
+                   objectives: List[str], preferences: Dict, feedback: Dict) -> Dict:
+    """Run every stage once and return {stage: seconds} plus external call counts."""
+    from backend import indexing, papers
+    from backend.indexing import get_session_index, index_documents, index_stream
+    from backend.report import generate_report, modify_report
+    from backend.research import perform_research, query_cache, stream_research
+
+    indexing.INDEX_DIR = index_dir
+    session_id = f"bench_{run}"
+    timings = {}
+    calls = {}
+
+    async def measure(stage, coro_or_fn, *args):
+        cassette.reset_counts()
+        # Every research stage searches from scratch
+        query_cache.clear()
+        if papers.ENABLED:
+            # ...and extracts every paper again
+            shutil.rmtree(papers.paper_fetcher.cache_dir, ignore_errors=True)
+        start = time.perf_counter()
+        result = coro_or_fn(*args)
+        if asyncio.iscoroutine(result):
+            result = await result
+        timings[stage] = time.perf_counter() - start
+        calls[stage] = dict(cassette.calls)
+        return result
+
+    docs = await measure("perform_research", perform_research, topic, objectives)
+    await measure("index_documents", index_documents, session_id, docs)
+    # The streaming path used by /research: embedding overlaps with fetching
+    await measure("research_and_index", index_stream, stream_research(topic, objectives))
+    await measure("get_session_index", get_session_index, session_id)
+    await measure("generate_report", generate_report, session_id, {"topic": topic, **preferences})
+    await measure("modify_report", modify_report, session_id, feedback)
+    # The page fetcher's client belongs to this run's event loop
+    from backend.webfetch import page_fetcher
+    await page_fetcher.close()
+    await papers.paper_fetcher.close()
+    return {"timings": timings, "calls": calls, "documents": len(docs)}
+
+
+def compare(results: Dict, baseline_path: str, threshold: float) -> List[str]:
+    """Return a list of stages whose median regressed by more than threshold."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    regressions = []
+    for stage, stats in results["stages"].items():
+        base = baseline.get("stages", {}).get(stage)
+        if not base or base["median"] <= 0:
+            continue
+        change = stats["median"] / base["median"] - 1
+        stats["change_vs_baseline"] = round(change, 4)
+        if change > threshold:
+            regressions.append(f"{stage}: {base['median']:.4f}s -> {stats['median']:.4f}s ({change:+.1%})")
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Offline pipeline benchmark")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--topic", default=DEFAULT_TOPIC)
+    parser.add_argument("--cassette", default=stubs.DEFAULT_CASSETTE)
+    parser.add_argument("--mode", choices=["replay", "record"], default="replay")
+    parser.add_argument("--search-latency", type=float, default=0.0)
+    parser.add_argument("--arxiv-latency", type=float, default=0.0)
+    parser.add_argument("--youtube-latency", type=float, default=0.0)
+    parser.add_argument("--llm-latency", type=float, default=0.0)
+    parser.add_argument("--light-llm-latency", type=float, default=None,
+                        help="Latency of calls routed to the light model (default: --llm-latency)")
+    parser.add_argument("--transcript-segments", type=int, default=600)
+    parser.add_argument("--response-words", type=int, default=200)
+    parser.add_argument("--web-fetch", action="store_true",
+                        help="Fetch full pages for web results from a local page server")
+    parser.add_argument("--page-latency", type=float, default=0.0)
+    parser.add_argument("--arxiv-full-text", action="store_true",
+                        help="Index arXiv full text extracted from local PDF fixtures")
+    parser.add_argument("--output", help="Write JSON results to this file (default: stdout)")
+    parser.add_argument("--compare", help="Baseline JSON file to compare medians against")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="Relative median slowdown that counts as a regression")
+    args = parser.parse_args(argv)
+
+    latency = {
+        "google": args.search_latency,
+        "arxiv": args.arxiv_latency,
+        "youtube": args.youtube_latency,
+        "llm": args.llm_latency,
+    }
+    if args.light_llm_latency is not None:
+        latency["llm_light"] = args.light_llm_latency
+    cassette = stubs.Cassette(args.cassette, mode=args.mode, latency=latency)
+    page_server = None
+    if args.web_fetch:
+        from backend import webfetch
+        page_server = stubs.PageServer(latency=args.page_latency)
+        webfetch.ENABLED = True
+    pdf_dir = None
+    if args.arxiv_full_text:
+        from backend import papers
+        pdf_dir = tempfile.mkdtemp(prefix="eila-papers-")
+        papers.ENABLED = True
+        papers.paper_fetcher.pdf_dir = pdf_dir
+        papers.paper_fetcher.cache_dir = os.path.join(pdf_dir, "text")
+    originals = stubs.install(cassette, args.transcript_segments, args.response_words,
+                              page_server=page_server, pdf_dir=pdf_dir)
+
+    samples = {stage: [] for stage in STAGES}
+    calls = {}
+    documents = 0
+    try:
+        with tempfile.TemporaryDirectory(prefix="eila-bench-") as index_dir:
+            for run in range(args.repeat):
+                # Keep stdout clean for the JSON results
+                with contextlib.redirect_stdout(sys.stderr):
+                    outcome = asyncio.run(run_once(
+                        index_dir, run, cassette, args.topic, DEFAULT_OBJECTIVES,
+                        DEFAULT_PREFERENCES, DEFAULT_FEEDBACK,
+                    ))
+                for stage, seconds in outcome["timings"].items():
+                    samples[stage].append(seconds)
+                calls = outcome["calls"]
+                documents = outcome["documents"]
+    finally:
+        cassette.save()
+        stubs.uninstall(originals)
+        if page_server:
+            page_server.close()
+        if pdf_dir:
+            from backend.papers import paper_fetcher
+            paper_fetcher.shutdown()
+            shutil.rmtree(pdf_dir, ignore_errors=True)
+
+    results = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "repeat": args.repeat,
+            "topic": args.topic,
+            "mode": args.mode,
+            "latency": cassette.latency,
+            "web_fetch": args.web_fetch,
+            "arxiv_full_text": args.arxiv_full_text,
+            "documents": documents,
+        },
+        "stages": {stage: summarize(values) for stage, values in samples.items()},
+        "external_calls": calls,
+        "routing": router.stats()["tasks"],
+    }
+
+    regressions = compare(results, args.compare, args.threshold) if args.compare else []
+    results["regressions"] = regressions
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+
+    for line in regressions:
+        print(f"REGRESSION {line}", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,392 @@
+"""
+Deterministic local stand-ins for the external services used by the backend.
+
+Every stand-in is backed by a JSON cassette. In "replay" mode responses come
+from the cassette, and anything missing is synthesized deterministically from
+the request so the suite also runs without a recording. In "record" mode the
+real client is called and its response is written to the cassette.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+from langchain_core.language_models.llms import LLM
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+DEFAULT_CASSETTE = os.path.join(FIXTURES_DIR, "cassette.json")
+
+# Artificial latency in seconds per service, applied in both modes
+DEFAULT_LATENCY = {
+    "google": 0.0,
+    "arxiv": 0.0,
+    "youtube": 0.0,
+    "llm": 0.0,
+}
+
+_WORDS = (
+    "model data learning system method result network training example "
+    "concept process structure analysis value function signal theory layer "
+    "energy input output approach application research design feature"
+).split()
+
+
+def _key(*parts) -> str:
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def _synthetic_text(seed: str, words: int) -> str:
+    """Deterministic filler text derived from the seed."""
+    digest = hashlib.sha256(seed.encode()).digest()
+    out = []
+    for i in range(words):
+        out.append(_WORDS[(digest[i % len(digest)] ^ (i * 7)) % len(_WORDS)])
+    sentences = [" ".join(out[i:i + 12]).capitalize() + "." for i in range(0, len(out), 12)]
+    return " ".join(sentences)
+
+
+class Cassette:
+    """Record/replay store shared by all stand-ins."""
+
+    def __init__(self, path: str = DEFAULT_CASSETTE, mode: str = "replay",
+                 latency: Optional[Dict[str, float]] = None):
+        if mode not in ("replay", "record"):
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        self.path = path
+        self.mode = mode
+        self.latency = {**DEFAULT_LATENCY, **(latency or {})}
+        # Calls routed to the light model (backend.routing) are as slow as the others unless set
+        self.latency.setdefault("llm_light", self.latency["llm"])
+        self.calls = {service: 0 for service in self.latency}
+        self._lock = threading.Lock()
+        self.data = {service: {} for service in self.latency}
+        if os.path.exists(path):
+            with open(path) as f:
+                for service, entries in json.load(f).items():
+                    self.data.setdefault(service, {}).update(entries)
+
+    def fetch(self, service: str, key: str, real, synthetic):
+        """Return the recorded response for key, calling real() or synthetic() when absent."""
+        with self._lock:
+            self.calls[service] = self.calls.get(service, 0) + 1
+        delay = self.latency.get(service, 0.0)
+        if delay:
+            time.sleep(delay)
+
+        entries = self.data.setdefault(service, {})
+        if key in entries:
+            return entries[key]
+        value = real() if self.mode == "record" else synthetic()
+        with self._lock:
+            entries[key] = value
+        return value
+
+    def save(self):
+        if self.mode != "record":
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "w") as f:
+            json.dump(self.data, f, indent=1, sort_keys=True)
+
+    def reset_counts(self):
+        with self._lock:
+            for service in self.calls:
+                self.calls[service] = 0
+
+
+def make_google_search(cassette: Cassette, real_cls=None, link_base: str = "https://example.com"):
+    """
+    Build a stand-in for serpapi.GoogleSearch bound to the cassette.
+    Synthetic web results link to pages under link_base (e.g. a PageServer).
+    """
+
+    class ReplayGoogleSearch:
+        def __init__(self, params: Dict):
+            self.params = dict(params)
+
+        def get_dict(self) -> Dict:
+            engine = self.params.get("engine", "google")
+            query = self.params.get("q") or self.params.get("search_query", "")
+            return cassette.fetch(
+                "google",
+                _key(engine, query),
+                lambda: real_cls(self.params).get_dict(),
+                lambda: self._synthetic(engine, query),
+            )
+
+        @staticmethod
+        def _synthetic(engine: str, query: str) -> Dict:
+            seed = _key(engine, query)
+            if engine == "youtube":
+                return {"video_results": [
+                    {"title": f"{query} part {i + 1}",
+                     "link": f"https://www.youtube.com/watch?v={seed[:8]}{i:03d}"}
+                    for i in range(5)
+                ]}
+            return {"organic_results": [
+                {"position": i + 1,
+                 "title": f"{query} resource {i + 1}",
+                 "link": f"{link_base}/{seed}/{i + 1}",
+                 "snippet": _synthetic_text(f"{seed}:{i}", 25)}
+                for i in range(10)
+            ]}
+
+    return ReplayGoogleSearch
+
+
+PAGE_TEMPLATE = """<!DOCTYPE html>
+<html><head><title>{title}</title><script>var tracking = "not content";</script>
+<style>body {{ margin: 0; }}</style></head>
+<body><nav><a href="/">Home</a> <a href="/about">About</a></nav>
+<article><h1>{title}</h1>
+{paragraphs}
+</article>
+<footer>Copyright notice and links</footer></body></html>
+"""
+
+
+class PageServer:
+    """
+    Local HTTP stand-in for the web pages behind search results.
+    Every path serves a deterministic article with an ETag and Last-Modified
+    header; requests carrying a matching validator get 304 Not Modified.
+    """
+
+    def __init__(self, latency: float = 0.0, paragraphs: int = 12):
+        self.latency = latency
+        self.paragraphs = paragraphs
+        self.stats = {"requests": 0, "not_modified": 0}
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with server._lock:
+                    server.stats["requests"] += 1
+                if server.latency:
+                    time.sleep(server.latency)
+                seed = _key("page", self.path)
+                etag = f'"{seed}"'
+                if self.headers.get("If-None-Match") == etag:
+                    with server._lock:
+                        server.stats["not_modified"] += 1
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.end_headers()
+                    return
+                body = PAGE_TEMPLATE.format(
+                    title=f"Article {self.path}",
+                    paragraphs="\n".join(
+                        f"<p>{_synthetic_text(f'{seed}:{i}', 60)}</p>" for i in range(server.paragraphs)
+                    ),
+                ).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("ETag", etag)
+                self.send_header("Last-Modified", "Mon, 01 Jan 2024 00:00:00 GMT")
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self._server.server_address[1]}"
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class _ArxivResult:
+    def __init__(self, entry_id: str, title: str, summary: str, pdf_url: str = None):
+        self.entry_id = entry_id
+        self.title = title
+        self.summary = summary
+        self.pdf_url = pdf_url
+
+
+def write_paper_pdf(path: str, title: str, seed: str, pages: int = 8):
+    """Write a synthetic paper as a PDF, for the full-text extractor (backend.papers)."""
+    from fpdf import FPDF
+
+    pdf = FPDF()
+    pdf.set_font("Helvetica", size=11)
+    for page in range(pages):
+        pdf.add_page()
+        if page == 0:
+            pdf.multi_cell(0, 8, title, new_x="LMARGIN", new_y="NEXT")
+        pdf.multi_cell(0, 6, _synthetic_text(f"{seed}:page{page}", 450), new_x="LMARGIN", new_y="NEXT")
+    tmp_path = f"{path}.tmp"
+    pdf.output(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def make_arxiv_search(cassette: Cassette, real_cls=None, pdf_dir: Optional[str] = None, pdf_pages: int = 8):
+    """
+    Build a stand-in for arxiv.Search bound to the cassette.
+    With a pdf_dir, a PDF of every paper returned is written there, named as
+    backend.papers reads them from ARXIV_PDF_DIR.
+    """
+
+    class ReplaySearch:
+        def __init__(self, query: str = "", max_results: int = 10, **kwargs):
+            self.query = query
+            self.max_results = max_results
+            self.kwargs = kwargs
+
+        def _real(self) -> List[Dict]:
+            return [
+                {"entry_id": p.entry_id, "title": p.title, "summary": p.summary,
+                 "pdf_url": getattr(p, "pdf_url", None)}
+                for p in real_cls(query=self.query, max_results=self.max_results,
+                                  **self.kwargs).results()
+            ]
+
+        def _synthetic(self) -> List[Dict]:
+            seed = _key("arxiv", self.query)
+            return [
+                {"entry_id": f"http://arxiv.org/abs/2401.{int(seed[:4], 16) % 9000 + 1000}{i}v1",
+                 "title": f"On {self.query} ({i + 1})",
+                 "summary": _synthetic_text(f"{seed}:{i}", 180),
+                 "pdf_url": None}
+                for i in range(self.max_results)
+            ]
+
+        def results(self):
+            papers = cassette.fetch(
+                "arxiv", _key(self.query, self.max_results), self._real, self._synthetic
+            )
+            for p in papers[:self.max_results]:
+                if pdf_dir:
+                    self._write_pdf(p)
+                yield _ArxivResult(**p)
+
+        def _write_pdf(self, paper: Dict):
+            from backend.papers import arxiv_id
+
+            paper_id = arxiv_id(paper["entry_id"])
+            path = os.path.join(pdf_dir, f"{paper_id.replace('/', '_')}.pdf") if paper_id else None
+            if path and not os.path.exists(path):
+                write_paper_pdf(path, paper["title"], paper["entry_id"], pdf_pages)
+
+    return ReplaySearch
+
+
+def make_transcript_api(cassette: Cassette, real_cls=None, segments: int = 600):
+    """Build a stand-in for YouTubeTranscriptApi bound to the cassette."""
+
+    class ReplayTranscriptApi:
+        @staticmethod
+        def get_transcript(video_id: str, *args, **kwargs) -> List[Dict]:
+            def synthetic():
+                return [
+                    {"text": _synthetic_text(f"{video_id}:{i}", 10),
+                     "start": i * 5.0, "duration": 5.0}
+                    for i in range(segments)
+                ]
+            return cassette.fetch(
+                "youtube", _key(video_id),
+                lambda: real_cls.get_transcript(video_id, *args, **kwargs),
+                synthetic,
+            )
+
+    return ReplayTranscriptApi
+
+
+class ReplayLLM(LLM):
+    """LangChain LLM served from the cassette, optionally recording a real chat model."""
+
+    cassette: Any
+    inner: Any = None
+    # Cassette section (and latency) for this model's calls
+    service: str = "llm"
+    response_words: int = 200
+    # Raise a quota error on every Nth call (0 disables) to exercise the governor
+    fail_every: int = 0
+    calls: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "replay"
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None,
+              run_manager=None, **kwargs: Any) -> str:
+        def real():
+            return self.inner.invoke(prompt, **kwargs).content
+
+        self.calls += 1
+        if self.fail_every and self.calls % self.fail_every == 0:
+            raise RuntimeError("429 Resource has been exhausted (e.g. check quota).")
+        # Output caps change the response, so capped calls are recorded separately
+        max_tokens = (kwargs.get("generation_config") or {}).get("max_output_tokens")
+        key = _key(f"{prompt}\0{max_tokens}") if max_tokens else _key(prompt)
+        return self.cassette.fetch(self.service, key, real, lambda: self._synthetic(prompt, max_tokens))
+
+    def _synthetic(self, prompt: str, max_tokens: Optional[int] = None) -> str:
+        seed = _key(prompt)
+        if "Return only a JSON object" in prompt:
+            return json.dumps({
+                "objectives": ["Explain the core ideas", "Apply the main techniques",
+                               "Evaluate common trade-offs"],
+                "sections": ["Foundations", "Core Techniques", "Practical Applications", "Open Problems"],
+                "language": "Python",
+            })
+        if "separated by commas" in prompt:
+            return "Foundations, Core Techniques, Practical Applications, Open Problems"
+        if "language name" in prompt:
+            return "Python"
+        if "NO_OUTPUT" in prompt:
+            # Contextual compression extractor: return a short extract
+            return _synthetic_text(seed, 60)
+        # Synthetic words average about two estimated tokens each
+        words = min(self.response_words, max_tokens // 2) if max_tokens else self.response_words
+        return _synthetic_text(seed, words)
+
+
+def install(cassette: Cassette, transcript_segments: int = 600, response_words: int = 200,
+            llm_fail_every: int = 0, page_server: Optional[PageServer] = None,
+            pdf_dir: Optional[str] = None) -> Dict:
+    """
+    Patch the backend modules to use the stand-ins.
+    With a page_server, synthetic web results link to its pages, so the
+    full-page fetcher (backend.webfetch) can be exercised locally. With a
+    pdf_dir, arXiv results get PDF fixtures there for backend.papers.
+    Returns the replaced attributes so they can be restored with uninstall().
+    """
+    import backend.research as research
+    from backend.ratelimit import GovernedChatModel, get_governor
+    from backend.routing import HEAVY, LIGHT, router
+
+    def replay_model(route: str, service: str) -> GovernedChatModel:
+        return GovernedChatModel(
+            inner=ReplayLLM(cassette=cassette, inner=router.models[route].inner, service=service,
+                            response_words=response_words, fail_every=llm_fail_every),
+            governor=get_governor(),
+        )
+
+    patches = {
+        (research, "GoogleSearch"): make_google_search(
+            cassette, research.GoogleSearch, page_server.url if page_server else "https://example.com"),
+        (research, "Search"): make_arxiv_search(cassette, research.Search, pdf_dir),
+        (research, "YouTubeTranscriptApi"): make_transcript_api(
+            cassette, research.YouTubeTranscriptApi, transcript_segments),
+        (router, "models"): {LIGHT: replay_model(LIGHT, "llm_light"), HEAVY: replay_model(HEAVY, "llm")},
+    }
+    originals = {}
+    for (module, name), replacement in patches.items():
+        originals[(module, name)] = getattr(module, name)
+        setattr(module, name, replacement)
+    return originals
+
+
+def uninstall(originals: Dict):
+    for (module, name), value in originals.items():
+        setattr(module, name, value)
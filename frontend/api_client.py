@@ -0,0 +1,111 @@
+import json
+import os
+import time
+from typing import Dict, Iterator, List, Optional
+
+import requests
+import streamlit as st
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Load API URL from environment or default
+API_URL = os.getenv("API_URL", "http://localhost:8000")
+# Backend address as seen from the user's browser, for direct download links
+PUBLIC_API_URL = os.getenv("PUBLIC_API_URL", API_URL)
+
+# Seconds to wait for a single HTTP call, and for a whole background job
+CONNECT_TIMEOUT = float(os.getenv("API_CONNECT_TIMEOUT", "5"))
+REQUEST_TIMEOUT = float(os.getenv("API_TIMEOUT", "30"))
+JOB_TIMEOUT = float(os.getenv("JOB_TIMEOUT", "1800"))
+
+# How long static backend responses (e.g. clarification questions) stay cached
+STATIC_CACHE_TTL = int(os.getenv("API_CACHE_TTL", "3600"))
+
+
+@st.cache_resource
+def get_http_session() -> requests.Session:
+    """One keep-alive connection pool shared by every rerun and user of this Streamlit server."""
+    session = requests.Session()
+    # Only idempotent methods are retried on connection errors
+    retry = Retry(total=2, backoff_factor=0.3, allowed_methods={"GET", "DELETE"},
+                  status_forcelist=(502, 503, 504))
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=32, max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def api_request(method: str, path: str, timeout: Optional[float] = None, **kwargs) -> Dict:
+    resp = get_http_session().request(
+        method, f"{API_URL}{path}", timeout=(CONNECT_TIMEOUT, timeout or REQUEST_TIMEOUT), **kwargs
+    )
+    resp.raise_for_status()
+    return resp.json()
+
+
+def api_get(path: str, **params) -> Dict:
+    return api_request("GET", path, params=params)
+
+
+def api_post(path: str, payload: Dict) -> Dict:
+    return api_request("POST", path, json=payload)
+
+
+@st.cache_data(ttl=STATIC_CACHE_TTL, max_entries=256, show_spinner=False)
+def get_clarification_questions(topic: str) -> List[Dict]:
+    """Clarification questions depend only on the topic, so they are cached per topic."""
+    return api_post("/clarify", {"answers": {"topic": topic}}).get("questions", [])
+
+
+def clear_topic_cache(topic: Optional[str] = None):
+    """Drop cached responses for a topic (or for every topic)."""
+    if topic is None:
+        get_clarification_questions.clear()
+    else:
+        get_clarification_questions.clear(topic)
+
+
+def export_url(session_id: str, fmt: str) -> str:
+    """Link to a report export served (and cached) by the backend."""
+    return f"{PUBLIC_API_URL}/export/{session_id}?format={fmt}"
+
+
+def stream_answer(session_id: str, question: str) -> Iterator[str]:
+    """Yield the backend's answer to a follow-up question as it is generated."""
+    with get_http_session().post(
+        f"{API_URL}/ask",
+        json={"session_id": session_id, "questions": [question], "stream": True},
+        timeout=(CONNECT_TIMEOUT, REQUEST_TIMEOUT),
+        stream=True,
+    ) as resp:
+        resp.raise_for_status()
+        for line in resp.iter_lines():
+            if not line:
+                continue
+            event = json.loads(line)
+            if "delta" in event:
+                yield event["delta"]
+            elif event.get("cached"):
+                yield event["answer"]
+
+
+def run_job(path: str, payload: Dict, label: str) -> Dict:
+    """Submit a background job to the backend and poll it until it finishes."""
+    job = api_post(path, payload)
+
+    progress_bar = st.progress(0.0, text=label)
+    deadline = time.monotonic() + JOB_TIMEOUT
+    try:
+        while job["status"] in ("queued", "running"):
+            if time.monotonic() > deadline:
+                api_request("DELETE", f"/jobs/{job['job_id']}")
+                raise TimeoutError(f"{label} did not finish in time")
+            time.sleep(1)
+            job = api_get(f"/jobs/{job['job_id']}")
+            progress_bar.progress(job.get("progress", 0.0), text=f"{label}: {job.get('message', '')}")
+    finally:
+        progress_bar.empty()
+
+    if job["status"] != "succeeded":
+        raise RuntimeError(job.get("error") or f"Job {job['status']}")
+    return job["result"]
@@ -1,11 +1,10 @@
-import os
 import streamlit as st
-import requests
 import json
 from typing import Dict, List
 
-# Load API URL from environment or default
-API_URL = os.getenv("API_URL", "http://localhost:8000")
+from api_client import (
+    api_post, clear_topic_cache, export_url, get_clarification_questions, run_job, stream_answer
+)
 
 # Session steps
 START, RESEARCH, CLARIFY, GENERATE, MODIFY = "start", "research", "clarify", "generate", "modify"
@@ -26,6 +25,11 @@ if "report" not in st.session_state:
 if "documents" not in st.session_state:
     st.session_state.documents = []
 
+def document_preview(doc: Dict) -> str:
+    """Preview text for a research document returned by /research."""
+    preview = doc.get("preview", doc.get("text", ""))
+    return preview + "..." if doc.get("length", len(preview)) > len(preview) else preview
+
 # Sidebar navigation
 st.sidebar.title("Learning Assistant")
 st.sidebar.markdown("---")
@@ -92,9 +96,7 @@ if st.session_state.step == START:
                     
                     payload = {"topic": st.session_state.topic, "objectives": st.session_state.objectives}
                     try:
-                        resp = requests.post(f"{API_URL}/research", json=payload)
-                        resp.raise_for_status()
-                        research_data = resp.json()
+                        research_data = run_job("/jobs/research", payload, "Researching")
                         
                         if research_data:
                             st.session_state.session_id = research_data.get("session_id")
@@ -140,7 +142,7 @@ elif st.session_state.step == RESEARCH:
             if web_docs:
                 for i, doc in enumerate(web_docs):
                     with st.expander(f"Source {i+1}: {doc['source'][:50]}..."):
-                        st.markdown(doc['text'][:300] + "..." if len(doc['text']) > 300 else doc['text'])
+                        st.markdown(document_preview(doc))
             else:
                 st.info("No web content found.")
         
@@ -148,7 +150,7 @@ elif st.session_state.step == RESEARCH:
             if arxiv_docs:
                 for i, doc in enumerate(arxiv_docs):
                     with st.expander(f"Paper {i+1}: {doc['source']}"):
-                        st.markdown(doc['text'][:300] + "..." if len(doc['text']) > 300 else doc['text'])
+                        st.markdown(document_preview(doc))
             else:
                 st.info("No academic papers found.")
         
@@ -156,7 +158,7 @@ elif st.session_state.step == RESEARCH:
             if video_docs:
                 for i, doc in enumerate(video_docs):
                     with st.expander(f"Video {i+1}: {doc['source']}"):
-                        st.markdown(doc['text'][:300] + "..." if len(doc['text']) > 300 else doc['text'])
+                        st.markdown(document_preview(doc))
             else:
                 st.info("No video transcripts found.")
         
@@ -181,10 +183,8 @@ elif st.session_state.step == CLARIFY:
                 st.markdown(f"- **Source {i+1}**: {doc['source'][:50]}...")
     
     try:
-        resp = requests.post(f"{API_URL}/clarify", json={"answers": {"topic": st.session_state.topic}})
-        resp.raise_for_status()
-        resp_data = resp.json()
-        questions = resp_data.get("questions", [])
+        # Cached per topic, so reruns of this step make no network calls
+        questions = get_clarification_questions(st.session_state.topic)
     except Exception as e:
         st.error(f"API call failed: {str(e)}")
         questions = []
@@ -214,9 +214,7 @@ elif st.session_state.step == CLARIFY:
             
             with st.spinner("Analyzing preferences..."):
                 try:
-                    resp = requests.post(f"{API_URL}/analyze_preferences", json=payload)
-                    resp.raise_for_status()
-                    prefs = resp.json()
+                    prefs = api_post("/analyze_preferences", payload)
                     st.session_state.preferences = prefs.get("preferences", {})
                 except Exception as e:
                     st.error(f"API call failed: {str(e)}")
@@ -231,9 +229,7 @@ elif st.session_state.step == CLARIFY:
                     }
                 }
                 try:
-                    resp = requests.post(f"{API_URL}/generate_report", json=report_payload)
-                    resp.raise_for_status()
-                    rpt = resp.json()
+                    rpt = run_job("/jobs/generate_report", report_payload, "Generating report")
                     st.session_state.report = rpt.get("report", "")
                     st.session_state.step = GENERATE
                     st.rerun()
@@ -253,6 +249,19 @@ elif st.session_state.step == GENERATE:
     else:
         st.markdown(st.session_state.report)
         
+        # Follow-up questions are answered from the research index, streamed as they are written
+        st.markdown("---")
+        st.subheader("Ask a Follow-up Question")
+        with st.form("ask_form", clear_on_submit=True):
+            question = st.text_input("Question about this topic")
+            asked = st.form_submit_button("Ask")
+        if asked and question.strip():
+            st.markdown(f"**Q:** {question}")
+            try:
+                st.write_stream(stream_answer(st.session_state.session_id, question))
+            except Exception as e:
+                st.error(f"API call failed: {str(e)}")
+        
         st.sidebar.markdown("### Report Actions")
         # Markdown download option
         download_btn = st.sidebar.download_button(
@@ -262,102 +271,16 @@ elif st.session_state.step == GENERATE:
             mime="text/markdown"
         )
         
-        # Add PDF download option
-        if "pdf_report" not in st.session_state:
-            with st.spinner("Preparing PDF..."):
-                try:
-                    # Install with: pip install fpdf2 markdown
-                    import markdown
-                    from fpdf import FPDF
-                    import tempfile
-                    import re
-                    
-                    # Convert markdown to HTML
-                    html = markdown.markdown(st.session_state.report)
-                    
-                    # Create PDF
-                    class PDF(FPDF):
-                        def header(self):
-                            self.set_font('Arial', 'B', 12)
-                            self.cell(0, 10, f'Learning Report: {st.session_state.topic}', 0, 1, 'C')
-                            self.ln(10)
-                        
-                        def footer(self):
-                            self.set_y(-15)
-                            self.set_font('Arial', 'I', 8)
-                            self.cell(0, 10, f'Page {self.page_no()}', 0, 0, 'C')
-                    
-                    # Initialize PDF with Unicode support
-                    pdf = PDF()
-                    pdf.add_page()
-                    pdf.set_font('Arial', '', 11)
-                    
-                    # Remove HTML tags for simplicity
-                    text = re.sub(r'<[^>]*>', '', html)
-                    
-                    # Replace problematic Unicode characters with ASCII equivalents
-                    replacements = {
-                        '\u2013': '-',  # en dash
-                        '\u2014': '--',  # em dash
-                        '\u2018': "'",   # left single quote
-                        '\u2019': "'",   # right single quote
-                        '\u201c': '"',   # left double quote
-                        '\u201d': '"',   # right double quote
-                        '\u2022': '*',   # bullet
-                        '\u2026': '...',  # ellipsis
-                        '\u00a0': ' ',   # non-breaking space
-                    }
-                    
-                    for unicode_char, ascii_char in replacements.items():
-                        text = text.replace(unicode_char, ascii_char)
-                    
-                    # Process headings, bold, etc.
-                    lines = text.split('\n')
-                    for line in lines:
-                        try:
-                            if line.startswith('# '):  # Main heading
-                                pdf.set_font('Arial', 'B', 16)
-                                pdf.cell(0, 10, line[2:], 0, 1)
-                                pdf.ln(5)
-                            elif line.startswith('## '):  # Subheading
-                                pdf.set_font('Arial', 'B', 14)
-                                pdf.cell(0, 10, line[3:], 0, 1)
-                                pdf.ln(3)
-                            elif line.startswith('### '):  # Sub-subheading
-                                pdf.set_font('Arial', 'B', 12)
-                                pdf.cell(0, 10, line[4:], 0, 1)
-                                pdf.ln(3)
-                            else:
-                                pdf.set_font('Arial', '', 11)
-                                # Skip empty lines
-                                if line.strip():
-                                    pdf.multi_cell(0, 5, line)
-                                    pdf.ln(2)
-                        except Exception as line_error:
-                            # Skip problematic lines
-                            st.sidebar.warning(f"Skipped a line with invalid characters")
-                            continue
-                    
-                    # Save PDF to a temporary file
-                    with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp:
-                        pdf.output(tmp.name)
-                        
-                        # Read the PDF file
-                        with open(tmp.name, 'rb') as pdf_file:
-                            st.session_state.pdf_report = pdf_file.read()
-                        
-                except Exception as e:
-                    st.sidebar.error(f"PDF creation failed: {str(e)}")
-                    st.session_state.pdf_report = None
-        
-        # Add PDF download button if PDF was successfully created
-        if st.session_state.pdf_report:
-            pdf_download_btn = st.sidebar.download_button(
-                "Download Report (PDF)",
-                data=st.session_state.pdf_report,
-                file_name=f"{st.session_state.topic.replace(' ', '_')}_report.pdf",
-                mime="application/pdf"
-            )
+        # PDF and HTML are rendered and cached by the backend, and downloaded
+        # by the browser directly so this page never waits on them
+        st.sidebar.link_button(
+            "Download Report (PDF)",
+            export_url(st.session_state.session_id, "pdf")
+        )
+        st.sidebar.link_button(
+            "Download Report (HTML)",
+            export_url(st.session_state.session_id, "html")
+        )
         
         st.sidebar.markdown("### Customize Report")
 
@@ -385,6 +308,8 @@ elif st.session_state.step == MODIFY:
     
     with col2:
         if st.button("Start Over"):
+            if "topic" in st.session_state:
+                clear_topic_cache(st.session_state.topic)
             for key in ["step", "answers", "documents", "report", "session_id"]:
                 if key in st.session_state:
                     del st.session_state[key]
@@ -0,0 +1,53 @@
+"""
+Multi-worker serving mode for the backend:
+
+    gunicorn backend.app:app
+
+The app (and with it the embedding model) is imported once in the master
+process and shared copy-on-write by the forked workers. Set SESSION_STORE to
+a SQLite file so workers share sessions and jobs.
+
+Runs one worker unless WEB_CONCURRENCY says otherwise. With more, only
+sessions, jobs and saved indexes are shared. Everything else stays per worker:
+request coalescing (SingleFlight), the research cache and pre-warmer, the
+report fragment cache and speculative report prefetch. Two identical requests
+landing on different workers are each computed in full, and a prefetch only
+helps if the later report request reaches the same worker.
+"""
+import gc
+import multiprocessing
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+# One worker by default: coalescing and the in-memory caches are per process
+workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+worker_class = "uvicorn.workers.UvicornWorker"
+# Load models and read-only assets before forking
+preload_app = True
+# Report generation requests can take minutes
+timeout = int(os.getenv("WORKER_TIMEOUT", "600"))
+graceful_timeout = 30
+keepalive = 5
+
+
+def when_ready(server):
+    # Move everything loaded so far out of the collector's view; otherwise the
+    # first collection in each worker touches every object and un-shares its page
+    gc.collect()
+    gc.freeze()
+    if workers > 1 and os.getenv("SESSION_STORE", "memory") == "memory":
+        server.log.warning("SESSION_STORE is not set; each worker keeps its own sessions and jobs")
+
+
+def post_fork(server, worker):
+    from backend.ratelimit import get_governor
+
+    # The Gemini quota is for the whole node, so each worker paces itself to its share
+    get_governor().share(workers)
+    try:
+        import torch
+
+        # Split CPU threads for embedding between workers instead of oversubscribing
+        torch.set_num_threads(max(1, multiprocessing.cpu_count() // workers))
+    except ImportError:
+        pass
@@ -1,17 +1,35 @@
+import asyncio
+
 from arxiv import Search
 from langchain import LLMChain, PromptTemplate
-from backend.deps import init_genai
+from backend.papers import paper_fetcher
+from backend.routing import HEAVY, router
 
-genai = init_genai()
+# Characters of each paper's full text put in the prompt
+PAPER_PROMPT_CHARS = 8000
 
 class ArxivChain:
-    def __init__(self, max_results: int = 3):
+    def __init__(self, max_results: int = 3, full_text: bool = False):
         self.max_results = max_results
-        self.llm = genai
+        # Summarize the papers' full text instead of their abstracts
+        self.full_text = full_text
+        self.llm = router.model("arxiv_summary", HEAVY)
 
-    def run(self, topic: str) -> str:
+    def _papers(self, topic: str) -> list[dict]:
         search_results = Search(query=topic, max_results=self.max_results)
-        abstracts = "\n---\n".join(p.summary for p in search_results.results())
+        docs = [{"source": p.entry_id, "text": p.summary} for p in search_results.results()]
+        if self.full_text:
+            docs = asyncio.run(self._enrich(docs))
+        return docs
+
+    async def _enrich(self, docs: list[dict]) -> list[dict]:
+        try:
+            return await paper_fetcher.enrich(docs)
+        finally:
+            await paper_fetcher.close()
+
+    def run(self, topic: str) -> str:
+        abstracts = "\n---\n".join(doc["text"][:PAPER_PROMPT_CHARS] for doc in self._papers(topic))
         prompt = PromptTemplate(
             input_variables=["abstracts", "topic"],
             template="""
@@ -22,4 +40,4 @@ Summarize the key findings and trends.
 """
         )
         chain = LLMChain(llm=self.llm, prompt=prompt)
-        return chain.run({"abstracts": abstracts, "topic": topic})
\ No newline at end of file
+        return chain.run({"abstracts": abstracts, "topic": topic})
@@ -1,21 +1,62 @@
-from langchain.chains import RetrievalQA
+from typing import Iterator, List, Optional
+from langchain.prompts import PromptTemplate
 from langchain_community.vectorstores import FAISS
-from langchain_community.embeddings import HuggingFaceEmbeddings    
-from backend.deps import init_genai
+from langchain.docstore.document import Document
+from backend.routing import HEAVY, router
+from backend.indexing import get_session_index
 
-# Initialize embeddings & LLM
-embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
+# Answers are long-form; embeddings come from the session index, which reuses backend.indexing's model
+llm = router.model("answer", HEAVY)
 
-llm = init_genai()
+QA_PROMPT = PromptTemplate(
+    input_variables=["context", "question"],
+    template="""
+Answer the question using the research context below. Be concise and specific.
+If the context does not contain the answer, say so.
+
+Context:
+{context}
+
+Question: {question}
+
+Answer:
+"""
+)
 
 class QAChain:
-    def __init__(self, faiss_index_path: str):
-        self.db = FAISS.load_local(faiss_index_path, embeddings)
-        self.chain = RetrievalQA.from_chain_type(
-            llm=llm,
-            chain_type="stuff",
-            retriever=self.db.as_retriever()
-        )
+    """Question answering over a session's research index."""
+
+    def __init__(self, vectorstore: FAISS, model=None, k: int = 4):
+        self.db = vectorstore
+        self.model = model
+        self.k = k
+
+    @property
+    def llm(self):
+        return self.model or llm
+
+    @classmethod
+    def from_session(cls, session_id: str, **kwargs) -> Optional["QAChain"]:
+        """Build a chain over the session's cached index, or None if it has no index."""
+        vectorstore = get_session_index(session_id)
+        if vectorstore is None:
+            return None
+        return cls(vectorstore, **kwargs)
+
+    def retrieve(self, question: str) -> List[Document]:
+        return self.db.similarity_search(question, k=self.k)
+
+    def _prompt(self, question: str) -> str:
+        context = "\n\n".join(doc.page_content for doc in self.retrieve(question))
+        return QA_PROMPT.format(context=context, question=question)
 
     def run(self, question: str) -> str:
-        return self.chain.run(question)
\ No newline at end of file
+        result = self.llm.invoke(self._prompt(question))
+        return getattr(result, "content", str(result)).strip()
+
+    def stream(self, question: str) -> Iterator[str]:
+        """Yield the answer in pieces as the model produces them."""
+        for chunk in self.llm.stream(self._prompt(question)):
+            text = getattr(chunk, "content", str(chunk))
+            if text:
+                yield text
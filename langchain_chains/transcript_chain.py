@@ -1,24 +1,112 @@
+import contextvars
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
 from youtube_transcript_api import YouTubeTranscriptApi
 from langchain import LLMChain, PromptTemplate
-from backend.deps import init_genai
+from backend.ratelimit import estimate_tokens
+from backend.routing import HEAVY, LIGHT, router
 
-genai = init_genai()
+# Window summaries are short and extractive; the final summary is the long-form output
+map_llm = router.model("transcript_map", LIGHT)
+llm = router.model("transcript_summary", HEAVY)
 
-class TranscriptChain:
-    def __init__(self):
-        self.llm = genai
+# Transcript tokens per map window, and summary tokens per reduce step
+WINDOW_TOKENS = int(os.getenv("TRANSCRIPT_WINDOW_TOKENS", "4000"))
+REDUCE_TOKENS = int(os.getenv("TRANSCRIPT_REDUCE_TOKENS", "6000"))
+# Most window summaries in flight at once (the shared governor still applies)
+MAP_CONCURRENCY = int(os.getenv("TRANSCRIPT_MAP_CONCURRENCY", "4"))
 
-    def run(self, video_id: str) -> str:
-        transcript = YouTubeTranscriptApi.get_transcript(video_id)
-        text = " ".join(seg['text'] for seg in transcript)
-        prompt = PromptTemplate(
-            input_variables=["transcript_text"],
-            template="""
+STUFF_PROMPT = PromptTemplate(
+    input_variables=["transcript_text"],
+    template="""
 Below is a transcript from a video:
 {transcript_text}
 
 Provide a concise summary of this content.
 """
-        )
-        chain = LLMChain(llm=self.llm, prompt=prompt)
-        return chain.run({"transcript_text": text})
\ No newline at end of file
+)
+
+MAP_PROMPT = PromptTemplate(
+    input_variables=["transcript_text", "part", "parts"],
+    template="""
+Below is part {part} of {parts} of a video transcript:
+{transcript_text}
+
+Summarize the key points of this part in a few sentences.
+"""
+)
+
+REDUCE_PROMPT = PromptTemplate(
+    input_variables=["summaries"],
+    template="""
+Below are summaries of consecutive parts of a video, in order:
+{summaries}
+
+Combine them into one concise summary of the whole content.
+"""
+)
+
+def split_windows(texts: List[str], max_tokens: int, separator: str = " ") -> List[str]:
+    """Group consecutive pieces of text into windows of at most max_tokens (estimated)."""
+    windows, current, size = [], [], 0
+    for text in texts:
+        tokens = estimate_tokens(text)
+        if current and size + tokens > max_tokens:
+            windows.append(separator.join(current))
+            current, size = [], 0
+        current.append(text)
+        size += tokens
+    if current:
+        windows.append(separator.join(current))
+    return windows
+
+class TranscriptChain:
+    def __init__(self, mode: str = "auto", window_tokens: int = WINDOW_TOKENS,
+                 reduce_tokens: int = REDUCE_TOKENS, max_concurrency: int = MAP_CONCURRENCY):
+        """
+        mode: "stuff" sends the whole transcript in one prompt, "map_reduce"
+        summarizes windows concurrently and combines them, "auto" picks
+        map_reduce only when the transcript does not fit in one window.
+        """
+        if mode not in ("auto", "stuff", "map_reduce"):
+            raise ValueError(f"Unknown summarization mode: {mode}")
+        self.llm = llm
+        self.map_llm = map_llm
+        self.mode = mode
+        self.window_tokens = window_tokens
+        self.reduce_tokens = reduce_tokens
+        self.max_concurrency = max_concurrency
+
+    def _run(self, prompt: PromptTemplate, inputs: Dict, model=None) -> str:
+        return LLMChain(llm=model or self.llm, prompt=prompt).run(inputs).strip()
+
+    def _run_all(self, pool: ThreadPoolExecutor, prompt: PromptTemplate, inputs: List[Dict],
+                 model=None) -> List[str]:
+        # Worker threads inherit the caller's context so LLM priority carries over
+        context = contextvars.copy_context()
+        return list(pool.map(lambda item: context.copy().run(self._run, prompt, item, model), inputs))
+
+    def run(self, video_id: str) -> str:
+        transcript = YouTubeTranscriptApi.get_transcript(video_id)
+        return self.summarize([seg['text'] for seg in transcript])
+
+    def summarize(self, segments: List[str]) -> str:
+        windows = split_windows(segments, self.window_tokens)
+        if self.mode == "stuff" or (self.mode == "auto" and len(windows) <= 1):
+            return self._run(STUFF_PROMPT, {"transcript_text": " ".join(segments)})
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as pool:
+            # Map: summarize every window concurrently
+            summaries = self._run_all(pool, MAP_PROMPT, [
+                {"transcript_text": window, "part": i + 1, "parts": len(windows)}
+                for i, window in enumerate(windows)
+            ], model=self.map_llm)
+            # Reduce: combine groups of summaries that fit one prompt, level by level
+            while len(summaries) > 1:
+                groups = split_windows(summaries, self.reduce_tokens, separator="\n\n")
+                if len(groups) == len(summaries):
+                    # Each summary fills a prompt on its own; pair them so the tree still shrinks
+                    groups = ["\n\n".join(summaries[i:i + 2]) for i in range(0, len(summaries), 2)]
+                summaries = self._run_all(pool, REDUCE_PROMPT, [{"summaries": group} for group in groups])
+        return summaries[0]
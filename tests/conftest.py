@@ -0,0 +1,7 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# backend.deps builds the Gemini clients at import time; no request is made with this key
+os.environ.setdefault("GEMINI_API_KEY", "test-key")
@@ -0,0 +1,71 @@
+import asyncio
+import contextlib
+
+from backend import batch
+from backend.batch import BatchEntry, group_topics, run_batch
+from backend.report import NO_RESEARCH_ERROR
+
+
+def test_entries_on_one_topic_share_research_with_all_objectives():
+    groups = group_topics([
+        BatchEntry(topic="Quantum Computing ", objectives=["qubits", "gates"]),
+        BatchEntry(topic="quantum  computing", objectives=["gates", "algorithms"]),
+        BatchEntry(topic="Rust", objectives=["ownership"]),
+    ])
+    assert groups == {
+        "quantum computing": ("Quantum Computing", ["qubits", "gates", "algorithms"]),
+        "rust": ("Rust", ["ownership"]),
+    }
+
+
+def test_default_objectives_are_grouped_too():
+    groups = group_topics([BatchEntry(topic="Rust"), BatchEntry(topic="rust")])
+    assert groups["rust"][1] == BatchEntry(topic="Rust").objectives
+
+
+async def _research(topic, objectives):
+    await asyncio.sleep(0.01)
+    if topic == "Missing":
+        return {"documents": [], "corpus_id": "none", "index_path": ""}
+    return {"documents": [{"text": topic}], "corpus_id": f"corpus_{topic}", "index_path": ""}
+
+
+def test_no_research_report_is_a_failed_entry(monkeypatch):
+    async def fake_report(corpus_id, preferences, executor=None):
+        return NO_RESEARCH_ERROR if corpus_id == "none" else f"# {preferences['topic']}"
+
+    monkeypatch.setattr(batch, "generate_report", fake_report)
+
+    async def scenario():
+        entries = [BatchEntry(topic="Rust"), BatchEntry(topic="Missing")]
+        return [item async for item in run_batch(entries, research=_research)]
+
+    results = {result["topic"]: (result, corpus) for result, corpus in asyncio.run(scenario())}
+    assert results["Rust"][0]["status"] == "succeeded"
+    assert results["Rust"][0]["report"] == "# Rust"
+    assert results["Missing"][0]["status"] == "failed"
+    assert results["Missing"][0]["error"] == NO_RESEARCH_ERROR
+    assert results["Missing"][1] is None
+
+
+def test_closing_the_batch_cancels_remaining_entries(monkeypatch):
+    started = []
+
+    async def slow_report(corpus_id, preferences, executor=None):
+        started.append(corpus_id)
+        await asyncio.sleep(0 if corpus_id == "corpus_Fast" else 10)
+        return "# Report"
+
+    monkeypatch.setattr(batch, "generate_report", slow_report)
+
+    async def scenario():
+        entries = [BatchEntry(topic="Fast"), BatchEntry(topic="Slow"), BatchEntry(topic="Slower")]
+        async with contextlib.aclosing(run_batch(entries, research=_research, concurrency=2)) as results:
+            async for result, _ in results:
+                break
+        # Nothing from the batch is left running once it is closed
+        return result, [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+
+    first, leftover = asyncio.run(scenario())
+    assert first["topic"] == "Fast"
+    assert leftover == []
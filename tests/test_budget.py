@@ -0,0 +1,40 @@
+import pytest
+
+from backend.budget import DEFAULT_SESSION_TIME, MIN_CALL_TOKENS, TIERS, plan_budget
+
+
+@pytest.mark.parametrize("minutes, tier", [
+    (5, 15), (15, 15), (29, 15), (30, 30), (59, 30), (60, 60), (90, 60), (120, 120), (600, 120),
+])
+def test_session_time_picks_largest_fitting_tier(minutes, tier):
+    budget = plan_budget(minutes, 2)
+    assert budget.max_sections == TIERS[tier]["max_sections"]
+    assert budget.target_tokens == TIERS[tier]["target_tokens"]
+
+
+def test_missing_session_time_uses_default_tier():
+    assert plan_budget(None, 2) == plan_budget(DEFAULT_SESSION_TIME, 2)
+    assert plan_budget(0, 2) == plan_budget(DEFAULT_SESSION_TIME, 2)
+
+
+def test_short_sessions_skip_compression_and_resources():
+    short = plan_budget(15, 2)
+    assert not short.compress
+    assert not short.include_resources
+    assert short.retrieval_k < plan_budget(120, 2).retrieval_k
+
+
+def test_depth_scales_tokens_and_retrieval():
+    basic, standard, advanced = (plan_budget(60, depth) for depth in (1, 2, 3))
+    assert basic.target_tokens < standard.target_tokens < advanced.target_tokens
+    assert advanced.retrieval_k == standard.retrieval_k + 1
+    assert plan_budget(60, None) == standard
+    assert plan_budget(60, 7) == standard
+
+
+def test_call_tokens_split_target_over_core_calls():
+    for minutes in TIERS:
+        budget = plan_budget(minutes, 1)
+        calls = 3 + budget.max_sections + int(budget.include_resources)
+        assert budget.call_tokens == max(MIN_CALL_TOKENS, budget.target_tokens // calls)
+        assert budget.call_tokens >= MIN_CALL_TOKENS
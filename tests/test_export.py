@@ -0,0 +1,38 @@
+import asyncio
+import os
+import time
+
+from backend import export
+from backend.export import prune_exports
+
+
+def _touch(path, age):
+    with open(path, "w") as f:
+        f.write("x")
+    stamp = time.time() - age
+    os.utime(path, (stamp, stamp))
+
+
+def test_prune_keeps_most_recent_files(tmp_path):
+    for i in range(5):
+        _touch(tmp_path / f"{i}.md", age=i * 10)
+    assert prune_exports(str(tmp_path), max_files=3, max_age=3600) == 2
+    assert sorted(os.listdir(tmp_path)) == ["0.md", "1.md", "2.md"]
+
+
+def test_prune_drops_expired_files(tmp_path):
+    _touch(tmp_path / "fresh.md", age=10)
+    _touch(tmp_path / "old.md", age=7200)
+    assert prune_exports(str(tmp_path), max_files=10, max_age=3600) == 1
+    assert os.listdir(tmp_path) == ["fresh.md"]
+
+
+def test_export_reuses_file_and_marks_it_served(tmp_path, monkeypatch):
+    monkeypatch.setattr(export, "EXPORT_DIR", str(tmp_path))
+    path, media_type = asyncio.run(export.export_report("# Report", "Topic", "md"))
+    assert media_type.startswith("text/markdown")
+    old = time.time() - 600
+    os.utime(path, (old, old))
+    again, _ = asyncio.run(export.export_report("# Report", "Topic", "md"))
+    assert again == path
+    assert os.path.getmtime(path) > old
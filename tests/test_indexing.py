@@ -0,0 +1,118 @@
+import os
+import threading
+
+import pytest
+from langchain.docstore.document import Document
+from langchain_community.vectorstores import FAISS
+
+from backend import indexing
+from backend.indexing import corpus_id, embeddings, index_exists, load_index, save_index
+
+
+def _vectorstore():
+    vectors = [("qubits hold superpositions", [1.0, 0.0, 0.0]), ("gates rotate qubits", [0.0, 1.0, 0.0])]
+    return FAISS.from_embeddings(vectors, embeddings, metadatas=[{"source": "a"}, {"source": "b"}])
+
+
+def test_saved_index_round_trips(tmp_path):
+    save_index(_vectorstore(), str(tmp_path))
+    loaded = load_index(str(tmp_path))
+
+    [doc] = loaded.similarity_search_by_vector([0.0, 0.9, 0.1], k=1)
+    assert doc.page_content == "gates rotate qubits"
+    assert doc.metadata == {"source": "b"}
+    assert loaded.docstore.search("missing") == "ID missing not found."
+
+
+def test_saved_index_is_read_only(tmp_path):
+    save_index(_vectorstore(), str(tmp_path))
+    loaded = load_index(str(tmp_path))
+
+    with pytest.raises(RuntimeError, match="read-only"):
+        loaded.docstore.add({"new": Document(page_content="new text")})
+    with pytest.raises(RuntimeError, match="read-only"):
+        loaded.docstore.delete(list(loaded.index_to_docstore_id.values()))
+
+
+def test_corpus_id_ignores_document_order():
+    docs = [{"source": "a", "type": "web", "text": "x"}, {"source": "b", "type": "arxiv", "text": "y"}]
+    assert corpus_id(docs) == corpus_id(list(reversed(docs)))
+    assert corpus_id(docs) != corpus_id(docs[:1])
+
+
+
+def _texts(index_path):
+    loaded = load_index(index_path)
+    return sorted(loaded.docstore.search(i).page_content for i in loaded.index_to_docstore_id.values())
+
+
+def _leftovers(directory):
+    return [name for name in os.listdir(directory) if ".tmp-" in name or ".stale-" in name]
+
+
+def test_existing_index_is_kept(tmp_path):
+    index_path = str(tmp_path / "corpus_1")
+    save_index(_vectorstore(), index_path)
+    other = FAISS.from_embeddings([("other text", [0.0, 0.0, 1.0])], embeddings)
+
+    assert indexing._write_index(index_path, other) == index_path
+    assert _texts(index_path) == ["gates rotate qubits", "qubits hold superpositions"]
+    assert _leftovers(tmp_path) == []
+
+
+def test_concurrent_writers_of_one_corpus_all_succeed(tmp_path):
+    index_path = str(tmp_path / "corpus_1")
+    barrier = threading.Barrier(4, timeout=5)
+    save = indexing.save_index
+    results, errors = [], []
+
+    def save_together(vectorstore, path):
+        save(vectorstore, path)
+        # Every writer has its temporary index ready before any renames it into place
+        barrier.wait()
+
+    def write():
+        try:
+            results.append(indexing._write_index(index_path, _vectorstore()))
+        except Exception as e:
+            errors.append(e)
+
+    indexing.save_index = save_together
+    try:
+        threads = [threading.Thread(target=write) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        indexing.save_index = save
+
+    assert errors == []
+    assert results == [index_path] * 4
+    assert index_exists(index_path)
+    assert _texts(index_path) == ["gates rotate qubits", "qubits hold superpositions"]
+    assert _leftovers(tmp_path) == []
+
+
+def test_writer_losing_the_rename_succeeds(tmp_path, monkeypatch):
+    index_path = str(tmp_path / "corpus_1")
+    discard = indexing._discard_stale_index
+
+    def other_writer_finishes(path):
+        discard(path)
+        save_index(_vectorstore(), path)
+
+    monkeypatch.setattr(indexing, "_discard_stale_index", other_writer_finishes)
+    assert indexing._write_index(index_path, _vectorstore()) == index_path
+    assert index_exists(index_path)
+    assert _leftovers(tmp_path) == []
+
+
+def test_incomplete_index_is_replaced(tmp_path):
+    index_path = tmp_path / "corpus_1"
+    index_path.mkdir()
+    (index_path / "index.pkl").write_bytes(b"old format")
+
+    indexing._write_index(str(index_path), _vectorstore())
+    assert sorted(os.listdir(index_path)) == ["docstore.sqlite", "index.faiss"]
+    assert _leftovers(tmp_path) == []
@@ -0,0 +1,190 @@
+import asyncio
+import threading
+
+from backend.jobs import CANCELLED, FAILED, RUNNING, SUCCEEDED, JobManager
+from backend.ratelimit import BACKGROUND, INTERACTIVE
+from backend.store import SQLiteJobStore
+
+
+def test_interactive_jobs_run_before_background_jobs():
+    async def scenario():
+        jobs = JobManager(workers=1)
+        order = []
+
+        def work(name):
+            async def run(job):
+                order.append(name)
+                return name
+            return run
+
+        # Queued together before the single worker gets a chance to run
+        jobs.submit("batch", work("background 1"), priority=BACKGROUND)
+        jobs.submit("batch", work("background 2"), priority=BACKGROUND)
+        jobs.submit("research", work("interactive 1"), priority=INTERACTIVE)
+        jobs.submit("research", work("interactive 2"), priority=INTERACTIVE)
+        while len(order) < 4:
+            await asyncio.sleep(0.01)
+        await jobs.stop()
+        return order
+
+    assert asyncio.run(scenario()) == ["interactive 1", "interactive 2", "background 1", "background 2"]
+
+
+def test_succeeded_job_keeps_its_result():
+    async def scenario():
+        jobs = JobManager(workers=1)
+
+        async def work(job):
+            job.update(0.5, "Halfway")
+            return {"report": "# Report"}
+
+        job = jobs.submit("generate_report", work, params={"session_id": "s1"})
+        while job.status != SUCCEEDED:
+            await asyncio.sleep(0.01)
+        await jobs.stop()
+        return jobs.info(job.id), jobs.info(job.id, include_result=False)
+
+    info, summary = asyncio.run(scenario())
+    assert info["status"] == SUCCEEDED
+    assert info["progress"] == 1.0
+    assert info["result"] == {"report": "# Report"}
+    assert info["params"] == {"session_id": "s1"}
+    assert "result" not in summary
+
+
+def test_cancel_queued_job():
+    async def scenario():
+        jobs = JobManager(workers=1)
+        release = asyncio.Event()
+        ran = []
+
+        async def blocker(job):
+            await release.wait()
+
+        async def work(job):
+            ran.append(job.id)
+
+        jobs.submit("research", blocker)
+        queued = jobs.submit("research", work)
+        await asyncio.sleep(0.01)
+        info = jobs.cancel(queued.id)
+        release.set()
+        await asyncio.sleep(0.05)
+        await jobs.stop()
+        return info, ran
+
+    info, ran = asyncio.run(scenario())
+    assert info["status"] == CANCELLED
+    assert info["message"] == "Cancelled before start"
+    assert ran == []
+
+
+def test_cancel_running_job():
+    async def scenario():
+        jobs = JobManager(workers=1)
+        started = asyncio.Event()
+
+        async def work(job):
+            started.set()
+            await asyncio.sleep(10)
+
+        job = jobs.submit("research", work)
+        await started.wait()
+        jobs.cancel(job.id)
+        while job.status == RUNNING:
+            await asyncio.sleep(0.01)
+        # The worker survives and takes the next job
+        after = jobs.submit("research", lambda job: asyncio.sleep(0, result="next"))
+        while after.status != SUCCEEDED:
+            await asyncio.sleep(0.01)
+        await jobs.stop()
+        return job, after
+
+    job, after = asyncio.run(scenario())
+    assert job.status == CANCELLED
+    assert job.message == "Cancelled"
+    assert after.result == "next"
+
+
+def test_cancel_from_another_worker_stops_job_at_next_update(tmp_path):
+    # Work in a thread cannot be interrupted; it stops when job.update raises JobCancelled
+    async def scenario():
+        path = str(tmp_path / "sessions.db")
+        owner = JobManager(workers=1, store=SQLiteJobStore(path))
+        other = JobManager(workers=1, store=SQLiteJobStore(path))
+        started, proceed = threading.Event(), threading.Event()
+        steps = []
+
+        def blocking_work(job):
+            job.update(0.1, "Step 1")
+            steps.append(1)
+            started.set()
+            proceed.wait(5)
+            job.update(0.5, "Step 2")
+            steps.append(2)
+
+        job = owner.submit("research", lambda job: asyncio.to_thread(blocking_work, job))
+        await asyncio.to_thread(started.wait, 5)
+        info = other.cancel(job.id)
+        proceed.set()
+        while job.status == RUNNING:
+            await asyncio.sleep(0.01)
+        await owner.stop()
+        return info, job, steps, other.info(job.id)
+
+    info, job, steps, shared = asyncio.run(scenario())
+    assert info["status"] == RUNNING
+    assert steps == [1]
+    assert job.status == CANCELLED
+    assert job.message == "Cancelled"
+    assert shared["status"] == CANCELLED
+
+
+def test_failed_job_records_error():
+    async def scenario():
+        jobs = JobManager(workers=1)
+
+        async def work(job):
+            raise ValueError("No research data")
+
+        job = jobs.submit("generate_report", work)
+        while job.status not in (FAILED, SUCCEEDED):
+            await asyncio.sleep(0.01)
+        # A failed job does not stop the worker
+        after = jobs.submit("research", lambda job: asyncio.sleep(0, result="ok"))
+        while after.status != SUCCEEDED:
+            await asyncio.sleep(0.01)
+        await jobs.stop()
+        return jobs.info(job.id), jobs.stats()
+
+    info, stats = asyncio.run(scenario())
+    assert info["status"] == FAILED
+    assert info["message"] == "Failed"
+    assert info["error"] == "No research data"
+    assert "result" not in info
+    assert stats["failed"] == 1
+    assert stats["succeeded"] == 1
+
+
+def test_shutdown_cancels_running_and_queued_jobs(tmp_path):
+    async def scenario():
+        store = SQLiteJobStore(str(tmp_path / "sessions.db"))
+        jobs = JobManager(workers=1, store=store)
+        started = asyncio.Event()
+
+        async def work(job):
+            started.set()
+            await asyncio.sleep(10)
+
+        running = jobs.submit("research", work)
+        queued = jobs.submit("research", work)
+        await started.wait()
+        await jobs.stop()
+        return running, queued, store.load(running.id), store.load(queued.id)
+
+    running, queued, saved_running, saved_queued = asyncio.run(scenario())
+    for job, saved in ((running, saved_running), (queued, saved_queued)):
+        assert job.status == CANCELLED
+        assert job.message == "Server shutting down"
+        assert job.finished_at is not None
+        assert saved["status"] == CANCELLED
@@ -0,0 +1,85 @@
+import threading
+import time
+
+import pytest
+
+from backend.memo import FragmentCache, freeze
+
+
+def test_freeze_ignores_dict_order():
+    assert freeze({"a": 1, "b": [1, {"c": 2}]}) == freeze({"b": [1, {"c": 2}], "a": 1})
+    assert freeze({"k": 3}) != freeze({"k": 4})
+
+
+def test_concurrent_requests_compute_once():
+    cache = FragmentCache()
+    calls = []
+    release = threading.Event()
+
+    def compute():
+        calls.append(1)
+        release.wait(5)
+        return "fragment"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_compute("key", compute)))
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    while cache.stats["waits"] < 3:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert results == ["fragment"] * 4
+    assert len(calls) == 1
+    assert cache.stats["misses"] == 1
+
+
+def test_waiter_computes_when_first_attempt_fails():
+    cache = FragmentCache()
+    started = threading.Event()
+    release = threading.Event()
+
+    def failing():
+        started.set()
+        release.wait(5)
+        raise RuntimeError("LLM call failed")
+
+    errors = []
+
+    def first():
+        try:
+            cache.get_or_compute("key", failing)
+        except RuntimeError as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=first)
+    thread.start()
+    started.wait(5)
+    waiter_result = []
+    waiter = threading.Thread(target=lambda: waiter_result.append(cache.get_or_compute("key", lambda: "retried")))
+    waiter.start()
+    while cache.stats["waits"] < 1:
+        time.sleep(0.001)
+    release.set()
+    thread.join(5)
+    waiter.join(5)
+
+    assert len(errors) == 1
+    assert waiter_result == ["retried"]
+    assert "key" in cache
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = FragmentCache(max_entries=2)
+    cache.get_or_compute("a", lambda: 1)
+    cache.get_or_compute("b", lambda: 2)
+    cache.get_or_compute("a", lambda: pytest.fail("a should be cached"))
+    cache.get_or_compute("c", lambda: 3)
+
+    assert "a" in cache
+    assert "b" not in cache
+    assert "c" in cache
+    assert cache.stats == {"hits": 1, "misses": 3, "waits": 0}
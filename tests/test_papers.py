@@ -0,0 +1,97 @@
+import asyncio
+import os
+import time
+
+import pytest
+
+from backend.papers import PaperFetcher, arxiv_id, prune_cache
+
+fpdf = pytest.importorskip("fpdf")
+pytest.importorskip("pypdf")
+
+
+def _write_pdf(path, text, pages=2):
+    pdf = fpdf.FPDF()
+    pdf.set_font("Helvetica", size=11)
+    for page in range(pages):
+        pdf.add_page()
+        pdf.multi_cell(0, 6, f"{text} page {page + 1}.", new_x="LMARGIN", new_y="NEXT")
+    pdf.output(str(path))
+
+
+@pytest.mark.parametrize("entry_id, paper_id", [
+    ("http://arxiv.org/abs/2401.01234v2", "2401.01234v2"),
+    ("https://arxiv.org/pdf/2401.01234v1.pdf", "2401.01234v1"),
+    ("http://arxiv.org/abs/math/0501001v1", "math/0501001v1"),
+    ("https://example.com/paper", None),
+])
+def test_arxiv_id(entry_id, paper_id):
+    assert arxiv_id(entry_id) == paper_id
+
+
+@pytest.fixture
+def fetcher(tmp_path):
+    pdf_dir = tmp_path / "pdfs"
+    pdf_dir.mkdir()
+    _write_pdf(pdf_dir / "2401.01234.pdf", "Qubits hold superpositions of basis states")
+    (pdf_dir / "2401.09999v1.pdf").write_bytes(b"not a pdf")
+    fetcher = PaperFetcher(pdf_dir=str(pdf_dir), cache_dir=str(tmp_path / "cache"), workers=1)
+    yield fetcher
+    fetcher.shutdown()
+
+
+def test_full_text_replaces_abstract(fetcher):
+    docs = [{"source": "http://arxiv.org/abs/2401.01234v1", "text": "Short abstract", "type": "arxiv"}]
+    [doc] = asyncio.run(fetcher.enrich(docs))
+    assert "Qubits hold superpositions of basis states page 1." in doc["text"]
+    assert "page 2" in doc["text"]
+    assert doc["abstract"] == "Short abstract"
+    assert doc["type"] == "arxiv"
+
+
+def test_unreadable_or_missing_papers_keep_abstract(fetcher):
+    docs = [
+        {"source": "http://arxiv.org/abs/2401.09999v1", "text": "Corrupt", "type": "arxiv"},
+        {"source": "http://arxiv.org/abs/2401.05555v1", "text": "Missing", "type": "arxiv"},
+    ]
+    assert asyncio.run(fetcher.enrich(docs)) == docs
+    assert fetcher.stats["errors"] == 1
+    assert fetcher.stats["missing"] == 1
+
+
+def test_extracted_text_is_cached_on_disk(fetcher):
+    entry_id = "http://arxiv.org/abs/2401.01234v1"
+    first = asyncio.run(fetcher.fetch(entry_id))
+    os.remove(os.path.join(fetcher.pdf_dir, "2401.01234.pdf"))
+    assert asyncio.run(fetcher.fetch(entry_id)) == first
+    assert fetcher.stats == {"extracted": 1, "cached": 1, "missing": 0, "errors": 0}
+
+
+def test_extraction_processes_are_not_forked(fetcher):
+    assert fetcher.pool()._mp_context.get_start_method() in ("forkserver", "spawn")
+
+
+def test_cache_evicts_least_recently_used_texts(tmp_path):
+    fetcher = PaperFetcher(pdf_dir=str(tmp_path), cache_dir=str(tmp_path / "cache"), workers=1,
+                           cache_max_files=2)
+    now = time.time()
+    for i, paper_id in enumerate(["2401.00001v1", "2401.00002v1"]):
+        fetcher._write_cached(paper_id, f"text {i}")
+        os.utime(fetcher._cache_path(paper_id), (now - 100 + i, now - 100 + i))
+    # Reading the older text marks it as recently used
+    assert fetcher._read_cached("2401.00001v1") == "text 0"
+    fetcher._write_cached("2401.00003v1", "text 2")
+
+    assert sorted(os.listdir(tmp_path / "cache")) == ["2401.00001v1.txt", "2401.00003v1.txt"]
+    assert fetcher._read_cached("2401.00002v1") is None
+
+
+def test_prune_cache_drops_expired_texts(tmp_path):
+    now = time.time()
+    for name, age in [("fresh.txt", 10), ("old.txt", 40 * 24 * 3600), ("writing.123.tmp", 40 * 24 * 3600)]:
+        path = tmp_path / name
+        path.write_text("text")
+        os.utime(path, (now - age, now - age))
+
+    assert prune_cache(str(tmp_path), max_files=10, max_age=30 * 24 * 3600) == 1
+    assert sorted(os.listdir(tmp_path)) == ["fresh.txt", "writing.123.tmp"]
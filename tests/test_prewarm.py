@@ -0,0 +1,70 @@
+import asyncio
+
+from backend.jobs import JobManager
+from backend.prewarm import PreWarmer, ResearchCache
+from backend.ratelimit import BACKGROUND
+
+
+def make_prewarmer(active_jobs=None):
+    warmed = []
+
+    async def research(topic, objectives):
+        warmed.append(topic)
+        return {"documents": []}
+
+    prewarmer = PreWarmer(research, ResearchCache(ttl=3600), ["Quantum Computing"], enabled=True,
+                          interval=0.01, cpu_fraction=1.0, active_jobs=active_jobs)
+    return prewarmer, warmed
+
+
+def test_prewarmer_waits_for_interactive_jobs():
+    async def scenario():
+        jobs = JobManager(workers=1)
+        prewarmer, warmed = make_prewarmer(active_jobs=lambda: jobs.active)
+        release = asyncio.Event()
+
+        async def work(job):
+            await release.wait()
+
+        job = jobs.submit("research", work)
+        prewarmer.start()
+        await asyncio.sleep(0.1)
+        busy = (list(warmed), jobs.active, prewarmer.stats["skipped_busy"])
+
+        release.set()
+        await asyncio.sleep(0.1)
+        await prewarmer.stop()
+        await jobs.stop()
+        return busy, warmed, job
+
+    (warmed_while_busy, active, skipped), warmed, job = asyncio.run(scenario())
+    assert warmed_while_busy == []
+    assert active == 1
+    assert skipped > 0
+    assert job.status == "succeeded"
+    assert warmed == ["Quantum Computing"]
+
+
+def test_background_jobs_are_not_active():
+    async def scenario():
+        jobs = JobManager(workers=1)
+        release = asyncio.Event()
+
+        async def work(job):
+            await release.wait()
+
+        jobs.submit("batch", work, priority=BACKGROUND)
+        await asyncio.sleep(0.01)
+        active = jobs.active
+        release.set()
+        await jobs.stop()
+        return active
+
+    assert asyncio.run(scenario()) == 0
+
+
+def test_live_requests_keep_prewarmer_busy():
+    prewarmer, _ = make_prewarmer()
+    assert not prewarmer.busy()
+    prewarmer.live_requests += 1
+    assert prewarmer.busy()
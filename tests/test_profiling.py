@@ -0,0 +1,171 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from backend import profiling
+from backend.jobs import SUCCEEDED, JobManager
+from backend.profiling import (
+    ProfilingMiddleware, RequestProfile, fold_stack, list_profiles, profiled, profile_context, prune_profiles
+)
+
+
+@profiled
+def busy_work(seconds: float) -> str:
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        sum(range(1000))
+    return "done"
+
+
+def make_client(profile_dir, sample_rate=0.0) -> TestClient:
+    app = FastAPI()
+    app.add_middleware(ProfilingMiddleware, sample_rate=sample_rate, profile_dir=str(profile_dir))
+
+    @app.post("/work")
+    async def work(payload: dict):
+        return {"session_id": payload.get("session_id"), "result": await asyncio.to_thread(busy_work, 0.05)}
+
+    @app.post("/research")
+    async def research():
+        return {"session_id": "session_new", "documents": []}
+
+    return TestClient(app)
+
+
+@pytest.mark.parametrize("value, wanted", [(b"1", True), (b"true", True), (b"YES", True), (b"0", False), (b"no", False)])
+def test_profile_header(value, wanted):
+    middleware = ProfilingMiddleware(None, sample_rate=1.0)
+    # The header wins over the sample rate either way
+    assert middleware._wanted([(b"x-profile", value)]) is wanted
+
+
+def test_sample_rate(monkeypatch):
+    assert not ProfilingMiddleware(None, sample_rate=0.0)._wanted([])
+    assert ProfilingMiddleware(None, sample_rate=1.0)._wanted([])
+    monkeypatch.setattr(profiling.random, "random", lambda: 0.3)
+    assert ProfilingMiddleware(None, sample_rate=0.5)._wanted([])
+    assert not ProfilingMiddleware(None, sample_rate=0.2)._wanted([])
+
+
+def test_unprofiled_request_saves_nothing(tmp_path):
+    with make_client(tmp_path) as client:
+        response = client.post("/work", json={"session_id": "session_a"})
+    assert response.status_code == 200
+    assert "x-profile-id" not in response.headers
+    assert list_profiles(profile_dir=str(tmp_path)) == []
+
+
+def test_profiled_request_samples_worker_threads(tmp_path):
+    with make_client(tmp_path) as client:
+        response = client.post("/work", json={"session_id": "session_a"},
+                               headers={"X-Profile": "1", "X-Request-ID": "slow-1"})
+    assert response.json()["result"] == "done"
+    assert response.headers["x-profile-id"] == "slow-1"
+
+    [saved] = list_profiles(profile_dir=str(tmp_path))
+    assert (saved["session_id"], saved["request_id"]) == ("session_a", "slow-1")
+    with open(os.path.join(tmp_path, "session_a", "slow-1.folded")) as f:
+        lines = f.read().splitlines()
+    assert any(line.startswith("worker;") and "busy_work (tests/test_profiling.py:" in line for line in lines)
+
+
+def test_session_is_read_from_the_response(tmp_path):
+    with make_client(tmp_path) as client:
+        client.post("/research", headers={"X-Profile": "1", "X-Request-ID": "r1"})
+    assert [(p["session_id"], p["request_id"]) for p in list_profiles(profile_dir=str(tmp_path))] == [
+        ("session_new", "r1")
+    ]
+
+
+def test_folded_stacks_list_frames_root_first():
+    def inner():
+        return sys._getframe()
+
+    def outer():
+        return inner()
+
+    stack = fold_stack(outer(), "worker")
+    frames = stack.split(";")
+    assert frames[0] == "worker"
+    assert frames[-2].startswith("outer (tests/test_profiling.py:")
+    assert frames[-1].startswith("inner (tests/test_profiling.py:")
+
+    profile = RequestProfile("r1", "POST", "/work")
+    profile.samples.update({"worker;a;b": 3, "event-loop;c": 5})
+    assert profile.folded() == "event-loop;c 5\nworker;a;b 3\n"
+
+
+def test_only_threads_inside_profiled_calls_are_sampled():
+    profile = RequestProfile("r1", "POST", "/work", interval=0.001)
+    other = threading.Thread(target=busy_work.__wrapped__, args=(0.2,))
+
+    def traced():
+        with profile_context(profile):
+            busy_work(0.2)
+
+    thread = threading.Thread(target=traced)
+    profile.start()
+    other.start()
+    thread.start()
+    thread.join()
+    other.join()
+    profile.stop()
+
+    workers = [stack for stack in profile.samples if stack.startswith("worker;")]
+    assert workers
+    assert all("traced (tests/test_profiling.py:" in stack for stack in workers)
+
+
+def test_job_submitted_by_profiled_request_gets_its_own_profile(tmp_path):
+    async def scenario():
+        jobs = JobManager(workers=1)
+        profile = RequestProfile("submit-1", "POST", "/jobs/work", profile_dir=str(tmp_path))
+
+        async def run(job):
+            await asyncio.to_thread(busy_work, 0.1)
+            return {"session_id": "session_job"}
+
+        with profile_context(profile):
+            job = jobs.submit("research", run)
+        while job.status != SUCCEEDED:
+            await asyncio.sleep(0.01)
+        await jobs.stop()
+        return job
+
+    job = asyncio.run(scenario())
+    [saved] = list_profiles(profile_dir=str(tmp_path))
+    assert (saved["session_id"], saved["request_id"]) == ("session_job", job.id)
+    with open(os.path.join(tmp_path, "session_job", f"{job.id}.folded")) as f:
+        assert "busy_work" in f.read()
+
+
+def test_jobs_from_unprofiled_requests_are_not_profiled(tmp_path):
+    async def scenario():
+        jobs = JobManager(workers=1)
+        job = jobs.submit("research", lambda job: asyncio.sleep(0, result={"session_id": "s"}))
+        while job.status != SUCCEEDED:
+            await asyncio.sleep(0.01)
+        await jobs.stop()
+        return job
+
+    assert asyncio.run(scenario()).profile is None
+
+
+def test_prune_profiles_by_count_and_age(tmp_path):
+    now = time.time()
+    for i, (session, age) in enumerate([("s1", 10), ("s1", 20), ("s2", 30), ("s2", 40), ("s3", 10 * 24 * 3600)]):
+        path = tmp_path / session / f"r{i}.folded"
+        path.parent.mkdir(exist_ok=True)
+        path.write_text("worker;a 1\n")
+        os.utime(path, (now - age, now - age))
+
+    assert prune_profiles(str(tmp_path), max_files=3, max_age=7 * 24 * 3600) == 2
+    assert sorted(p["request_id"] for p in list_profiles(profile_dir=str(tmp_path))) == ["r0", "r1", "r2"]
+    # Session directories left empty are removed
+    assert sorted(os.listdir(tmp_path)) == ["s1", "s2"]
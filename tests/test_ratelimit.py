@@ -0,0 +1,131 @@
+import threading
+
+import pytest
+
+from backend import ratelimit
+from backend.ratelimit import BACKGROUND, INTERACTIVE, LLMGovernor, TokenBucket
+
+
+class ResourceExhausted(Exception):
+    """Named like the Gemini client's 429 error."""
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(ratelimit.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_bucket_refills_at_per_minute_rate(clock):
+    bucket = TokenBucket(60)
+    bucket.consume(60)
+    assert bucket.wait_time(1) == pytest.approx(1.0)
+
+    clock[0] += 30
+    assert bucket.wait_time(30) == 0.0
+    assert bucket.wait_time(31) == pytest.approx(1.0)
+
+
+def test_bucket_never_exceeds_capacity(clock):
+    bucket = TokenBucket(60)
+    clock[0] += 600
+    bucket.adjust(100)
+    assert bucket.tokens == 60
+    # Requests larger than the bucket wait for a full bucket, not forever
+    assert bucket.wait_time(1000) == 0.0
+
+
+def test_disabled_bucket_never_waits():
+    bucket = TokenBucket(0)
+    bucket.consume(10)
+    assert bucket.wait_time(10) == 0.0
+
+
+def test_rate_limit_errors_are_retried_and_halve_concurrency():
+    governor = LLMGovernor(requests_per_minute=0, max_concurrency=8, max_backoff=0.01)
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) <= 2:
+            raise ResourceExhausted("429 quota exceeded")
+        return "ok"
+
+    assert governor.call(flaky, tokens=10) == "ok"
+    stats = governor.stats()
+    assert len(attempts) == 3
+    assert stats["retries"] == 2
+    assert stats["rate_limited"] == 2
+    assert stats["failures"] == 2
+    assert stats["calls"] == 1
+    # 8 -> 4 -> 2, then one additive increase
+    assert stats["concurrency_limit"] == pytest.approx(2.5)
+    assert stats["in_flight"] == 0
+
+
+def test_rate_limit_drains_request_bucket(clock):
+    governor = LLMGovernor(requests_per_minute=60, max_attempts=1)
+
+    def limited():
+        raise ResourceExhausted("429")
+
+    with pytest.raises(ResourceExhausted):
+        governor.call(limited, tokens=1)
+    assert governor.requests.wait_time(1) == pytest.approx(1.0)
+
+
+def test_non_retryable_errors_fail_immediately():
+    governor = LLMGovernor(requests_per_minute=0, max_backoff=0.01)
+    attempts = []
+
+    def broken():
+        attempts.append(1)
+        raise ValueError("bad prompt")
+
+    with pytest.raises(ValueError):
+        governor.call(broken, tokens=1)
+    assert len(attempts) == 1
+    assert governor.stats()["concurrency_limit"] == 8
+
+
+def test_slow_calls_shrink_concurrency():
+    governor = LLMGovernor(requests_per_minute=0, max_concurrency=4, target_latency=1.0)
+    governor.acquire(1)
+    governor.release(latency=5.0)
+    assert governor.limit == pytest.approx(3.6)
+
+
+def test_interactive_calls_go_before_background():
+    governor = LLMGovernor(requests_per_minute=0, max_concurrency=1, min_concurrency=1)
+    governor.acquire(1)  # occupy the only slot
+    order = []
+
+    def waiter(priority):
+        governor.acquire(1, priority)
+        order.append(priority)
+        governor.release(0.0)
+
+    background = threading.Thread(target=waiter, args=(BACKGROUND,))
+    background.start()
+    while governor.stats()["waiting"][BACKGROUND] == 0:
+        pass
+    interactive = threading.Thread(target=waiter, args=(INTERACTIVE,))
+    interactive.start()
+    while governor.stats()["waiting"][INTERACTIVE] == 0:
+        pass
+    governor.release(0.0)
+    background.join(5)
+    interactive.join(5)
+    assert order == [INTERACTIVE, BACKGROUND]
+
+
+def test_record_counts_under_lock():
+    governor = LLMGovernor()
+    threads = [threading.Thread(target=lambda: [governor.record("calls") for _ in range(1000)])
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert governor.stats()["calls"] == 8000
@@ -0,0 +1,43 @@
+import pytest
+from pydantic import ValidationError
+
+from backend.report import parse_plan
+
+
+def test_parses_json_wrapped_in_prose_and_fences():
+    plan = parse_plan(
+        'Here is the plan:\n```json\n{"objectives": [" Learn qubits ", ""], '
+        '"sections": ["Qubits", "Gates"], "language": "`Python`."}\n```'
+    )
+    assert plan.objectives == ["Learn qubits"]
+    assert plan.sections == ["Qubits", "Gates"]
+    assert plan.language == "Python"
+
+
+def test_long_lists_are_truncated():
+    plan = parse_plan('{"objectives": ["o%d"], "sections": %s, "language": "Go"}'
+                      % (0, '["s1", "s2", "s3", "s4", "s5", "s6", "s7", "s8"]'))
+    assert len(plan.sections) == 6
+
+
+@pytest.mark.parametrize("text", [
+    "I cannot help with that.",
+    "} backwards {",
+    '{"objectives": ["a"], "sections": ["b"]',
+])
+def test_missing_or_truncated_json_is_rejected(text):
+    with pytest.raises(ValueError):
+        parse_plan(text)
+
+
+@pytest.mark.parametrize("text", [
+    '{"objectives": [], "sections": ["b"], "language": "Python"}',
+    '{"objectives": ["a"], "sections": ["  "], "language": "Python"}',
+    '{"objectives": ["a"], "sections": ["b"]}',
+    '{"objectives": ["a"], "sections": ["b"], "language": "It depends on your goals here"}',
+    '{"objectives": "a", "sections": ["b"], "language": "Python"}',
+])
+def test_invalid_plans_are_rejected(text):
+    # ValidationError is a ValueError, which is what the fallback in _plan_report catches
+    with pytest.raises(ValidationError):
+        parse_plan(text)
@@ -0,0 +1,42 @@
+from backend import research
+from backend.research import expand_queries, unique_documents
+
+
+def test_objectives_become_topic_queries():
+    assert expand_queries("Machine Learning", ["Understand basic concepts", "Learn about neural networks."]) == [
+        "Machine Learning",
+        "Machine Learning basic concepts",
+        "Machine Learning neural networks",
+    ]
+
+
+def test_objectives_naming_the_topic_are_used_as_written():
+    assert expand_queries("Rust", ["Learn Rust ownership"]) == ["Rust", "Rust ownership"]
+
+
+def test_duplicate_and_empty_objectives_are_skipped():
+    queries = expand_queries(" Rust ", ["Understand", "to learn", "Learn ownership", "ownership", "RUST"])
+    assert queries == ["Rust", "Rust ownership"]
+
+
+def test_objective_queries_are_capped(monkeypatch):
+    monkeypatch.setattr(research, "MAX_OBJECTIVE_QUERIES", 2)
+    queries = expand_queries("Go", ["channels", "goroutines", "generics", "modules"])
+    assert queries == ["Go", "Go channels", "Go goroutines"]
+
+
+def test_no_objectives_searches_only_the_topic():
+    assert expand_queries("Go", []) == ["Go"]
+
+
+def test_unique_documents_drops_repeated_urls_and_text():
+    seen_urls, seen_hashes = set(), set()
+    first = unique_documents([
+        {"source": "https://a", "text": "Qubits hold superpositions."},
+        {"source": "https://a", "text": "Another snippet"},
+        {"source": "https://b", "text": "qubits  hold superpositions."},
+    ], seen_urls, seen_hashes)
+    assert [doc["source"] for doc in first] == ["https://a"]
+
+    second = unique_documents([{"source": "https://c", "text": "New text"}], seen_urls, seen_hashes)
+    assert [doc["source"] for doc in second] == ["https://c"]
@@ -0,0 +1,63 @@
+import pytest
+
+from backend.routing import HEAVY, LIGHT, TRIVIAL, ModelRouter, guess_language
+
+
+@pytest.mark.parametrize("topic, language", [
+    ("Machine Learning", "Python"),
+    ("React.js hooks", "JavaScript"),
+    ("Angular app development", "TypeScript"),
+    ("Rust programming language", "Rust"),
+    ("C++ templates", "C++"),
+    ("iOS app development", "Swift"),
+    ("Unity game development", "C#"),
+    ("Rust for embedded systems", "Rust"),
+    ("Trusting relationships", None),
+    ("Quantum Computing", None),
+])
+def test_guess_language(topic, language):
+    assert guess_language(topic) == language
+
+
+@pytest.mark.parametrize("topic", [
+    "Rust prevention on steel",
+    "Java island history",
+    "Unity in diversity",
+    "Giant pandas conservation",
+    "Angular momentum",
+    "Taylor Swift discography",
+    "Ancient Python mythology",
+    "Databases",
+])
+def test_non_programming_topics_have_no_language(topic):
+    # Left to the light model, which can tell whether the topic needs code at all
+    assert guess_language(topic) is None
+
+
+def test_trivial_and_light_tasks_use_light_model():
+    router = ModelRouter({LIGHT: "light", HEAVY: "heavy"})
+    assert router.route(TRIVIAL) == LIGHT
+    assert router.route(LIGHT) == LIGHT
+    assert router.route(HEAVY) == HEAVY
+    with pytest.raises(ValueError):
+        router.route("medium")
+
+
+def test_local_answers_are_recorded_and_misses_are_not():
+    router = ModelRouter({LIGHT: "light", HEAVY: "heavy"})
+    assert router.local("language", lambda: "Python") == "Python"
+    assert router.local("language", lambda: None) is None
+    stats = router.stats()["tasks"]["language"]
+    assert stats["calls"] == 1
+    assert stats["routes"] == {"heuristic": 1}
+
+
+def test_stats_report_errors_and_percentiles():
+    router = ModelRouter({LIGHT: "light", HEAVY: "heavy"})
+    for seconds in range(1, 21):
+        router.record("section", HEAVY, HEAVY, float(seconds), error=seconds == 20)
+    stats = router.stats()["tasks"]["section"]
+    assert stats["calls"] == 20
+    assert stats["errors"] == 1
+    assert stats["mean_seconds"] == 10.5
+    assert stats["p95_seconds"] == 20.0
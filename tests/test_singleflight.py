@@ -0,0 +1,100 @@
+import asyncio
+
+import pytest
+
+from backend.singleflight import SingleFlight
+
+
+class Cancelled(Exception):
+    pass
+
+
+def test_concurrent_calls_share_one_run():
+    async def scenario():
+        flights = SingleFlight()
+        runs = []
+
+        async def work():
+            runs.append(1)
+            await asyncio.sleep(0.01)
+            return "result"
+
+        results = await asyncio.gather(*(flights.do("key", work) for _ in range(5)))
+        return flights, runs, results
+
+    flights, runs, results = asyncio.run(scenario())
+    assert results == ["result"] * 5
+    assert len(runs) == 1
+    assert flights.stats == {"leaders": 1, "followers": 4}
+    assert flights.in_flight() == 0
+
+
+def test_nothing_is_cached_after_completion():
+    async def scenario():
+        flights = SingleFlight()
+        runs = []
+
+        async def work():
+            runs.append(1)
+            return len(runs)
+
+        return await flights.do("key", work), await flights.do("key", work)
+
+    assert asyncio.run(scenario()) == (1, 2)
+
+
+def test_followers_retry_when_leader_is_cancelled():
+    async def scenario():
+        flights = SingleFlight(retry_on=(Cancelled,))
+        runs = []
+
+        async def work():
+            runs.append(1)
+            await asyncio.sleep(0.01)
+            if len(runs) == 1:
+                raise Cancelled("leader's job was cancelled")
+            return "retried"
+
+        leader = asyncio.ensure_future(flights.do("key", work))
+        await asyncio.sleep(0)
+        followers = [asyncio.ensure_future(flights.do("key", work)) for _ in range(3)]
+        with pytest.raises(Cancelled):
+            await leader
+        return await asyncio.gather(*followers), runs, flights.stats
+
+    results, runs, stats = asyncio.run(scenario())
+    assert results == ["retried"] * 3
+    # One follower becomes the new leader; the others join it
+    assert len(runs) == 2
+    assert stats["leaders"] == 2
+
+
+def test_other_errors_reach_every_caller():
+    async def scenario():
+        flights = SingleFlight(retry_on=(Cancelled,))
+
+        async def work():
+            await asyncio.sleep(0.01)
+            raise ValueError("failed")
+
+        return await asyncio.gather(*(flights.do("key", work) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(r, ValueError) for r in results)
+
+
+def test_cancelled_caller_does_not_cancel_shared_work():
+    async def scenario():
+        flights = SingleFlight()
+
+        async def work():
+            await asyncio.sleep(0.02)
+            return "done"
+
+        first = asyncio.ensure_future(flights.do("key", work))
+        second = asyncio.ensure_future(flights.do("key", work))
+        await asyncio.sleep(0.005)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(scenario()) == "done"
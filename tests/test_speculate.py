@@ -0,0 +1,76 @@
+import asyncio
+
+from backend.speculate import ReportPrefetcher, create_prefetcher
+
+
+def _key(preferences):
+    return (preferences.get("topic"), preferences.get("familiarity"))
+
+
+def test_prefetch_is_on_unless_disabled(monkeypatch):
+    monkeypatch.delenv("REPORT_PREFETCH", raising=False)
+    assert create_prefetcher(lambda *args: None, _key).enabled
+    monkeypatch.setenv("REPORT_PREFETCH", "0")
+    assert not create_prefetcher(lambda *args: None, _key).enabled
+
+
+def test_changed_preferences_replace_running_prefetch():
+    async def scenario():
+        seen = []
+
+        async def prefetch(session_id, preferences, progress):
+            seen.append(preferences["familiarity"])
+            for _ in range(100):
+                progress(0.5)
+                await asyncio.sleep(0.001)
+
+        prefetcher = ReportPrefetcher(prefetch, _key)
+        prefetcher.start("s1", {"topic": "Rust", "familiarity": "Beginner"})
+        prefetcher.start("s1", {"topic": "Rust", "familiarity": "Beginner"})
+        await asyncio.sleep(0.01)
+        prefetcher.start("s1", {"topic": "Rust", "familiarity": "Advanced"})
+        prefetcher.reconcile("s1", {"topic": "Rust", "familiarity": "Advanced"})
+        await prefetcher.running["s1"].task
+        return seen, prefetcher.status()
+
+    seen, status = asyncio.run(scenario())
+    assert seen == ["Beginner", "Advanced"]
+    assert status["started"] == 2
+    assert status["cancelled"] == 1
+    assert status["joined"] == 1
+    assert status["completed"] == 1
+    assert status["running"] == 0
+
+
+def test_incompatible_preferences_cancel_prefetch():
+    async def scenario():
+        async def prefetch(session_id, preferences, progress):
+            while True:
+                progress(0.5)
+                await asyncio.sleep(0.001)
+
+        prefetcher = ReportPrefetcher(prefetch, _key)
+        prefetcher.start("s1", {"topic": "Rust", "familiarity": "Beginner"})
+        task = prefetcher.running["s1"].task
+        await asyncio.sleep(0.005)
+        prefetcher.reconcile("s1", {"topic": "Rust", "familiarity": "Expert"})
+        await task
+        return prefetcher.status()
+
+    status = asyncio.run(scenario())
+    assert status["cancelled"] == 1
+    assert status["running"] == 0
+
+
+def test_default_answers_predict_an_unchanged_form():
+    from backend.qa import analyze_preferences, default_answers
+    from backend.report import prefetch_key
+
+    answers = default_answers("Rust")
+    predicted = {**answers, **analyze_preferences(answers)}
+    # What /generate_report combines when the learner submits the form without changing it
+    submitted = {"topic": "Rust", "familiarity": "None", "format": "Text", "depth": "Overview",
+                 "focus": "", "time": "15 minutes"}
+    analyzed = analyze_preferences(submitted)
+    final = {"topic": "Rust", **analyzed, **submitted, **analyzed}
+    assert prefetch_key(predicted) == prefetch_key(final)
@@ -0,0 +1,51 @@
+from backend.store import MemorySessionStore, SQLiteJobStore, SQLiteSessionStore, create_stores
+
+
+def test_sqlite_session_round_trip(tmp_path):
+    store = SQLiteSessionStore(str(tmp_path / "sessions.db"))
+    store.create("s1", {"topic": "Rust", "documents": [{"source": "a", "text": "b"}]})
+    store.update("s1", preferences={"session_time": 30}, report="# Report")
+
+    assert "s1" in store
+    assert "s2" not in store
+    assert store.get("s1") == {
+        "id": "s1",
+        "topic": "Rust",
+        "documents": [{"source": "a", "text": "b"}],
+        "preferences": {"session_time": 30},
+        "report": "# Report",
+    }
+    assert store.get("s1", "topic", "missing") == {"topic": "Rust"}
+    assert store.get("s2") is None
+
+
+def test_sqlite_sessions_are_shared_between_stores(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    SQLiteSessionStore(path).create("s1", {"topic": "Rust"})
+    other = SQLiteSessionStore(path)
+    other.update("s1", report="# Report")
+    assert SQLiteSessionStore(path).get("s1", "topic", "report") == {"topic": "Rust", "report": "# Report"}
+
+
+def test_create_replaces_existing_session(tmp_path):
+    store = SQLiteSessionStore(str(tmp_path / "sessions.db"))
+    store.create("s1", {"topic": "Rust", "report": "old"})
+    store.create("s1", {"topic": "Go"})
+    assert store.get("s1") == {"id": "s1", "topic": "Go"}
+
+
+def test_sqlite_job_store_round_trip(tmp_path):
+    jobs = SQLiteJobStore(str(tmp_path / "sessions.db"))
+    jobs.save({"job_id": "job_1", "status": "running", "progress": 0.5})
+    assert jobs.load("job_1") == {"job_id": "job_1", "status": "running", "progress": 0.5}
+    assert not jobs.cancel_requested("job_1")
+    jobs.request_cancel("job_1")
+    jobs.save({"job_id": "job_1", "status": "running", "progress": 0.6})
+    assert jobs.cancel_requested("job_1")
+    assert jobs.load("missing") is None
+
+
+def test_memory_store_by_default(monkeypatch):
+    monkeypatch.delenv("SESSION_STORE", raising=False)
+    sessions, _ = create_stores()
+    assert isinstance(sessions, MemorySessionStore)
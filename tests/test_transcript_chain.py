@@ -0,0 +1,141 @@
+import re
+import threading
+from typing import Any, Callable, List, Optional
+
+import pytest
+from langchain_core.language_models.llms import LLM
+from pydantic import Field
+
+from backend import ratelimit
+from backend.ratelimit import BACKGROUND, llm_priority
+from langchain_chains.transcript_chain import TranscriptChain, split_windows
+
+
+class FakeModel(LLM):
+    """Answers prompts with a function and records each call's prompt, thread and LLM priority."""
+
+    respond: Callable[[str], str]
+    calls: List[dict] = Field(default_factory=list)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake"
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> str:
+        self.calls.append({
+            "prompt": prompt,
+            "thread": threading.current_thread().name,
+            "priority": ratelimit._priority.get(),
+        })
+        return self.respond(prompt)
+
+
+def map_summary(prompt: str) -> str:
+    return "S" + re.search(r"part (\d+) of \d+", prompt).group(1)
+
+
+def reduce_summary(prompt: str) -> str:
+    summaries = prompt.split("in order:\n", 1)[1].split("\n\nCombine them", 1)[0]
+    return "(" + " ".join(summaries.split("\n\n")) + ")"
+
+
+def make_chain(respond_map=map_summary, **kwargs) -> TranscriptChain:
+    chain = TranscriptChain(**kwargs)
+    chain.map_llm = FakeModel(respond=respond_map)
+    chain.llm = FakeModel(respond=reduce_summary)
+    return chain
+
+
+def segment(n: int, tokens: int = 10) -> str:
+    # estimate_tokens counts four characters per token
+    return f"{n:<{tokens * 4}}"
+
+
+def test_split_windows_fills_windows_up_to_the_limit():
+    texts = [segment(i) for i in range(5)]
+    assert split_windows(texts, 20) == [" ".join(texts[0:2]), " ".join(texts[2:4]), texts[4]]
+    assert split_windows(texts, 29) == split_windows(texts, 20)
+    assert split_windows(texts, 50) == [" ".join(texts)]
+    assert split_windows([], 20) == []
+
+
+def test_split_windows_keeps_oversized_text_in_its_own_window():
+    long_text = segment(99, tokens=100)
+    texts = [long_text, segment(1), segment(2), long_text, segment(3)]
+    assert split_windows(texts, 25, separator="|") == [
+        long_text,
+        f"{segment(1)}|{segment(2)}",
+        long_text,
+        segment(3),
+    ]
+
+
+def test_short_transcript_is_summarized_in_one_call():
+    chain = make_chain(window_tokens=100)
+    chain.llm.respond = lambda prompt: "Summary"
+    assert chain.summarize([segment(1), segment(2)]) == "Summary"
+    assert len(chain.llm.calls) == 1
+    assert "Below is a transcript from a video" in chain.llm.calls[0]["prompt"]
+    assert chain.map_llm.calls == []
+
+
+def test_map_runs_concurrently_in_the_callers_context():
+    # Every window's call must be in flight at once for the barrier to open
+    barrier = threading.Barrier(4, timeout=5)
+
+    def respond(prompt):
+        barrier.wait()
+        return map_summary(prompt)
+
+    chain = make_chain(respond_map=respond, mode="map_reduce", window_tokens=10, max_concurrency=4)
+    with llm_priority(BACKGROUND):
+        chain.summarize([segment(i) for i in range(4)])
+
+    calls = chain.map_llm.calls + chain.llm.calls
+    assert len(chain.map_llm.calls) == 4
+    assert len({call["thread"] for call in chain.map_llm.calls}) == 4
+    assert threading.current_thread().name not in {call["thread"] for call in calls}
+    assert {call["priority"] for call in calls} == {BACKGROUND}
+    assert sorted(re.search(r"part (\d+) of 4", c["prompt"]).group(1) for c in chain.map_llm.calls) == ["1", "2", "3", "4"]
+
+
+def test_reduce_collapses_level_by_level_in_order():
+    # One window per segment; each summary is one token, so two fit in a reduce prompt
+    chain = make_chain(mode="map_reduce", window_tokens=10, reduce_tokens=2)
+    result = chain.summarize([segment(i) for i in range(8)])
+
+    assert result == "(((S1 S2) (S3 S4)) ((S5 S6) (S7 S8)))"
+    assert len(chain.map_llm.calls) == 8
+    assert len(chain.llm.calls) == 4 + 2 + 1
+
+
+def test_reduce_pairs_summaries_that_each_fill_a_prompt():
+    chain = make_chain(mode="map_reduce", window_tokens=10, reduce_tokens=0)
+    assert chain.summarize([segment(i) for i in range(5)]) == "(((S1 S2) (S3 S4)) ((S5)))"
+
+
+def test_result_order_does_not_depend_on_completion_order():
+    finished = []
+    lock = threading.Lock()
+    release = threading.Event()
+
+    def respond(prompt):
+        part = map_summary(prompt)
+        # Earlier parts wait until the last one has finished
+        if part != "S6":
+            release.wait(5)
+        with lock:
+            finished.append(part)
+        if part == "S6":
+            release.set()
+        return part
+
+    chain = make_chain(respond_map=respond, mode="map_reduce", window_tokens=10, reduce_tokens=100,
+                       max_concurrency=6)
+    assert chain.summarize([segment(i) for i in range(6)]) == "(S1 S2 S3 S4 S5 S6)"
+    assert finished[0] == "S6"
+
+
+def test_unknown_mode_is_rejected():
+    with pytest.raises(ValueError, match="refine"):
+        TranscriptChain(mode="refine")
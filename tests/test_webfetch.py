@@ -0,0 +1,86 @@
+import asyncio
+
+import httpx
+
+from backend import webfetch
+from backend.webfetch import MIN_BLOCK_CHARS, PageCache, PageFetcher, extract_text
+
+
+def test_main_container_wins_over_page_chrome():
+    html = """
+    <html><body>
+      <nav><a href="/">Home</a> <a href="/docs">Docs</a></nav>
+      <div>Subscribe to our newsletter for weekly updates on everything.</div>
+      <article><h1>Qubits</h1><p>A qubit is a two-level quantum system.</p>
+        <script>track()</script><p>It can be in superposition.</p></article>
+      <footer>Copyright</footer>
+    </body></html>
+    """
+    assert extract_text(html) == "Qubits\n\nA qubit is a two-level quantum system.\n\nIt can be in superposition."
+
+
+def test_short_blocks_are_dropped_without_main_container():
+    long_paragraph = "Gradient descent updates weights against the gradient of the loss."
+    assert len(long_paragraph) >= MIN_BLOCK_CHARS
+    html = f"<div>Menu</div><p>{long_paragraph}</p><div>Sign in</div><style>p {{}}</style>"
+    assert extract_text(html) == long_paragraph
+
+
+def test_entities_are_decoded_and_output_capped():
+    text = extract_text("<main><p>Fish &amp; chips &lt;3</p></main>", max_chars=10)
+    assert text == "Fish & chi"
+
+
+def test_malformed_html_keeps_what_was_parsed():
+    assert "Unclosed paragraph" in extract_text("<main><p>Unclosed paragraph <b>bold")
+
+
+def test_page_cache_evicts_least_recently_used():
+    cache = PageCache(max_entries=2)
+    cache.put("a", {"text": "a"})
+    cache.put("b", {"text": "b"})
+    cache.get("a")
+    cache.put("c", {"text": "c"})
+    assert cache.get("b") is None
+    assert cache.get("a") == {"text": "a"}
+
+
+def test_bad_results_keep_their_snippets(monkeypatch):
+    page = "<main><p>" + "A full page about qubits and their superpositions. " * 5 + "</p></main>"
+
+    def respond(request):
+        if request.url.host == "unparsable.example":
+            return httpx.Response(200, headers={"content-type": "text/html"}, content=b"<p>unparsable</p>")
+        if request.url.host == "down.example":
+            raise httpx.ConnectError("connection refused", request=request)
+        return httpx.Response(200, headers={"content-type": "text/html"}, content=page.encode())
+
+    def extract(html, *args, **kwargs):
+        if "unparsable" in html:
+            raise ValueError("parser failed")
+        return extract_text(html, *args, **kwargs)
+
+    monkeypatch.setattr(webfetch, "extract_text", extract)
+
+    async def scenario():
+        fetcher = PageFetcher()
+        fetcher.client()
+        fetcher._client = httpx.AsyncClient(transport=httpx.MockTransport(respond))
+        docs = [
+            {"source": "https://good.example/qubits", "text": "snippet 1"},
+            {"source": "http://[malformed/link", "text": "snippet 2"},
+            {"source": "https://ok.example/\x00", "text": "snippet 3"},
+            {"source": "https://unparsable.example/", "text": "snippet 4"},
+            {"source": "https://down.example/", "text": "snippet 5"},
+        ]
+        try:
+            return await fetcher.enrich(docs), fetcher.stats
+        finally:
+            await fetcher.close()
+
+    docs, stats = asyncio.run(scenario())
+    assert docs[0]["text"].startswith("A full page about qubits")
+    assert docs[0]["snippet"] == "snippet 1"
+    assert [doc["text"] for doc in docs[1:]] == ["snippet 2", "snippet 3", "snippet 4", "snippet 5"]
+    assert stats["fetched"] == 1
+    assert stats["errors"] == 4